@@ -0,0 +1,83 @@
+
+"""
+Benchmark for the column operations of Table (one record array) and
+ColumnTable (one array per column).
+
+  insert  -- insert_ of a Table with a single column in the middle
+  remove  -- remove_n_columns of the column in the middle
+  rearr   -- rearrange with the reversed column order
+  sum     -- get_column + sum for each column
+  region  -- get_region of 1000 rows of all columns
+
+Usage: python bench_columntable.py [nrows] [ncols] [repeat]
+"""
+
+import sys, time
+
+import Sloppy
+Sloppy.init()
+
+from Sloppy.Base.dataset import Table, ColumnTable
+
+import numpy
+
+
+def create_array(nrows, ncols):
+    names = ['c%d' % j for j in range(ncols)]
+    a = numpy.zeros((nrows,), {'names': names, 'formats': ['f8']*ncols})
+    for name in names:
+        a[name] = numpy.random.random(nrows)
+    return a
+
+
+def timeit(label, func, repeat, setup=None):
+    best = None
+    for i in range(repeat):
+        if setup is not None:
+            args = setup()
+        else:
+            args = ()
+        t0 = time.time()
+        func(*args)
+        t = time.time() - t0
+        if best is None or t < best:
+            best = t
+    print "  %-10s %8.2f ms" % (label, best * 1000)
+
+
+def main(nrows=1000000, ncols=10, repeat=5):
+    a = create_array(nrows, ncols)
+    extra = create_array(nrows, 1)
+    middle = ncols / 2
+
+    print "%d rows, %d columns (f8)" % (nrows, ncols)
+    for cls in (Table, ColumnTable):
+        print cls.__name__
+
+        def insert(tbl, other):
+            tbl.insert_(middle, other)
+
+        def remove(tbl):
+            tbl.remove_n_columns(middle)
+
+        def rearrange(tbl):
+            tbl.rearrange(range(ncols)[::-1])
+
+        def column_sum(tbl):
+            for j in range(ncols):
+                tbl.get_column(j).sum()
+
+        def region(tbl):
+            tbl.get_region(nrows / 2, 0, 1000, ncols)
+
+        timeit('insert', insert, repeat, lambda: (cls(a.copy()), cls(extra.copy())))
+        timeit('remove', remove, repeat, lambda: (cls(a.copy()),))
+        timeit('rearr', rearrange, repeat, lambda: (cls(a.copy()),))
+
+        tbl = cls(a.copy())
+        timeit('sum', column_sum, repeat, lambda: (tbl,))
+        timeit('region', region, repeat, lambda: (tbl,))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
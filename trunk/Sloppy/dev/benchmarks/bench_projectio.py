@@ -0,0 +1,85 @@
+
+"""
+Benchmark for writing and reading the project description (project.xml).
+
+Writing:
+  plain  -- toElement + ElementTree.write (the default when saving)
+  pretty -- the same with pretty=True, i.e. with beautify_element
+
+Reading:
+  python -- fromTree on a tree parsed by the bundled ElementTree
+  parser -- fromTree on a tree parsed by projectio.parse, which is
+            cElementTree if it is available
+
+Usage: python bench_projectio.py [ntables] [nplots] [repeat]
+"""
+
+import sys, time
+
+from Sloppy.Base.project import Project
+from Sloppy.Base.dataset import Table
+from Sloppy.Base.objects import Plot, Layer, Line, TextLabel
+from Sloppy.Base import projectio
+from Sloppy.Lib.ElementTree import ElementTree
+
+import numpy
+from cStringIO import StringIO
+
+
+def create_project(ntables, nplots):
+    spj = Project()
+    for n in range(ntables):
+        tbl = Table(numpy.zeros((0,), {'names': ['x','y1','y2','y3'],
+                                       'formats': ['f8']*4}))
+        tbl.key = 'table%d' % n
+        tbl.node_info.metadata['origin'] = 'bench_projectio.py'
+        spj.datasets.append(tbl)
+
+    for n in range(nplots):
+        tbl = spj.datasets[n % ntables]
+        lines = [Line(source=tbl, cx=0, cy=j, label='line %d' % j) for j in range(1,4)]
+        labels = [TextLabel(text='label %d' % j, x=0.1*j, y=0.5) for j in range(3)]
+        layer = Layer(type='line2d', lines=lines, labels=labels, title='layer')
+        spj.plots.append(Plot(key='plot%d' % n, title='plot %d' % n, layers=[layer]))
+
+    return spj
+
+
+def timeit(label, func, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        t = time.time() - t0
+        if best is None or t < best:
+            best = t
+    print "  %-10s %8.2f ms" % (label, best * 1000)
+
+
+def main(ntables=500, nplots=500, repeat=5):
+    spj = create_project(ntables, nplots)
+
+    def write(pretty=False):
+        fd = StringIO()
+        fd.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        element = projectio.toElement(spj, pretty=pretty)
+        ElementTree.ElementTree(element).write(fd, encoding="utf-8")
+        return fd.getvalue()
+
+    xml = write()
+    print "project.xml: %d tables, %d plots, %d bytes" % (ntables, nplots, len(xml))
+
+    print "writing"
+    timeit('plain', write, repeat)
+    timeit('pretty', lambda: write(pretty=True), repeat)
+
+    if projectio.parse is ElementTree.parse:
+        print "reading (cElementTree is not available)"
+    else:
+        print "reading"
+    timeit('python', lambda: projectio.fromTree(Project(), ElementTree.parse(StringIO(xml))), repeat)
+    timeit('parser', lambda: projectio.fromTree(Project(), projectio.parse(StringIO(xml))), repeat)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
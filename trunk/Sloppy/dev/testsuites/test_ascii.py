@@ -0,0 +1,88 @@
+
+import unittest
+
+from Sloppy.Importer import import_ascii
+from Sloppy.Base import error
+
+import numpy
+from StringIO import StringIO
+
+
+def create_data(nrows):
+    return ''.join(['%d %d\n' % (i, i*i) for i in range(nrows)])
+
+
+class TestCaseProgress(unittest.TestCase):
+
+    def test_without_indicator(self):
+        importer = import_ascii.Importer()
+        self.assertEqual(importer.progress_indicator, None)
+        ds = importer.read_dataset_from_stream(StringIO("1 2\n3 4\n"))
+        self.assertEqual(ds.nrows, 2)
+        self.assertEqual(list(ds.get_column(0)), [1,3])
+
+    def test_indicator(self):
+        fractions = []
+        importer = import_ascii.Importer(blocksize=64)
+        importer.progress_indicator = fractions.append
+        ds = importer.read_dataset_from_stream(StringIO(create_data(100)))
+        self.assertEqual(ds.nrows, 100)
+        self.assert_(len(fractions) > 1)
+        self.assertEqual(fractions, sorted(fractions))
+        self.assertEqual(fractions[-1], 1.0)
+
+    def test_cancel(self):
+        importer = import_ascii.Importer(blocksize=64)
+        def indicator(fraction):
+            if fraction > 0.5:
+                importer.cancel()
+        importer.progress_indicator = indicator
+        self.assertRaises(error.UserCancel,
+                          importer.read_dataset_from_stream,
+                          StringIO(create_data(100)))
+
+
+class TestCaseBlocks(unittest.TestCase):
+
+    data = """# a comment
+1 2 3
+2 4 8 # trailing comment
+
+3 - 27
+4 16
+5 x 125
+6 36 216
+"""
+
+    def test_small_blocks(self):
+        # use a tiny block size to make sure rows are spread
+        # over several blocks
+        importer = import_ascii.Importer(blocksize=8)
+        ds = importer.read_dataset_from_stream(StringIO(self.data))
+
+        # '4 16' has too few fields, '5 x 125' cannot be converted
+        self.assertEqual(ds.nrows, 4)
+        self.assertEqual(ds.ncols, 3)
+        self.assertEqual(list(ds.get_column(0)), [1,2,3,6])
+        self.assert_(numpy.isnan(ds.get_column(1)[2]))
+        self.assertEqual(list(ds.get_column(2)), [3,8,27,216])
+        self.assertEqual(int(ds.node_info.metadata['_import_skipped']), 2)
+
+    def test_trailing_garbage(self):
+        # the last field of a block must be checked completely
+        for blocksize in (8, 1024):
+            importer = import_ascii.Importer(blocksize=blocksize)
+            ds = importer.read_dataset_from_stream(StringIO("1 2\n3 4abc\n"))
+            self.assertEqual(list(ds.get_column(1)), [2])
+            self.assertEqual(int(ds.node_info.metadata['_import_skipped']), 1)
+
+    def test_single_block(self):
+        importer = import_ascii.Importer()
+        ds = importer.read_dataset_from_stream(StringIO(self.data))
+        self.assertEqual(list(ds.get_column(0)), [1,2,3,6])
+        self.assertEqual(int(ds.node_info.metadata['_import_skipped']), 2)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+
+import unittest
+
+from Sloppy.Base import backend
+from Sloppy.Base.backend import RedrawScheduler
+
+
+class FakeEventLoop:
+    " Collects idle and timeout callbacks until `iterate` is called. "
+
+    def __init__(self):
+        self.callbacks = []
+        self.delays = []
+
+    def idle_add(self, func):
+        self.callbacks.append(func)
+
+    def timeout_add(self, delay, func):
+        self.delays.append(delay)
+        self.callbacks.append(func)
+
+    def iterate(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            func()
+
+
+class TestCaseRedrawScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = FakeEventLoop()
+        backend.set_event_loop(self.loop.idle_add, self.loop.timeout_add)
+        self.redraws = []
+        self.scheduler = RedrawScheduler(lambda: self.redraws.append(1))
+
+    def tearDown(self):
+        backend.set_event_loop()
+
+    def test_coalesce(self):
+        for i in range(5):
+            self.scheduler.request()
+        self.assertEqual(self.redraws, [])
+        self.assertEqual(len(self.loop.callbacks), 1)
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+        self.assertEqual(self.scheduler.get_counters(), (5, 1))
+
+    def test_block(self):
+        self.scheduler.block()
+        self.scheduler.request()
+        self.scheduler.request()
+        self.loop.iterate()
+        self.assertEqual(self.redraws, [])
+        self.scheduler.unblock()
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+
+    def test_block_while_scheduled(self):
+        # a redraw that is already scheduled waits for the unblock
+        self.scheduler.request()
+        self.scheduler.block(2)
+        self.loop.iterate()
+        self.assertEqual(self.redraws, [])
+        self.scheduler.unblock()
+        self.loop.iterate()
+        self.assertEqual(self.redraws, [])
+        self.scheduler.unblock()
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+
+    def test_flush_and_cancel(self):
+        self.scheduler.request()
+        self.scheduler.flush()
+        self.assertEqual(len(self.redraws), 1)
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+
+        self.scheduler.request()
+        self.scheduler.cancel()
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+
+    def test_delay(self):
+        scheduler = RedrawScheduler(lambda: self.redraws.append(1), delay=50)
+        scheduler.request()
+        scheduler.request()
+        self.assertEqual(self.loop.delays, [50])
+        self.loop.iterate()
+        self.assertEqual(len(self.redraws), 1)
+
+    def test_without_event_loop(self):
+        backend.set_event_loop()
+        self.scheduler.request()
+        self.scheduler.request()
+        self.assertEqual(len(self.redraws), 2)
+        self.assertEqual(backend.run_when_idle(self.redraws.append, 1), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
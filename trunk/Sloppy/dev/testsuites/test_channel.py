@@ -0,0 +1,74 @@
+
+import unittest
+import sys, subprocess
+
+from Sloppy.Gnuplot.channel import CommandChannel
+
+
+# A stand-in for gnuplot: "print 'text'" prints the text, "echo text"
+# prints the text as well and "exit" terminates the process.
+fake_gnuplot = r"""
+import sys
+while True:
+    line = sys.stdin.readline()
+    if len(line) == 0 or line.startswith('exit'):
+        break
+    if line.startswith("print '"):
+        sys.stdout.write(line[7:-2] + '\n')
+    elif line.startswith('echo '):
+        sys.stdout.write(line[5:])
+    sys.stdout.flush()
+"""
+
+
+class TestCaseCommandChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.process = subprocess.Popen([sys.executable, '-c', fake_gnuplot],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        self.notified = []
+        self.channel = CommandChannel(self.process, 'utf-8',
+                                      notify=lambda: self.notified.append(1))
+
+    def tearDown(self):
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.wait()
+        self.channel.thread.join(5)
+
+    def test_batch(self):
+        requests = self.channel.send([(u'echo one', None),
+                                      (u'set xrange [0:1]', None),
+                                      (u'echo two', ['echo data\n'])])
+        self.assert_(self.channel.wait(5))
+        self.assertEqual([r.result for r in requests],
+                         [['one\n'], [], ['two\n', 'data\n']])
+        self.assertEqual([r.id for r in requests], [1, 2, 3])
+
+        # the results are queued in order
+        results = [self.channel.results.get(timeout=5) for r in requests]
+        self.assertEqual(results, requests)
+        self.assertEqual(len(self.notified), 3)
+
+    def test_terminated(self):
+        # requests that gnuplot did not answer are finished with None
+        requests = self.channel.send([(u'echo one', None),
+                                      (u'exit', None),
+                                      (u'echo two', None)])
+        self.assert_(self.channel.wait(5))
+        self.assertEqual([r.result for r in requests], [['one\n'], None, None])
+        self.channel.thread.join(5)
+        self.assertEqual(self.channel.closed, True)
+
+        # requests sent afterwards are finished right away
+        requests = self.channel.send([(u'echo three', None)])
+        self.assert_(requests[0].wait(0))
+        self.assertEqual(requests[0].result, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
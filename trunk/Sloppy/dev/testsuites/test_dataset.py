@@ -0,0 +1,350 @@
+
+import unittest
+import os, tempfile, shutil
+
+from Sloppy.Base.dataset import Table, ColumnTable, MappedTable, RowBuffer, ColumnPyramid, RowChunks
+from Sloppy.Base.dataset import CompressedArray, CompressedUndoInfo, compress_array
+from Sloppy.Lib.Undo import UndoList
+from Sloppy.Importer import import_ascii
+
+import numpy
+from StringIO import StringIO
+
+
+def create_array(nrows, ncols=2):
+    names = ['c%d' % j for j in range(ncols)]
+    a = numpy.zeros((nrows,), {'names': names, 'formats': ['f8']*ncols})
+    for j in range(ncols):
+        a[names[j]] = numpy.arange(nrows) * (j+1)
+    return a
+
+
+class CountingTable(ColumnTable):
+    " ColumnTable that counts how often the record array is assembled. "
+    assembled = 0
+    def get_record_array(self):
+        self.assembled += 1
+        return ColumnTable.get_record_array(self)
+
+
+class TestCaseRowBuffer(unittest.TestCase):
+
+    def test_growth(self):
+        buffer = RowBuffer(numpy.arange(10.0))
+        self.assertEqual(buffer.capacity, RowBuffer.min_capacity)
+        storage = buffer._storage
+        buffer.append(numpy.arange(100.0))
+        self.assert_(buffer._storage is storage)
+        buffer.append(numpy.zeros(2000))
+        self.assertEqual(buffer.nrows, 2110)
+        self.assertEqual(buffer.capacity, 4 * RowBuffer.min_capacity)
+        self.assertEqual(len(buffer.view), 2110)
+        self.assertEqual(list(buffer.view[8:12]), [8,9,0,1])
+
+    def test_trim(self):
+        buffer = RowBuffer(numpy.arange(10.0))
+        a = buffer.trim()
+        self.assertEqual(list(a), range(10))
+        self.assert_(a is not buffer._storage)
+
+        buffer = RowBuffer(numpy.arange(10.0), capacity=5)
+        buffer.append(numpy.arange(RowBuffer.min_capacity - 10.0))
+        self.assert_(buffer.trim() is buffer._storage)
+
+
+class TestCaseAppendRows(unittest.TestCase):
+
+    def check_append(self, tbl):
+        counter = tbl.change_counter
+        a = create_array(100)
+        for i in range(0, 100, 10):
+            tbl.append_rows(a[i:i+10])
+        self.assertEqual(tbl.nrows, 100)
+        self.assert_(tbl.change_counter > counter)
+        tbl.trim()
+        self.assertEqual(tbl.nrows, 100)
+        self.assertEqual(list(tbl.get_column('c1')), list(a['c1']))
+
+    def test_table(self):
+        tbl = Table(create_array(0))
+        self.check_append(tbl)
+        self.assertEqual(len(tbl._array), 100)
+        self.assert_(tbl._rowbuffer is None)
+
+    def test_columntable(self):
+        tbl = ColumnTable(create_array(0))
+        self.check_append(tbl)
+        self.assertEqual(len(tbl.get_column(0)), 100)
+
+    def test_edit_between_appends(self):
+        # rows appended after an edit must not overwrite the edit
+        tbl = Table(create_array(0))
+        tbl.append_rows(create_array(3))
+        tbl.set_value(0, 1, 42)
+        tbl.append_rows(create_array(2))
+        tbl.trim()
+        self.assertEqual(list(tbl.get_column(0)), [0,42,2,0,1])
+
+
+class TestCasePyramid(unittest.TestCase):
+
+    def check_envelope(self, column, nranges=200):
+        pyramid = ColumnPyramid(column)
+        starts = numpy.random.randint(0, len(column), nranges)
+        ends = starts + 1 + numpy.random.randint(0, len(column), nranges)
+        ends = numpy.minimum(ends, len(column))
+        lo, hi = pyramid.get_envelope(starts, ends)
+        for i in range(nranges):
+            values = column[starts[i]:ends[i]]
+            values = values[~numpy.isnan(values)]
+            if len(values) == 0:
+                self.assert_(numpy.isnan(column[lo[i]]))
+                continue
+            self.assert_(starts[i] <= lo[i] < ends[i])
+            self.assert_(starts[i] <= hi[i] < ends[i])
+            self.assertEqual(column[lo[i]], values.min())
+            self.assertEqual(column[hi[i]], values.max())
+
+    def test_envelope(self):
+        self.check_envelope(numpy.random.random(1000))
+
+    def test_envelope_nan(self):
+        column = numpy.random.random(777)
+        column[::3] = numpy.nan
+        column[100:200] = numpy.nan
+        self.check_envelope(column)
+
+    def test_small(self):
+        # too small for any stored level
+        column = numpy.array([3.0, 1.0, 2.0])
+        pyramid = ColumnPyramid(column)
+        self.assertEqual(pyramid.levels, [])
+        self.assertEqual(pyramid.get_range(), (1.0, 3.0))
+        self.check_envelope(column, 10)
+
+    def test_range(self):
+        column = numpy.arange(1000.0)
+        column[500] = -1
+        pyramid = ColumnPyramid(column)
+        self.assertEqual(pyramid.get_range(), (-1.0, 999.0))
+        self.assertEqual(pyramid.get_range(10, 20), (10.0, 19.0))
+        self.assertEqual(pyramid.get_range(20, 20), None)
+        column[:] = numpy.nan
+        self.assertEqual(ColumnPyramid(column).get_range(), None)
+
+    def test_table(self):
+        tbl = Table(create_array(1000))
+        pyramid = tbl.get_pyramid('c1')
+        self.assert_(tbl.get_pyramid(1) is pyramid)
+        self.assertEqual(pyramid.get_range(), (0, 1998))
+        tbl.set_value(1, 10, 5000)
+        pyramid = tbl.get_pyramid(1)
+        self.assertEqual(pyramid.get_range(), (0, 5000))
+
+
+class TestCaseRowChunks(unittest.TestCase):
+
+    def test_edit(self):
+        # compare a series of edits with the same edits on an array
+        a = create_array(100)
+        chunks = RowChunks(a.copy(), chunk_size=8)
+        self.assertEqual(len(chunks.chunks), 13)
+        for row, n in [(0, 3), (50, 20), (120, 1), (37, 40), (200, 5)]:
+            rows = create_array(n)
+            rows['c0'] += 1000
+            chunks.insert(row, rows)
+            a = numpy.concatenate([a[:row], rows, a[row:]])
+            self.assertEqual(len(chunks), len(a))
+        for row, n in [(0, 1), (60, 30), (10, 100), (len(a) - 2, 5)]:
+            chunks.remove(row, n)
+            a = numpy.concatenate([a[:row], a[row+n:]])
+            self.assertEqual(len(chunks), len(a))
+        self.assert_(max([len(chunk) for chunk in chunks.chunks]) <= 16)
+        self.assertEqual(list(chunks.compact()['c0']), list(a['c0']))
+        self.assertEqual(list(chunks.get_rows(5, 10)['c1']), list(a['c1'][5:15]))
+        self.assertEqual(chunks.get_value('c0', -1), a['c0'][-1])
+        self.assertRaises(IndexError, chunks.get_row, len(a))
+
+    def test_empty(self):
+        chunks = RowChunks(create_array(0))
+        self.assertEqual(len(chunks), 0)
+        self.assertEqual(len(chunks.compact()), 0)
+        chunks.insert(0, create_array(3))
+        self.assertEqual(list(chunks.compact()['c1']), [0,2,4])
+
+    def test_table_undo(self):
+        a = create_array(100)
+        tbl = Table(a.copy())
+        tbl.row_chunk_size = 8
+        ul = UndoList()
+        tbl.remove_n_rows(40, 25, undolist=ul)
+        self.assert_(tbl._rowchunks is not None)
+        self.assertEqual(tbl.nrows, 75)
+        self.assertEqual(tbl.get_value('c0', 40), 65)
+        ul.execute()
+        self.assertEqual(tbl.nrows, 100)
+        self.assertEqual(list(tbl.get_column('c1')), list(a['c1']))
+        self.assert_(tbl._rowchunks is None)
+
+
+class TestCaseMappedTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.a = create_array(1000)
+        self.filenames = []
+        for name in self.a.dtype.fields[-1]:
+            filename = os.path.join(self.tmpdir, name)
+            self.a[name].copy().tofile(filename)
+            self.filenames.append(filename)
+        self.tbl = MappedTable(create_array(0))
+        self.tbl.map_files(self.filenames)
+
+    def tearDown(self):
+        del self.tbl
+        shutil.rmtree(self.tmpdir)
+
+    def test_map(self):
+        tbl = self.tbl
+        self.assertEqual(tbl.nrows, 1000)
+        self.assert_(tbl.is_mapped(0) and tbl.is_mapped('c1'))
+        self.assertEqual(list(tbl.get_column('c1')[:3]), [0,2,4])
+        self.assertEqual(tbl.get_value(1, 999), 1998)
+
+    def test_copy_on_write(self):
+        tbl = self.tbl
+        tbl.set_value(0, 5, 42)
+        self.assertEqual(tbl.get_value(0, 5), 42)
+        self.assert_(tbl.is_mapped(0))
+        self.assertEqual(numpy.fromfile(self.filenames[0])[5], 5)
+
+    def test_insert(self):
+        tbl = self.tbl
+        tbl.insert_n_rows(10, 2)
+        self.assertEqual(tbl.nrows, 1002)
+        self.assert_(not tbl.is_mapped(0))
+        self.assertEqual(list(tbl.get_column(1)[9:13]), [18,0,0,20])
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.tbl.map_files, self.filenames[:1])
+
+    def test_empty_file(self):
+        filename = os.path.join(self.tmpdir, 'empty')
+        open(filename, 'wb').close()
+        tbl = MappedTable(create_array(0, 1))
+        tbl.map_files([filename])
+        self.assertEqual(tbl.nrows, 0)
+
+
+class TestCaseUndo(unittest.TestCase):
+
+    def undo(self, ul):
+        redo = UndoList()
+        ul.execute(redo)
+        return redo
+
+    def test_compress_array(self):
+        a = numpy.zeros((100000,))
+        c = compress_array(a)
+        self.assert_(isinstance(c, CompressedArray))
+        self.assert_(c.nbytes < a.nbytes / 10)
+        self.assert_(numpy.all(c.get_array() == a))
+
+        small = numpy.zeros((10,))
+        self.assert_(compress_array(small) is small)
+        noise = numpy.random.random(100000)
+        self.assert_(compress_array(noise) is noise)
+
+    def test_patch_column(self):
+        tbl = Table(create_array(10000))
+        column = tbl.get_column(1).copy()
+        column[5] = -1
+        ul = UndoList()
+        tbl.set_column(1, column, undolist=ul)
+        self.assertEqual(ul[0].func, tbl.patch_column)
+        self.assert_(ul.get_size() < 100)
+
+        redo = self.undo(ul)
+        self.assertEqual(tbl.get_value(1, 5), 10)
+        self.undo(redo)
+        self.assertEqual(tbl.get_value(1, 5), -1)
+
+    def test_set_column(self):
+        tbl = Table(create_array(10000))
+        ul = UndoList()
+        tbl.set_column(0, numpy.zeros((10000,)), undolist=ul)
+        self.assert_(isinstance(ul[0], CompressedUndoInfo))
+        # arange compresses well
+        self.assert_(ul.get_size() < 10000 * 8)
+        self.undo(ul)
+        self.assertEqual(list(tbl.get_column(0)[:3]), [0,1,2])
+
+    def test_transform_column(self):
+        tbl = Table(create_array(1000))
+        ul = UndoList()
+        tbl.transform_column(1, '*', 2.0, undolist=ul)
+        self.assertEqual(ul[0].func, tbl.transform_column)
+        self.assertEqual(ul[0].args, (1, '/', 2.0))
+        self.assertEqual(tbl.get_value(1, 3), 12)
+        self.undo(ul)
+        self.assertEqual(tbl.get_value(1, 3), 6)
+
+        # not exactly reversible: the old values are stored
+        ul = UndoList()
+        tbl.transform_column(1, '+', 0.1, undolist=ul)
+        self.assertNotEqual(ul[0].func, tbl.transform_column)
+        self.undo(ul)
+        self.assertEqual(list(tbl.get_column(1)[:3]), [0,2,4])
+
+    def test_remove_rows(self):
+        tbl = Table(create_array(100000))
+        tbl.row_chunk_size = None
+        ul = UndoList()
+        tbl.remove_n_rows(0, 50000, undolist=ul)
+        self.assert_(isinstance(ul[0].args[1], CompressedArray))
+        self.undo(ul)
+        self.assertEqual(tbl.nrows, 100000)
+        self.assertEqual(tbl.get_value(1, 49999), 99998)
+
+
+class TestCaseHasData(unittest.TestCase):
+
+    def test_table(self):
+        tbl = Table(create_array(10))
+        self.assert_(tbl.has_data())
+        self.assert_(not tbl.is_empty())
+        tbl._array = None
+        self.assert_(not tbl.has_data())
+        self.assert_(tbl.is_empty())
+
+    def test_rowchunks(self):
+        tbl = Table(create_array(100))
+        tbl.row_chunk_size = 8
+        tbl.insert_n_rows(50, 2)
+        self.assert_(tbl._rowchunks is not None)
+        self.assert_(tbl.has_data())
+        self.assert_(not tbl.is_empty())
+        # neither check assembles the rows
+        self.assert_(tbl._rowchunks is not None)
+
+    def test_columntable(self):
+        tbl = CountingTable(columns=[('a', numpy.arange(5.0))])
+        tbl.assembled = 0
+        self.assert_(tbl.has_data())
+        self.assert_(not tbl.is_empty())
+        self.assertEqual(tbl.assembled, 0)
+
+    def test_import(self):
+        # the importer must not assemble the record array per block
+        tbl = CountingTable(columns=[('a', numpy.zeros(0)), ('b', numpy.zeros(0))])
+        tbl.assembled = 0
+        importer = import_ascii.Importer(dataset=tbl, blocksize=8)
+        importer.read_dataset_from_stream(StringIO("1 2\n3 4\n5 6\n7 x\n"))
+        self.assertEqual(tbl.assembled, 0)
+        self.assertEqual(tbl.nrows, 3)
+        self.assertEqual(list(tbl.get_column('b')), [2,4,6])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
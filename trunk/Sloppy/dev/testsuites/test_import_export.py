@@ -0,0 +1,90 @@
+
+import unittest
+import os, tempfile, shutil
+
+from Sloppy.Importer import import_ascii # registers the ASCII template
+from Sloppy.Plugins.Core import import_export
+from Sloppy.Base import globals
+from Sloppy.Lib.Signals import HasSignals
+
+
+class DummyApp(HasSignals):
+    " Minimal application that cancels the import at a given progress. "
+
+    def __init__(self, cancel_at=None):
+        HasSignals.__init__(self)
+        self.sig_register('begin-user-action')
+        self.sig_register('cancel-user-action')
+        self.sig_register('end-user-action')
+        self.cancel_at = cancel_at
+        self.errors = []
+
+    def progress(self, fraction):
+        if self.cancel_at is not None and fraction >= self.cancel_at:
+            self.cancel_at = None
+            self.sig_emit('cancel-user-action')
+
+    def status_msg(self, msg):
+        pass
+
+    def error_msg(self, msg):
+        self.errors.append(msg)
+
+
+class TestCaseImportSerial(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filenames = []
+        for i in range(4):
+            filename = os.path.join(self.tmpdir, 'file%d.dat' % i)
+            fd = open(filename, 'w')
+            try:
+                for j in range(1000):
+                    fd.write('%d %d\n' % (j, i))
+            finally:
+                fd.close()
+            self.filenames.append(filename)
+        self.template = globals.import_templates['ASCII']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_import(self):
+        app = DummyApp()
+        datasets = import_export._import_serial(app, self.filenames, self.template)
+        self.assertEqual(len(datasets), 4)
+        self.assertEqual([ds.key for ds in datasets],
+                         ['file0', 'file1', 'file2', 'file3'])
+        self.assertEqual(app.errors, [])
+        self.assertEqual(len(app.signals['cancel-user-action'].slots), 0)
+
+    def test_cancel(self):
+        # cancel while the second file is read
+        app = DummyApp(cancel_at=0.3)
+        datasets = import_export._import_serial(app, self.filenames, self.template)
+        self.assertEqual(len(datasets), 1)
+        self.assertEqual(app.errors, ["Import aborted by user"])
+        self.assertEqual(len(app.signals['cancel-user-action'].slots), 0)
+
+
+    def test_parallel(self):
+        app = DummyApp()
+        datasets = import_export._import_parallel(app, self.filenames, self.template, 2)
+        self.assertEqual([ds.key for ds in datasets],
+                         ['file0', 'file1', 'file2', 'file3'])
+        self.assertEqual(list(datasets[2].get_column(1)[:3]), [2,2,2])
+        self.assertEqual(app.errors, [])
+        self.assertEqual(len(app.signals['cancel-user-action'].slots), 0)
+
+    def test_parallel_cancel(self):
+        # cancel after the first finished file
+        app = DummyApp(cancel_at=0.25)
+        datasets = import_export._import_parallel(app, self.filenames, self.template, 2)
+        self.assertEqual(len(datasets), 1)
+        self.assertEqual(app.errors, ["Import aborted by user"])
+        self.assertEqual(len(app.signals['cancel-user-action'].slots), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
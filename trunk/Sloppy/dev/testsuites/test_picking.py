@@ -0,0 +1,58 @@
+
+import unittest
+
+from Sloppy.Matplot.picking import PointIndex, nearest_point
+
+import numpy
+
+
+class TestCasePointIndex(unittest.TestCase):
+
+    def check_queries(self, px, py, positions, maxdist=None, cellsize=16):
+        index = PointIndex(px, py, cellsize=cellsize)
+        for (x, y) in positions:
+            i, d2 = index.nearest(x, y, maxdist=maxdist)
+            j, e2 = nearest_point(px, py, x, y)
+            if maxdist is not None and e2 is not None and e2 > maxdist**2:
+                j, e2 = None, None
+            self.assertEqual(d2, e2)
+            if i is not None:
+                # another point at the same distance is fine as well
+                self.assertEqual((px[i]-x)**2 + (py[i]-y)**2, e2)
+
+    def random_positions(self, n, lo, hi):
+        return zip(numpy.random.uniform(lo, hi, n), numpy.random.uniform(lo, hi, n))
+
+    def test_nearest(self):
+        px = numpy.random.uniform(0, 1000, 5000)
+        py = numpy.random.uniform(0, 500, 5000)
+        self.check_queries(px, py, self.random_positions(200, -100, 1100))
+
+    def test_far_away(self):
+        # positions far outside of the grid fall back to comparing
+        # all points
+        px = numpy.random.uniform(0, 100, 100)
+        py = numpy.random.uniform(0, 100, 100)
+        self.check_queries(px, py, [(10000, 10000), (-5000, 50), (50, 3000)])
+
+    def test_maxdist(self):
+        px = numpy.array([0.0, 100.0, 200.0])
+        py = numpy.array([0.0, 0.0, 0.0])
+        index = PointIndex(px, py)
+        self.assertEqual(index.nearest(110, 0, maxdist=20), (1, 100.0))
+        self.assertEqual(index.nearest(150, 0, maxdist=20), (None, None))
+        self.check_queries(px, py, self.random_positions(50, -50, 250), maxdist=30)
+
+    def test_nan(self):
+        px = numpy.array([numpy.nan, 1.0, 5.0, numpy.inf])
+        py = numpy.array([0.0, numpy.nan, 5.0, 0.0])
+        index = PointIndex(px, py)
+        self.assertEqual(index.nearest(0, 0), (2, 50.0))
+
+        px = numpy.array([numpy.nan, numpy.nan])
+        index = PointIndex(px, px)
+        self.assertEqual(index.nearest(0, 0), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+
+import unittest
+import os, tempfile, shutil, zipfile
+
+from Sloppy.Exporter import export_ascii, export_csv # register the exporters
+from Sloppy.Base.project import Project
+from Sloppy.Base.dataset import Table
+from Sloppy.Base import projectio, backend
+from Sloppy.Base.objects import Layer, Line
+from Sloppy.Lib.Undo import UndoInfo
+
+from Sloppy.Lib.ElementTree.ElementTree import parse
+
+import numpy
+from StringIO import StringIO
+
+
+def create_table(nrows, ncols=2):
+    names = ['c%d' % j for j in range(ncols)]
+    a = numpy.zeros((nrows,), {'names': names, 'formats': ['f8']*ncols})
+    for j in range(ncols):
+        a[names[j]] = numpy.arange(nrows) * (j+1)
+    return Table(a)
+
+
+class DummyBackend(backend.Backend):
+    def init(self):
+        pass
+
+
+class TestCaseProjectWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.spj')
+        self.spj = Project()
+        self.spj.add_datasets([create_table(10)])
+
+    def tearDown(self):
+        self.spj.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_signals(self):
+        writer = projectio.ProjectWriter(self.spj, filename=self.filename)
+        result = []
+        writer.sig_connect('finished', lambda sender, writer: result.append(writer))
+        writer.run()
+        self.assertEqual(result, [writer])
+        self.assert_(os.path.exists(self.filename))
+
+    def test_error_signal(self):
+        writer = projectio.ProjectWriter(self.spj, filename=self.filename)
+        writer.filename = os.path.join(self.tmpdir, 'missing', 'test.spj')
+        result = []
+        writer.sig_connect('error', lambda sender, writer, msg: result.append(writer))
+        writer.run()
+        self.assertEqual(result, [writer])
+
+    def test_is_current(self):
+        writer = projectio.ProjectWriter(self.spj, filename=self.filename)
+        self.assert_(writer.is_current())
+        self.spj.journal.append(UndoInfo(lambda: None))
+        self.assert_(not writer.is_current())
+
+
+class TestCaseRawRoundTrip(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.spj')
+        self.spj = Project()
+        tbl = create_table(1000, 3)
+        tbl.key = 'data'
+        self.spj.add_datasets([tbl])
+        self.projects = [self.spj]
+
+    def tearDown(self):
+        for spj in self.projects:
+            spj.close()
+        shutil.rmtree(self.tmpdir)
+
+    def load(self):
+        spj = projectio.load_project(self.filename)
+        self.projects.append(spj)
+        return spj
+
+    def assertSameData(self, tbl, other):
+        self.assertEqual(tbl.names, other.names)
+        self.assertEqual(tbl.nrows, other.nrows)
+        for n in range(tbl.ncols):
+            self.assert_(numpy.all(tbl.get_column(n) == other.get_column(n)))
+
+    def test_members(self):
+        projectio.save_project(self.spj, self.filename)
+        archive = zipfile.ZipFile(self.filename, 'r')
+        try:
+            names = archive.namelist()
+            self.assert_('project.xml' in names)
+            self.assert_('datasets/data.dat/0' in names)
+            self.assertEqual(len(archive.read('datasets/data.dat/2')), 1000 * 8)
+        finally:
+            archive.close()
+
+    def test_round_trip(self):
+        projectio.save_project(self.spj, self.filename)
+        spj = self.load()
+        self.assertEqual([ds.key for ds in spj.datasets], ['data'])
+        self.assertSameData(self.spj.datasets[0], spj.datasets[0])
+
+    def test_copy_unchanged(self):
+        # save twice: the second time the data is copied from
+        # the previous archive without loading it
+        projectio.save_project(self.spj, self.filename)
+        spj = self.load()
+        spj.filename = os.path.join(self.tmpdir, 'copy.spj')
+        projectio.save_project(spj, spj.filename)
+        self.assert_(spj.datasets[0]._import is not None)
+
+        self.filename = spj.filename
+        copy = self.load()
+        self.assertSameData(self.spj.datasets[0], copy.datasets[0])
+
+    def test_summary(self):
+        # shape and range queries are answered from the archive
+        # without loading the data
+        projectio.save_project(self.spj, self.filename)
+        tbl = self.load().datasets[0]
+        self.assertEqual(tbl.nrows, 1000)
+        self.assertEqual(tbl.ncols, 3)
+        self.assertEqual(tbl.get_range(0), (0, 999))
+        self.assertEqual(tbl.get_range('c2'), (0, 2997))
+        self.assert_(tbl._import is not None)
+
+        # data access loads the data, consistent with nrows
+        self.assertEqual(len(tbl.get_column(1)), 1000)
+        self.assert_(tbl._import is None)
+
+    def test_data_limits(self):
+        projectio.save_project(self.spj, self.filename)
+        spj = self.load()
+        tbl = spj.datasets[0]
+        layer = Layer(lines=[Line(source=tbl, cx=0, cy=1),
+                             Line(source=tbl, cx=0, cy=2, visible=False)])
+        limits = DummyBackend().get_data_limits(layer)
+        self.assertEqual(limits, {'x': (0, 999), 'y': (0, 1998)})
+        self.assert_(tbl._import is not None)
+
+    def test_data_limits_limited_rows(self):
+        # the range of a line with limited rows is not known from
+        # the summary, so the limits are left to the backend
+        projectio.save_project(self.spj, self.filename)
+        tbl = self.load().datasets[0]
+        layer = Layer(lines=[Line(source=tbl, cx=0, cy=1),
+                             Line(source=tbl, cx=0, cy=2, row_first=10, row_last=20)])
+        limits = DummyBackend().get_data_limits(layer)
+        self.assertEqual(limits, {'x': None, 'y': None})
+
+
+class TestCaseFileFormat(unittest.TestCase):
+
+    xml = """<?xml version="1.0" encoding="utf-8"?>
+<Project version="0.5">
+  <Datasets>
+    <Table key="data" fileformat="CSV">
+      <Column name="x" format="f4"><Info key="label">time</Info></Column>
+      <Column name="y" format="f4"/>
+    </Table>
+  </Datasets>
+  <Plots/>
+</Project>
+"""
+
+    def test_version_0_5(self):
+        spj = projectio.fromTree(Project(), parse(StringIO(self.xml)))
+        try:
+            tbl = spj.datasets[0]
+            self.assertEqual(tbl.key, 'data')
+            self.assertEqual(tbl.names, ['x', 'y'])
+            self.assertEqual(tbl.get_info('x').label, 'time')
+        finally:
+            spj.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+
+import unittest
+import os, tempfile, shutil
+
+from Sloppy.Lib.Undo import UndoInfo, UndoList, Journal, estimate_size
+from Sloppy.Base.project import Project
+from Sloppy.Base.dataset import Table, CompressedArray, compress_array
+
+import numpy
+
+
+class Shared:
+    " Large object that must not be pickled, like a removed Dataset. "
+    pickled = 0
+    def get_undo_size(self):
+        return 1024 * 1024
+    def __getstate__(self):
+        Shared.pickled += 1
+        raise TypeError("cannot pickle Shared")
+
+
+def noop(*args, **kwargs):
+    kwargs['undolist'].append(UndoInfo(noop))
+
+
+class TestCaseSpill(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        Shared.pickled = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_array(self):
+        a = numpy.arange(100000.0)
+        info = UndoInfo(noop, a, 'small')
+        self.assertEqual(info.spill(self.tmpdir), a.nbytes)
+        self.assertEqual(info.get_size(), len('small'))
+        self.assertEqual(info.get_spilled_size(), a.nbytes)
+        args = info.get_args()
+        self.assert_(numpy.all(args[0] == a))
+        self.assertEqual(args[1], 'small')
+
+    def test_shared(self):
+        # objects that cannot be spilled are not even tried
+        info = UndoInfo(noop, Shared())
+        self.assertEqual(info.spill(self.tmpdir), 0)
+        self.assertEqual(Shared.pickled, 0)
+
+    def test_failure(self):
+        # a failed argument is remembered and not pickled again
+        a = numpy.empty((10000,), dtype=object)
+        a[0] = Shared()
+        info = UndoInfo(noop, a)
+        self.assertEqual(info.spill(self.tmpdir), 0)
+        self.assertEqual(info.unspillable, (0,))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertEqual(info.spill(self.tmpdir), 0)
+        self.assertEqual(Shared.pickled, 1)
+
+
+class TestCaseSize(unittest.TestCase):
+
+    def test_estimate_size(self):
+        a = numpy.zeros((100,))
+        self.assertEqual(estimate_size(a), 800)
+        self.assertEqual(estimate_size('abc'), 3)
+        self.assertEqual(estimate_size([a, ('abc', {'x': a})]), 1603 + len('x'))
+        self.assertEqual(estimate_size(Shared()), 1024 * 1024)
+        self.assertEqual(estimate_size(None), 0)
+
+        c = compress_array(numpy.zeros((100000,)))
+        self.assert_(isinstance(c, CompressedArray))
+        self.assertEqual(estimate_size(c), c.nbytes)
+
+    def test_dataset(self):
+        # Datasets in the project are not charged to the journal,
+        # removed Datasets are
+        spj = Project()
+        try:
+            tbl = Table(numpy.zeros((10000,), 'f8,f8'))
+            tbl.key = 'data'
+            spj.add_datasets([tbl])
+            spj.rename_dataset(tbl, 'renamed')
+            self.assertEqual(spj.journal.get_size(), len('data'))
+
+            ul = UndoList()
+            spj.remove_datasets([tbl], undolist=ul)
+            spj.journal.append(ul)
+            self.assert_(spj.journal.get_size() >= tbl.nbytes)
+            spj.undo()
+            self.assert_(spj.journal.get_size() < tbl.nbytes)
+        finally:
+            spj.close()
+
+
+class TestCaseJournal(unittest.TestCase):
+
+    def test_max_entries(self):
+        journal = Journal(max_entries=3)
+        for i in range(5):
+            journal.append(UndoInfo(noop, i))
+        self.assertEqual(journal.get_usage()['undo'], 3)
+
+    def test_max_size(self):
+        journal = Journal(max_size=1000)
+        for i in range(3):
+            journal.append(UndoInfo(noop, numpy.zeros((100,))))
+        self.assertEqual(journal.get_usage()['undo'], 1)
+        self.assertEqual(journal.get_size(), 800)
+
+    def test_spill(self):
+        journal = Journal(max_size=100*1024, spill=True)
+        try:
+            for i in range(3):
+                journal.append(UndoInfo(noop, Shared(), numpy.zeros((10000,))))
+            usage = journal.get_usage()
+            # the arrays are spilled, the shared objects are neither
+            # pickled nor are they kept beyond the limit
+            self.assertEqual(usage['spilled'], 80000)
+            self.assertEqual(Shared.pickled, 0)
+            self.assertEqual(usage['undo'], 1)
+        finally:
+            journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
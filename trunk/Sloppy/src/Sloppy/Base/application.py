@@ -28,7 +28,7 @@ import Sloppy
 from Sloppy.Lib.Undo import *
 from Sloppy.Lib.Signals import HasSignals
 from Sloppy.Lib.ElementTree.ElementTree import Element, SubElement
-from Sloppy.Lib.Check import values_as_dict
+from Sloppy.Lib.Check import values_as_dict, Integer
 
 from Sloppy.Base.objects import Plot, Axis, Line, Layer, SPObject
 from Sloppy.Base.dataset import Dataset
@@ -98,6 +98,11 @@ class Application(SPObject):
       
     These should be overwritten in classes derived from Application.
     """
+
+    # Number of worker processes that parse imported files.  The
+    # default of 1 imports the files one after another, 0 means one
+    # worker process per CPU.
+    import_workers = Integer(min=0, max=None, init=1)
     
     def __init__(self):
         SPObject.__init__(self)        
@@ -128,6 +133,10 @@ class Application(SPObject):
         self.read_templates()
         self.sig_connect("write-config", self.write_config_templates)
 
+        # import options
+        self.read_import_options()
+        self.sig_connect("write-config", self.write_config_import_options)
+
         # init() is a good place for initialization of derived class
         self.plugins = {}
         self.load_plugins()
@@ -369,6 +378,24 @@ class Application(SPObject):
                 
                 
 
+    # Import Options ------------------------------------------------------
+
+    def read_import_options(self):
+        eImport = self.eConfig.find('Import')
+        if eImport is not None and eImport.attrib.has_key('workers'):
+            try:
+                self.import_workers = int(eImport.attrib['workers'])
+            except ValueError:
+                logger.error("Invalid number of import workers: %s"
+                             % eImport.attrib['workers'])
+
+    def write_config_import_options(self, sender, eConfig):
+        eImport = eConfig.find('Import')
+        if eImport is None:
+            eImport = SubElement(eConfig, 'Import')
+        eImport.attrib['workers'] = str(self.import_workers)
+                
+                
     # Simple User I/O -----------------------------------------------------
 
     def ask_yes_no(self, msg):
@@ -37,6 +37,121 @@ class BackendError(Exception):
     pass
 
 
+
+#------------------------------------------------------------------------------
+# Redraw Scheduler
+#
+
+# Functions used by the RedrawScheduler to defer redraws to the event
+# loop, see set_event_loop.
+_idle_add = None
+_timeout_add = None
+
+def set_event_loop(idle_add=None, timeout_add=None):
+    """
+    Set the functions that the RedrawScheduler uses to defer redraws
+    to the event loop of the GUI, e.g. gobject.idle_add and
+    gobject.timeout_add.  Both functions must accept the same
+    arguments as their gobject counterparts.  Without an event loop,
+    all redraws are performed immediately.
+    """
+    global _idle_add, _timeout_add
+    _idle_add = idle_add
+    _timeout_add = timeout_add
+
+
+def run_when_idle(func, *args):
+    """
+    Call `func` with the given arguments from the event loop, see
+    set_event_loop.  This may also be called from other threads.
+    Returns False if there is no event loop and `func` has not been
+    scheduled.
+    """
+    if _idle_add is None:
+        return False
+    def idle_func():
+        func(*args)
+        return False
+    _idle_add(idle_func)
+    return True
+    
+
+class RedrawScheduler:
+
+    """
+    Collects redraw requests and calls `func` only once for all
+    requests made within one iteration of the event loop or, if
+    `delay` is given, within `delay` milliseconds.
+
+    While the scheduler is blocked (see block/unblock), requests are
+    only collected.  The counters `requested` and `performed` hold
+    the number of redraw requests and of actual redraws.
+    """
+
+    def __init__(self, func, delay=0):
+        self.func = func
+        self.delay = delay
+
+        self.pending = False
+        self.scheduled = False
+        self.blocked = 0
+
+        self.requested = 0
+        self.performed = 0
+
+    def request(self):
+        " Request a redraw. "
+        self.requested += 1
+        self.pending = True
+        if self.blocked == 0:
+            self.schedule()
+
+    def schedule(self):
+        if self.scheduled is True:
+            return
+        if self.delay > 0 and _timeout_add is not None:
+            self.scheduled = True
+            _timeout_add(self.delay, self.run)
+        elif _idle_add is not None:
+            self.scheduled = True
+            _idle_add(self.run)
+        else:
+            self.run()
+
+    def run(self):
+        """
+        Perform the pending redraw, unless the scheduler is blocked.
+        Returns False, so that it may be used as idle callback.
+        """
+        self.scheduled = False
+        if self.pending is True and self.blocked == 0:
+            self.pending = False
+            self.performed += 1
+            self.func()
+        return False
+
+    def flush(self):
+        " Perform a pending redraw right away. "
+        self.run()
+
+    def cancel(self):
+        " Discard a pending redraw. "
+        self.pending = False
+    
+    def block(self, count=1):
+        self.blocked += count
+
+    def unblock(self, count=1):
+        self.blocked = max(0, self.blocked - count)
+        if self.blocked == 0 and self.pending is True:
+            self.schedule()
+
+    def get_counters(self):
+        " Return tuple (requested, performed). "
+        return (self.requested, self.performed)
+    
+
+
 #------------------------------------------------------------------------------
 # Backend
 #
@@ -70,6 +185,12 @@ class Backend(SPObject):
         - clear -- clear the plotting output
         - draw -- plot the data of self.plot
         - redraw
+
+    Redraws should not be performed directly on every change, but
+    should be requested via `queue_redraw`.  The `redraw_scheduler`
+    then calls `redraw` only once for all requests made within one
+    iteration of the event loop or within the time window given by
+    the option 'redraw_delay' (in milliseconds).
       
     You might want to redefine the following:
     
@@ -104,6 +225,9 @@ class Backend(SPObject):
         self.options = dict(kw)
         if extrakw:
             self.options.update(extrakw)
+
+        self.redraw_scheduler = RedrawScheduler(lambda: self.redraw(),
+                                                delay=self.options.get('redraw_delay', 0))
                   
         # call functions for custom initialization
         self.init() # custom initialization
@@ -127,16 +251,17 @@ class Backend(SPObject):
         self.plot = plot
         self.project = project
         if self.project is not None:
-            self.project.sig_connect('close', self.cb_project_closed)
-            self.plot.sig_connect('changed', self.cb_plot_changed)
             #self.project.sig_connect('plot-changed', self.cb_plot_changed)
-            self.plot.sig_connect('closed', (lambda sender: self.disconnect()))
+            self.cblist.extend(
+                [self.project.sig_connect('close', self.cb_project_closed),
+                 self.plot.sig_connect('changed', self.cb_plot_changed),
+                 self.plot.sig_connect('closed', (lambda sender: self.disconnect()))])
 
     def cb_plot_changed(self, sender):
         """
         @todo: only redraw if we have already drawn something!
         """
-        self.redraw()
+        self.queue_redraw()
         
     def cb_project_closed(self, sender):
         logging.debug("The project '%s' is closing. The Backend will close as well." % sender.label)
@@ -165,6 +290,7 @@ class Backend(SPObject):
         self.connected = False
 
         self.sig_emit('closed')
+        self.redraw_scheduler.cancel()
         
         for cb in self.cblist:
             cb.disconnect()
@@ -190,6 +316,17 @@ class Backend(SPObject):
     def redraw(self):
         pass
 
+    def queue_redraw(self):
+        """ Request a redraw, which is performed by the redraw_scheduler. """
+        self.redraw_scheduler.request()
+
+    def block_redraw(self, count=1):
+        """ Collect redraw requests until unblock_redraw is called. """
+        self.redraw_scheduler.block(count)
+
+    def unblock_redraw(self, count=1):
+        self.redraw_scheduler.unblock(count)
+
 
     #----------------------------------------------------------------------
     # Common Backend Utility Functions
@@ -229,7 +366,7 @@ class Backend(SPObject):
 
 
     def get_dataset_data(self, dataset, cx, cy):        
-        dataset.get_array() #
+        dataset.load()
         
         #:line.cx
         try:
@@ -252,4 +389,56 @@ class Backend(SPObject):
         except IndexError:
             logger.error("Index range '%s'out of bounds!" % str((start,end)) )
 
+    def get_column_pyramid(self, dataset, cindex, start=None, end=None):
+        """
+        Return the ColumnPyramid for the given column of the
+        `dataset`, or None if the Dataset provides no pyramids or if
+        the rows are limited by `start` or `end`.
+        """
+        if start is not None or end is not None \
+               or not hasattr(dataset, 'get_pyramid'):
+            return None
+        return dataset.get_pyramid(cindex)
+
+    def get_data_limits(self, layer):
+        """
+        Return a dictionary with the value range (min, max) of the
+        visible lines of the `layer` for the axis keys 'x' and 'y'.
+
+        The ranges are taken from the summary of the Datasets (see
+        Table.get_range), so that datasets which have not been loaded
+        yet are not loaded just for autoscaling.  If the range of any
+        visible line cannot be determined this way, e.g. because its
+        rows are limited, then the value for the axis is None and
+        the limits should be left to the plotting library.
+        """
+        limits = {'x': None, 'y': None}
+        unknown = []
+        for line in layer.lines:
+            if line.visible is False:
+                continue
+            if line.source is None or line.cx is None or line.cy is None:
+                # such lines are not plotted either
+                continue
+            if line.row_first is not None or line.row_last is not None \
+                   or not hasattr(line.source, 'get_range'):
+                unknown = ['x', 'y']
+                break
+            for key, cindex in (('x', line.cx), ('y', line.cy)):
+                try:
+                    vrange = line.source.get_range(cindex)
+                except IndexError:
+                    vrange = None
+                if vrange is None:
+                    unknown.append(key)
+                elif limits[key] is None:
+                    limits[key] = vrange
+                else:
+                    limits[key] = (min(limits[key][0], vrange[0]),
+                                   max(limits[key][1], vrange[1]))
+
+        for key in unknown:
+            limits[key] = None
+        return limits
+
 
@@ -20,7 +20,7 @@
 
 import os.path
 
-from Sloppy.Base import globals, dataset
+from Sloppy.Base import globals, dataset, error
 from Sloppy.Lib.Check import *
 from Sloppy.Base.objects import SPObject
 
@@ -74,19 +74,49 @@ class Importer(SPObject):
     You must only implement the method `read_dataset_from_stream` which
     constructs a new Dataset object from a given file descriptor.    
 
+    Importers that read their data in blocks should call
+    `report_progress` after each block.  This passes the fraction of
+    the stream that has been read to the `progress_indicator` and
+    raises error.UserCancel if the import has been cancelled.
+    
     """
     
     author = "your name"       
     filemode = '' # set to 'b' for binary objects
 
-    # Still experimental:
-    # These two attributes can be used to interact with the application
-    app = Instance(object)
-    progress_indicator = Instance(object)
+    # These attributes can be used to interact with the application:
+    # The progress_indicator is a callable that receives the fraction
+    # of the stream that has been read so far.  If `cancelled` is set
+    # (e.g. by the progress_indicator), the import is aborted.
+    app = Instance(object, init=None)
+    progress_indicator = Instance(object, init=None)
+    cancelled = Boolean(init=False)
     
     def read_dataset_from_stream(self,fd):
         return None
+
+    def cancel(self):
+        " Abort the import on the next call to `report_progress`. "
+        self.cancelled = True
         
+    def report_progress(self, fd):
+        """
+        Report the current position in the stream `fd` to the
+        progress indicator.  Raises error.UserCancel if the import
+        has been cancelled.
+        """
+        if self.cancelled is True:
+            raise error.UserCancel
+
+        if callable(self.progress_indicator):
+            size = stream_size(fd)
+            if size is not None and size > 0:
+                self.progress_indicator(min(1.0, float(fd.tell()) / size))
+
+            # the progress indicator might have cancelled the import
+            if self.cancelled is True:
+                raise error.UserCancel
+            
     def read_dataset_from_file(self,filename):
 
         try:
@@ -171,6 +201,14 @@ def read_dataset_from_stream(fd, importer_key='ASCII', **kwargs):
     return importer.read_dataset_from_stream(fd)
     
 
+def stream_size(fd):
+    " Return size of the stream `fd` in bytes or None if unknown. "
+    try:
+        return os.fstat(fd.fileno()).st_size
+    except (AttributeError, IOError, OSError):
+        return getattr(fd, 'len', None) # StringIO
+
+
 def importer_template_from_filename(filename):
     """    
     Return a list of templates that matches the given filename based
@@ -19,7 +19,7 @@
 # $Id$
 
 
-import logging
+import logging, os, zlib
 logger = logging.getLogger("Base.dataset")
 
 from Sloppy.Base import tree, utils
@@ -35,6 +35,82 @@ import numpy
 
 # TODO: check if info objects are copied or not.
 
+#------------------------------------------------------------------------------
+# Undo records for data edits
+#
+# Undo information for data edits can easily take up more memory
+# than the data itself.  Therefore large arrays are stored zlib
+# compressed (CompressedUndoInfo), changes of a few values of a
+# column only store these values (Table.patch_column) and exactly
+# reversible arithmetic transforms only store the inverse operation
+# (Table.transform_column).
+
+class CompressedArray:
+
+    """
+    A zlib compressed copy of a numpy array.  `nbytes` is the size
+    of the compressed data, so that it is accounted correctly by
+    UndoInfo.get_size.
+    """
+
+    # may be written to disk by UndoInfo.spill
+    spillable = True
+
+    def __init__(self, array, data):
+        self.dtype = array.dtype
+        self.shape = array.shape
+        self.data = data
+        self.nbytes = len(data)
+
+    def get_array(self):
+        a = numpy.fromstring(zlib.decompress(self.data), dtype=self.dtype)
+        return a.reshape(self.shape)
+
+
+def compress_array(array, min_size=64*1024):
+    """
+    Return a CompressedArray of `array` if it is a numpy array with
+    at least `min_size` bytes that can be compressed to less than 90%
+    of its size.  Otherwise the `array` is returned unchanged.
+    """
+    if not isinstance(array, numpy.ndarray) or array.nbytes < min_size:
+        return array
+    data = zlib.compress(numpy.ascontiguousarray(array).tostring(), 1)
+    if len(data) > 0.9 * array.nbytes:
+        return array
+    return CompressedArray(array, data)
+
+
+
+class CompressedUndoInfo(UndoInfo):
+
+    """
+    UndoInfo that stores its large array arguments compressed, see
+    compress_array.  They are decompressed on execution.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        args = [compress_array(arg) for arg in args]
+        UndoInfo.__init__(self, func, *args, **kwargs)
+
+    def get_args(self):
+        return tuple([self.decompress(arg) for arg in UndoInfo.get_args(self)])
+
+    def decompress(self, arg):
+        if isinstance(arg, CompressedArray):
+            return arg.get_array()
+        return arg
+
+
+def changed_rows(old, new):
+    " Return the indices of the rows where the columns `old` and `new` differ. "
+    differ = old != new
+    if old.dtype.kind in 'fc':
+        differ &= ~(numpy.isnan(old) & numpy.isnan(new))
+    return numpy.flatnonzero(differ)
+
+    
+    
 #------------------------------------------------------------------------------
 
 class Dataset(tree.Node, HasSignals):
@@ -61,7 +137,13 @@ class Dataset(tree.Node, HasSignals):
         self.key = "" # TODO: should be moved to parent object!    
         self.change_counter = 0
         self.__is_valid = True
+        self.closed = False # see close and Project.add_datasets
         self._import = None
+        self._rowbuffer = None
+        self._summary = None
+
+        # location of the data in the project archive, see projectio
+        self._archive_info = None
 
         self.sig_register('closed')
         self.sig_register('update')
@@ -72,10 +154,14 @@ class Dataset(tree.Node, HasSignals):
             array = self.get_default_array()
         self.set_array(array)
 
+    # The change_counter is increased on every modification of the
+    # data, even when reverting a change.  This way it can safely be
+    # compared with a counter that was stored at an earlier time.
+    
     def revert_change(self, undolist=[]):
-        self.change_counter -= 1
+        self.change_counter += 1
         self.sig_emit('update')
-        undolist.append( UndoInfo(self.update_change).describe("Update") )
+        undolist.append( UndoInfo(self.notify_change).describe("Update") )
         
     def notify_change(self, undolist=[]):
         self.change_counter += 1
@@ -85,28 +171,98 @@ class Dataset(tree.Node, HasSignals):
     def has_changes(self, counter):
         return self.change_counter != counter
 
+    def get_nbytes(self):
+        " Return the memory in bytes held by the data (0 if not loaded). "
+        if self._import is not None or self._array is None:
+            return 0
+        return self._array.nbytes
+    nbytes = property(get_nbytes)
+
+    def get_undo_size(self):
+        """
+        Return the memory in bytes that undo information referring
+        to this Dataset should be charged with, see estimate_size.
+        This is only the size of the data if the Dataset has been
+        closed, e.g. removed from its project, because then the undo
+        information is the only owner of the Dataset.
+        """
+        if self.closed is True:
+            return self.nbytes
+        return 0
+
     # what is the difference btw. close and detach?
     def close(self):
         print "CLOSING"
+        self.closed = True
         self.sig_emit('closed')
     detach = close
     
 
     def is_empty(self):
         " Returns True if the Dataset has no data or if that data is empty. "
+        if self._import is not None:
+            return self.get_summary().nrows == 0
         return self._array is None or len(self._array) == 0
 
+    def has_data(self):
+        """
+        Returns True if the Dataset has data, which may be empty or
+        not loaded yet.  Unlike is_empty, this never loads or
+        assembles the data.
+        """
+        return self._import is not None or self._array is not None
+
+    def get_summary(self):
+        """
+        Return a DatasetSummary with the number of rows and the
+        value ranges of the columns.
+
+        If the data has not been loaded yet, then the summary is
+        taken from the importer (see projectio.DatasetImporter),
+        so that the data does not need to be loaded.  Otherwise
+        the summary is calculated from the data and kept until
+        the next change.
+        """
+        summary = self._summary
+        if summary is not None and summary.counter == self.change_counter:
+            return summary
+
+        summary = None
+        if self._import is not None and hasattr(self._import, 'read_summary'):
+            summary = self._import.read_summary(self)
+        if summary is None:
+            self.load()
+            summary = self.create_summary()
+
+        summary.counter = self.change_counter
+        self._summary = summary
+        return summary
+
+    def create_summary(self):
+        " Return a DatasetSummary calculated from the data. "
+        raise RuntimeError("not implemented")
+
 
     #----------------------------------------------------------------------
     # Any derived classes needs to implement the following functions,
     # that provide some basic functionality for arrays of rank 2.
     #
         
+    def load(self):
+        " Import the data if it has not been loaded yet. "
+        if self._import is not None:
+            # The importer is removed before it is called, so that
+            # the Dataset is treated as loaded during the import.
+            importer, self._import = self._import, None
+            try:
+                importer(self)
+            except:
+                self._import = importer
+                raise
+        
     def get_array(self):
         " Return internal array. "
-        if self._import is not None:
-            self._import(self)
-            self._import = None        
+        self.load()
         return self._array
     
     def set_array(self, array):
@@ -166,7 +322,10 @@ class Dataset(tree.Node, HasSignals):
     
     # if you redefine get_nrows in derived classes,
     # please redefine 'nrows = property(get_nrows)' as well.
-    def get_nrows(self): return len(self._array)
+    def get_nrows(self):
+        if self._import is not None:
+            return self.get_summary().nrows
+        return len(self._array)
     nrows = property(get_nrows)
 
     # if you redefine get_ncols in derived classes,
@@ -224,6 +383,36 @@ class Dataset(tree.Node, HasSignals):
         " Insert the given `rows` (list of one-dimensional arrays) at row `i`. "
         raise RuntimeError("not implemented")
 
+    def append_rows(self, rows):
+        """
+        Append the given `rows` (a one-dimensional array with the
+        same dtype as the Dataset's array) to the end of the array.
+
+        Unlike the other row manipulation methods, this method does
+        not create any undo information and it does not emit any
+        Signal.  It is meant for importers and other sources that
+        fill a Dataset bit by bit.  The rows are stored in a
+        RowBuffer with spare capacity, so that repeated appends
+        take linear time.  Call `trim` when you are done.
+        """
+        buffer = self._rowbuffer
+        if buffer is None or buffer.view is not self._array:
+            buffer = RowBuffer(self._array)
+            self._rowbuffer = buffer
+        buffer.append(rows)
+        self._array = buffer.view
+        self.change_counter += 1
+
+    def trim(self):
+        """
+        Release the spare capacity that has been allocated by
+        `append_rows`.
+        """
+        buffer = self._rowbuffer
+        if buffer is not None and buffer.view is self._array:
+            self._array = buffer.trim()
+        self._rowbuffer = None
+        
     def remove_n_rows(self, row, n=1, only_zeros=False, undolist=[]):
         """
         Delete `n` rows, starting at the row with the index `row`.
@@ -238,9 +427,10 @@ class Dataset(tree.Node, HasSignals):
             ui = UndoInfo(self.insert_n_rows, row, )
         else:
             undo_data = numpy.array(self._array[row:row+n])            
-            ui = UndoInfo(self.insert_rows, row, undo_data)
+            ui = CompressedUndoInfo(self.insert_rows, row, undo_data)
             
         self._array = numpy.concatenate([self._array[0:row], self._array[row+n:]])
+        self.change_counter += 1
         undolist.append(ui)
 
         return undo_data
@@ -313,6 +503,183 @@ class Dataset(tree.Node, HasSignals):
     
 
 
+###############################################################################
+
+class RowBuffer:
+
+    """
+    Growable storage for the rows of a one-dimensional array.
+
+    The rows are kept in a preallocated array whose capacity is
+    doubled whenever it is exhausted.  Appending n rows one block
+    after another therefore only costs O(n) copying in total.
+
+    The attribute `view` holds the valid part of the storage,
+    i.e. the first `nrows` rows.  It is a view and not a copy.
+    """
+
+    min_capacity = 1024
+    
+    def __init__(self, array, capacity=0):
+        nrows = len(array)
+        capacity = max(capacity, nrows, self.min_capacity)
+        self._storage = numpy.zeros((capacity,), dtype=array.dtype)
+        self._storage[:nrows] = array
+        self.nrows = nrows
+        self.view = self._storage[:nrows]
+
+    def get_capacity(self): return len(self._storage)
+    capacity = property(get_capacity)
+    
+    def reserve(self, nrows):
+        " Make sure that the storage can hold at least `nrows` rows. "
+        capacity = self.capacity
+        if nrows <= capacity:
+            return
+        
+        while capacity < nrows:
+            capacity *= 2
+        logger.debug("RowBuffer: growing capacity to %d rows" % capacity)
+        storage = numpy.zeros((capacity,), dtype=self._storage.dtype)
+        storage[:self.nrows] = self._storage[:self.nrows]
+        self._storage = storage
+        self.view = self._storage[:self.nrows]
+                    
+    def append(self, rows):
+        " Append the given `rows` to the end of the valid rows. "
+        n = len(rows)
+        self.reserve(self.nrows + n)
+        self._storage[self.nrows:self.nrows+n] = rows
+        self.nrows += n
+        self.view = self._storage[:self.nrows]
+
+    def trim(self):
+        """
+        Return an array with only the valid rows.  If there is
+        any spare capacity, then the rows are copied, so that
+        the storage can be released.
+        """
+        if self.nrows < self.capacity:
+            return self.view.copy()
+        else:
+            return self._storage
+
+
+
+class RowChunks:
+
+    """
+    Rows of a one-dimensional array, stored as a list of chunks.
+
+    Inserting or removing rows only copies the chunk that contains
+    the given row, so that editing a single row takes time
+    proportional to the chunk size instead of the number of rows.
+    A chunk that grows beyond twice the `chunk_size` is split.
+
+    Use `compact` to get a single contiguous array again.
+    """
+
+    def __init__(self, array, chunk_size=4096):
+        self.dtype = array.dtype
+        self.chunk_size = chunk_size
+        self.chunks = [array[i:i+chunk_size] for i in range(0, len(array), chunk_size)]
+        self.update_ends()
+
+    def update_ends(self):
+        # index of the row after the last row of each chunk
+        self.ends = numpy.cumsum([len(chunk) for chunk in self.chunks])
+
+    def __len__(self):
+        if len(self.ends) == 0:
+            return 0
+        return int(self.ends[-1])
+
+    def locate(self, row):
+        " Return (chunk index, row index within chunk) of the given `row`. "
+        if row < 0:
+            row += len(self)
+        if row < 0 or row >= len(self):
+            raise IndexError("row index out of range")
+        index = int(self.ends.searchsorted(row, side='right'))
+        if index == 0:
+            return 0, row
+        return index, row - int(self.ends[index-1])
+
+    def get_row(self, row):
+        index, offset = self.locate(row)
+        return self.chunks[index][offset]
+
+    def get_value(self, name, row):
+        index, offset = self.locate(row)
+        return self.chunks[index][name][offset]
+
+    def set_value(self, name, row, value):
+        index, offset = self.locate(row)
+        self.chunks[index][name][offset] = value
+
+    def insert(self, row, rows):
+        " Insert the array `rows` before the given `row`. "
+        if len(rows) == 0:
+            return
+        rows = numpy.asarray(rows).astype(self.dtype)
+        if len(self.chunks) == 0:
+            index = 0
+            self.chunks = [rows]
+        elif row >= len(self):
+            index = len(self.chunks) - 1
+            self.chunks[index] = numpy.concatenate([self.chunks[index], rows])
+        else:
+            index, offset = self.locate(row)
+            chunk = self.chunks[index]
+            self.chunks[index] = numpy.concatenate([chunk[:offset], rows, chunk[offset:]])
+
+        chunk = self.chunks[index]
+        if len(chunk) > 2 * self.chunk_size:
+            size = self.chunk_size
+            self.chunks[index:index+1] = [chunk[i:i+size] for i in range(0, len(chunk), size)]
+        self.update_ends()
+
+    def remove(self, row, n):
+        " Remove `n` rows, starting with the given `row`. "
+        end = min(row + n, len(self))
+        start = 0
+        chunks = []
+        for chunk in self.chunks:
+            stop = start + len(chunk)
+            if stop <= row or start >= end:
+                chunks.append(chunk)
+            else:
+                i0, i1 = max(row - start, 0), min(end - start, len(chunk))
+                if i0 > 0 or i1 < len(chunk):
+                    chunks.append(numpy.concatenate([chunk[:i0], chunk[i1:]]))
+            start = stop
+        self.chunks = chunks
+        self.update_ends()
+
+    def get_rows(self, row, n):
+        " Return a new array with `n` rows, starting with the given `row`. "
+        end = min(row + n, len(self))
+        parts = []
+        start = 0
+        for chunk in self.chunks:
+            stop = start + len(chunk)
+            if stop > row and start < end:
+                parts.append(chunk[max(row - start, 0):min(end - start, len(chunk))])
+            start = stop
+        if len(parts) == 0:
+            return numpy.zeros((0,), dtype=self.dtype)
+        return numpy.concatenate(parts)
+
+    def compact(self):
+        " Return all rows as a single contiguous array. "
+        if len(self.chunks) == 0:
+            return numpy.zeros((0,), dtype=self.dtype)
+        elif len(self.chunks) == 1:
+            return self.chunks[0]
+        return numpy.concatenate(self.chunks)
+
+    
+
 ###############################################################################
 class Table(Dataset):
     
@@ -322,8 +689,18 @@ class Table(Dataset):
     A Dataset 'column' is mapped to the field of such an heterogeneous array.
     Each field has an Info object which stores additional information
     about it.
+
+    Tables with more than twice `row_chunk_size` rows keep their rows
+    in RowChunks once rows are inserted or removed, so that editing
+    single rows does not copy the whole array.  In this case the
+    attribute `_array` is removed and the rows are assembled into a
+    single array again on the next access to `_array`, e.g. when the
+    Table is plotted or exported.  Set `row_chunk_size` to None to
+    always keep a single array.
     """
 
+    row_chunk_size = 4096
+
     class Info(BaseObject):
         label = Unicode(init="")       
         designation = Choice(['X','Y','XERR', 'YERR', 'LABEL', None])
@@ -334,16 +711,29 @@ class Table(Dataset):
 
     def __init__(self, array=None, infos={}):
         self._infos = {}
+        self._pyramids = {}
+        self._rowchunks = None
         Dataset.__init__(self, array)
         self._infos = infos
 
+    def __getattr__(self, name):
+        if name == '_array' and self.__dict__.get('_rowchunks') is not None:
+            return self.compact_rows()
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name == '_array':
+            self.__dict__['_rowchunks'] = None
+        self.__dict__[name] = value
+
 
     # Array ---------------------------------------------------------------
 
     def set_array(self, array, infos={}, undolist=[]):
-        ui = UndoInfo(self.set_array, self._array, self._infos)
+        ui = CompressedUndoInfo(self.set_array, self._array, self._infos)
         self._array = array
         self._infos = infos
+        self.change_counter += 1
         undolist.append(ui)
         
         self.sig_emit('update-fields')    
@@ -385,19 +775,31 @@ class Table(Dataset):
     # Value Access ---------------------------------------------------------
 
     def get_value(self, cindex, row):
+        self.load()
+        if self._rowchunks is not None:
+            return self._rowchunks.get_value(self.get_name(cindex), row)
         return self._array[self.get_name(cindex)][row]
     
     def set_value(self, cindex, row, value, undolist=[]):
-        self._array[row][cindex]
-        col = self.get_column(cindex)
-        old_value = col[row]
-        col[row] = value
-        undolist.append(UndoInfo(self.set_value, col, row, old_value))
+        old_value = self.get_value(cindex, row)
+        if self._rowchunks is not None:
+            self._rowchunks.set_value(self.get_name(cindex), row, value)
+        else:
+            self.get_column(cindex)[row] = value
+        self.change_counter += 1
+        undolist.append(UndoInfo(self.set_value, cindex, row, old_value))
+
+    def get_row(self, row):
+        self.load()
+        if self._rowchunks is not None:
+            return self._rowchunks.get_row(row)
+        return self._array[row]
 
 
     # for get_column, see get_column
 
     def get_region(self, row, col, height, width, cut=False):        
+        self.load()
         formats = ','.join(self.formats[col:col+width])
         a = numpy.zeros( (height,), formats)
 
@@ -415,7 +817,7 @@ class Table(Dataset):
     def set_region(self, row, col, array, coerce=True, undolist=[]):
         undo_data = self.get_region(row, col, len(array), len(array.dtype.fields[-1]))
         ul = UndoList()
-        ul.append(UndoInfo(self.set_region, row, col, undo_data))
+        ul.append(CompressedUndoInfo(self.set_region, row, col, undo_data))
 
         try:
             names = array.dtype.fields[-1]
@@ -427,6 +829,7 @@ class Table(Dataset):
                     z = array[names[i]]
                 self._array[name][row:row+len(array)] = z
                 i += 1
+            self.change_counter += 1
         except Exception, msg:
             print "set_region failed: %s.  undoing." % msg
             ul.execute()
@@ -435,12 +838,30 @@ class Table(Dataset):
                    
     # Information ---------------------------------------------------------
 
-    def get_ncols(self): return len(self._array.dtype.fields) - 1
+    def get_nrows(self):
+        if self._rowchunks is not None:
+            return len(self._rowchunks)
+        return Dataset.get_nrows(self)
+    nrows = property(get_nrows)
+
+    def get_ncols(self): return len(self.get_dtype().fields) - 1
     ncols = property(get_ncols)
 
+    def get_dtype(self):
+        " Return the dtype of the array. "
+        if self._rowchunks is not None:
+            return self._rowchunks.dtype
+        return self._array.dtype
+
+    def get_nbytes(self):
+        if self._rowchunks is not None:
+            return len(self._rowchunks) * self._rowchunks.dtype.itemsize
+        return Dataset.get_nbytes(self)
+    nbytes = property(get_nbytes)
+    
     def get_column_type(self, cindex):
         name = self.get_name(cindex)
-        return self._array.dtype.fields[name][0].type
+        return self.get_dtype().fields[name][0].type
 
 
     def dump(self):
@@ -464,10 +885,64 @@ class Table(Dataset):
 
     # Row Manipulation ----------------------------------------------------
 
-    def insert_rows(self, i, rows, undolist=[]):        
-        self._array = numpy.concatenate([self._array[0:i], rows, self._array[i:]])
+    def get_rowchunks(self):
+        """
+        Return the RowChunks of the Table or None if the rows should
+        be kept in a single array.  The RowChunks are created if
+        necessary, see `row_chunk_size`.
+        """
+        if self._rowchunks is None and self.row_chunk_size is not None:
+            if self._array is not None and len(self._array) > 2 * self.row_chunk_size:
+                self._rowchunks = RowChunks(self._array, self.row_chunk_size)
+                del self._array
+        return self._rowchunks
+
+    def is_empty(self):
+        if self._rowchunks is not None:
+            return len(self._rowchunks) == 0
+        return Dataset.is_empty(self)
+
+    def has_data(self):
+        return self._rowchunks is not None or Dataset.has_data(self)
+
+    def compact_rows(self):
+        " Assemble the rows kept in RowChunks into a single array. "
+        if self._rowchunks is not None:
+            self._array = self._rowchunks.compact()
+            self._rowchunks = None
+        return self._array
+    
+    def insert_n_rows(self, row, n=1, undolist=[]):
+        self.insert_rows(row, numpy.zeros((n,), dtype=self.get_dtype()), undolist=undolist)
+        
+    def insert_rows(self, i, rows, undolist=[]):
+        chunks = self.get_rowchunks()
+        if chunks is not None:
+            chunks.insert(i, rows)
+        else:
+            self._array = numpy.concatenate([self._array[0:i], rows, self._array[i:]])
+        self.change_counter += 1
         undolist.append(UndoInfo(self.remove_n_rows, i, len(rows), only_zeros=True))
 
+    def remove_n_rows(self, row, n=1, only_zeros=False, undolist=[]):
+        chunks = self.get_rowchunks()
+        if chunks is None:
+            return Dataset.remove_n_rows(self, row, n, only_zeros=only_zeros, undolist=undolist)
+
+        n = min(self.nrows-row, n)
+        if only_zeros is True:
+            undo_data = numpy.zeros((n,), dtype=chunks.dtype)
+            ui = UndoInfo(self.insert_n_rows, row, n)
+        else:
+            undo_data = chunks.get_rows(row, n)
+            ui = CompressedUndoInfo(self.insert_rows, row, undo_data)
+
+        chunks.remove(row, n)
+        self.change_counter += 1
+        undolist.append(ui)
+
+        return undo_data
+
 
     # Column Manipulation ---------------------------------------------------------
 
@@ -494,6 +969,7 @@ class Table(Dataset):
             new_array[name] = a[name]
 
         self._array = new_array
+        self.change_counter += 1
         self.sig_emit('update-fields')
 
 
@@ -540,6 +1016,7 @@ class Table(Dataset):
         undolist.append(ul)
 
         self._array = new_array
+        self.change_counter += 1
         self.sig_emit('update-fields')        
         
 
@@ -571,7 +1048,12 @@ class Table(Dataset):
     # SPECIFIC TO TABLE OBJECTS
     
     def get_column(self, cindex):
-        " Return a copy of the field with the given name or index `cindex`. "
+        """
+        Return a copy of the field with the given name or index
+        `cindex`.  The data is loaded if necessary, so that the
+        column is consistent with nrows, see get_summary.
+        """
+        self.load()
         if isinstance(cindex, basestring):
             return self.get_column_by_name(cindex)
         elif isinstance(cindex, int):
@@ -588,10 +1070,59 @@ class Table(Dataset):
         return self._array[name]
 
     def set_column(self, col, array, undolist=[]):
-        name = self.get_name(col)        
-        old_data = self._array[name].copy()
-        self._array[name] = array
-        undolist.append(UndoInfo(self.set_column, col, old_data))
+        self.load()
+        column = self._array[self.get_name(col)]
+        new_data = numpy.empty(column.shape, dtype=column.dtype)
+        new_data[:] = array
+        ui = self.create_column_undo(col, column, new_data)
+        column[:] = new_data
+        self.change_counter += 1
+        undolist.append(ui)
+        self.sig_emit('update')
+
+    def create_column_undo(self, col, old_data, new_data):
+        """
+        Return the UndoInfo to restore the column `col` with the
+        values `old_data` after it has been set to `new_data`.  If
+        only a few values differ, only these are stored.
+        """
+        rows = changed_rows(old_data, new_data)
+        if len(rows) * (old_data.itemsize + rows.itemsize) <= old_data.nbytes / 4:
+            return UndoInfo(self.patch_column, col, rows, old_data[rows])
+        return CompressedUndoInfo(self.set_column, col, numpy.array(old_data))
+
+    def patch_column(self, col, rows, values, undolist=[]):
+        " Set the values of the column `col` at the indices `rows`. "
+        column = self.get_column(col)
+        old_values = column[rows]
+        column[rows] = values
+        self.change_counter += 1
+        undolist.append(UndoInfo(self.patch_column, col, rows, old_values))
+        self.sig_emit('update')
+
+    _inverse_operators = {'+': '-', '-': '+', '*': '/', '/': '*'}
+    
+    def transform_column(self, col, operator, value, undolist=[]):
+        """
+        Apply the arithmetic `operator` ('+', '-', '*' or '/') with
+        the scalar `value` to all values of the column `col`, e.g.
+        transform_column(0, '*', 2.0) doubles the values of the first
+        column.
+
+        If applying the inverse operation restores the values
+        exactly (e.g. when multiplying by a power of two), then the
+        undo information only consists of the inverse operation.
+        """
+        column = self.get_column(col)
+        inverse = self._inverse_operators[operator]
+        new_data = apply_operator(column, operator, value)
+        if changed_rows(column, apply_operator(new_data, inverse, value)).size > 0:
+            self.set_column(col, new_data, undolist=undolist)
+            return
+
+        column[:] = new_data
+        self.change_counter += 1
+        undolist.append(UndoInfo(self.transform_column, col, inverse, value))
         self.sig_emit('update')
 
     def get_info(self, cindex):
@@ -642,7 +1173,7 @@ class Table(Dataset):
     def get_formats(self):
         " Return a list with the column formats, e.g. ['f4','f4'] "
         rv = []
-        fields = self._array.dtype.fields
+        fields = self.get_dtype().fields
         for name in self.names:
             dt = fields[name][0]
             rv.append( '%s%d' % (dt.kind,dt.itemsize) )
@@ -659,24 +1190,62 @@ class Table(Dataset):
         if isinstance(cindex, int):
             return cindex
         elif isinstance(cindex, basestring):
-            return self._array.dtype.fields[-1].index(cindex)
+            return self.get_dtype().fields[-1].index(cindex)
     
     def get_name(self, cindex):
         " Return name of field with given name or index `cindex`. "
         if isinstance(cindex, basestring):
             return cindex
         elif isinstance(cindex, int):
-            return self._array.dtype.fields[-1][cindex]
+            return self.get_dtype().fields[-1][cindex]
 
     def get_names(self):
         " Return a list of all field names. "
-        return list(self._array.dtype.fields[-1])
+        return list(self.get_dtype().fields[-1])
     names = property(get_names)
 
          
     def get_column_dtype(self, cindex):
         name = self.get_name(cindex)
-        return self._array.dtype.fields[name][0]
+        return self.get_dtype().fields[name][0]
+
+    def create_summary(self):
+        ranges = [column_range(self.get_column(n)) for n in range(self.ncols)]
+        return DatasetSummary(self.nrows, self.formats, ranges)
+
+    def get_range(self, cindex):
+        """
+        Return tuple (min, max) of the column with the given name or
+        index `cindex` or None if the column has no numeric values.
+        This does not load the data if it is known from the project
+        archive, see get_summary.
+        """
+        return self.get_summary().ranges[self.get_index(cindex)]
+
+    def get_pyramid(self, cindex):
+        """
+        Return ColumnPyramid for the column with the given name or
+        index `cindex` or None if the column is not numeric.
+
+        The pyramid is created on first access and is kept until the
+        data changes (see change_counter), e.g. by notify_change or
+        any of the column edits.
+        """
+        self.load()
+        name = self.get_name(cindex)
+        pyramid = self._pyramids.get(name, None)
+        if pyramid is None or pyramid.counter != self.change_counter:
+            column = self.get_column(name)
+            if column.dtype.kind not in 'iuf':
+                return None
+            pyramid = ColumnPyramid(column)
+            pyramid.counter = self.change_counter
+            # drop pyramids of outdated data
+            for key, value in self._pyramids.items():
+                if value.counter != self.change_counter:
+                    del self._pyramids[key]
+            self._pyramids[name] = pyramid
+        return pyramid
 
     def rename_column(self, col, new_name, undolist=[]):
         """
@@ -700,11 +1269,605 @@ class Table(Dataset):
     
 
 
+###############################################################################
 
-   
+class ColumnTable(Table):
+
+    """
+    A Table that keeps each column in a separate contiguous array.
+
+    Adding, removing or rearranging columns only changes the list of
+    columns, so the data of the other columns is never copied.
+    get_column returns the column array itself and not a strided
+    view into a record array.
+
+    The heterogeneous record array of a Table is only assembled when
+    it is requested via get_array or the attribute `_array`, e.g. by
+    importers and exporters.  It is a copy, so changes to it have no
+    effect.  Assigning a record array to `_array` (or calling
+    set_array) splits it into columns.
+    """
+
+    def __init__(self, array=None, infos={}, columns=None):
+        """
+        Instead of a record `array`, the Table may be created from
+        `columns`, a list of tuples (name, array).  The arrays are
+        used as they are and not copied.
+        """
+        self.__dict__['_columns'] = None
+        self.__dict__['_colnames'] = []
+        self.__dict__['_nrows'] = 0
+        self._rowbuffers = None
+        Table.__init__(self, array, infos)
+        if columns is not None:
+            self.set_columns(columns)
+
+    def __getattr__(self, name):
+        if name == '_array':
+            return self.get_record_array()
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name == '_array':
+            self.set_record_array(value)
+        else:
+            self.__dict__[name] = value
+            
+    # Array ---------------------------------------------------------------
+
+    def set_columns(self, columns):
+        " Replace all columns by the list of tuples (name, array). "
+        if len(columns) > 0:
+            nrows = len(columns[0][1])
+            for name, column in columns:
+                if len(column) != nrows:
+                    raise ValueError("All columns must have the same length.")
+        else:
+            nrows = 0
+        self.__dict__['_colnames'] = [str(name) for name, column in columns]
+        self.__dict__['_columns'] = [column for name, column in columns]
+        self.__dict__['_nrows'] = nrows
+        self._rowbuffers = None
+        self.change_counter += 1
+        
+    def set_record_array(self, array):
+        if array is None:
+            self.__dict__['_columns'] = None
+            self.__dict__['_colnames'] = []
+            self.__dict__['_nrows'] = 0
+        else:
+            names = list(array.dtype.fields[-1])
+            self.set_columns([(name, numpy.array(array[name])) for name in names])
+
+    def get_record_array(self):
+        " Return a new record array with the data of all columns. "
+        if self._columns is None:
+            return None
+        a = numpy.zeros((self._nrows,), dtype=self.get_dtype())
+        for name, column in zip(self._colnames, self._columns):
+            a[name] = column
+        return a
+
+    def get_dtype(self):
+        " Return the dtype of the record array, see get_record_array. "
+        return numpy.dtype([(name, column.dtype.str)
+                            for name, column in zip(self._colnames, self._columns)])
+
+    def get_nbytes(self):
+        " Return the memory held by the columns, not counting mapped files. "
+        if self._import is not None or self._columns is None:
+            return 0
+        nbytes = 0
+        for column in self._columns:
+            if not isinstance(column, numpy.memmap):
+                nbytes += column.nbytes
+        return nbytes
+    nbytes = property(get_nbytes)
+    
+    def set_array(self, array, infos={}, undolist=[]):
+        ui = CompressedUndoInfo(self.set_array, self.get_record_array(), self._infos)
+        self.set_record_array(array)
+        self._infos = infos
+        self.change_counter += 1
+        undolist.append(ui)
+        
+        self.sig_emit('update-fields')    
+
+    array = property(Dataset.get_array, set_array)
+    
+    def new_array_from_columns(self, col, n):
+        atype = {'names': self.names[col:col+n],
+                 'formats': self.formats[col:col+n]}
+        a = numpy.zeros((self.nrows,), atype)
+        for name in a.dtype.fields[-1]:
+            a[name] = self.get_column(name)            
+        return a
+
+    def copy(self):
+        columns = [(name, column.copy())
+                   for name, column in zip(self._colnames, self._columns)]
+        return self.__class__(infos=self.infos.copy(), columns=columns)
+
+    # Value Access ---------------------------------------------------------
+
+    def get_value(self, cindex, row):
+        self.load()
+        return self._columns[self.get_index(cindex)][row]
+    
+    def set_value(self, cindex, row, value, undolist=[]):
+        col = self.get_column(cindex)
+        old_value = col[row]
+        col[row] = value
+        self.change_counter += 1
+        undolist.append(UndoInfo(self.set_value, cindex, row, old_value))
+
+    def get_row(self, row):
+        self.load()
+        a = numpy.zeros((1,), dtype=self.get_dtype())
+        for name, column in zip(self._colnames, self._columns):
+            a[name] = column[row]
+        return a[0]
+    
+    def get_region(self, row, col, height, width, cut=False):        
+        self.load()
+        formats = ','.join(self.formats[col:col+width])
+        a = numpy.zeros( (height,), formats)
+
+        names = a.dtype.fields[-1]
+        for i in range(min(width, self.ncols - col)):
+            column = self._columns[col+i]
+            a[names[i]] = column[row:row+height]
+            if cut is True:
+                column[row:row+height] = 0
+        return a
+
+    def set_region(self, row, col, array, coerce=True, undolist=[]):
+        undo_data = self.get_region(row, col, len(array), len(array.dtype.fields[-1]))
+        ul = UndoList()
+        ul.append(CompressedUndoInfo(self.set_region, row, col, undo_data))
+
+        try:
+            names = array.dtype.fields[-1]
+            for i in range(min(len(names), self.ncols - col)):
+                if coerce is True:
+                    z = self.get_column_type(col+i)(array[names[i]])
+                else:
+                    z = array[names[i]]
+                self._columns[col+i][row:row+len(array)] = z
+            self.change_counter += 1
+        except Exception, msg:
+            print "set_region failed: %s.  undoing." % msg
+            ul.execute()
+        else:            
+            undolist.append(ul)
+            
+    # Information ---------------------------------------------------------
+
+    def is_empty(self):
+        if self._import is not None:
+            return self.get_summary().nrows == 0
+        return self._columns is None or self._nrows == 0
+
+    def has_data(self):
+        return self._import is not None or self._columns is not None
+
+    def get_nrows(self):
+        if self._import is not None:
+            return self.get_summary().nrows
+        return self._nrows
+    nrows = property(get_nrows)
+    
+    def get_ncols(self): return len(self._colnames)
+    ncols = property(get_ncols)
+
+    def get_column_type(self, cindex):
+        return self.get_column_dtype(cindex).type
+
+    def get_column_dtype(self, cindex):
+        return self._columns[self.get_index(cindex)].dtype
+    
+    def get_formats(self):
+        return ['%s%d' % (column.dtype.kind, column.dtype.itemsize)
+                for column in self._columns]
+    formats = property(get_formats)
+
+    def get_formatstring(self):
+        return ','.join(self.formats)
+    formatstring = property(get_formatstring)
+
+    def get_index(self, cindex):
+        if isinstance(cindex, int):
+            return cindex
+        elif isinstance(cindex, basestring):
+            return self._colnames.index(cindex)
+    
+    def get_name(self, cindex):
+        if isinstance(cindex, basestring):
+            return cindex
+        elif isinstance(cindex, int):
+            return self._colnames[cindex]
+
+    def get_names(self):
+        return list(self._colnames)
+    names = property(get_names)
+
+    def dump(self):
+        print "ColumnTable"
+        print "  ".join(self.names)
+        print "  ".join(self.formats)
+        for row in range(self.nrows):
+            print "  ".join([str(column[row]) for column in self._columns])
+            
+    # Row Manipulation ----------------------------------------------------
+
+    def insert_n_rows(self, row, n=1, undolist=[]):
+        self.insert_rows(row, numpy.zeros((n,), dtype=self.get_dtype()), undolist=undolist)
+
+    def insert_rows(self, i, rows, undolist=[]):
+        names = rows.dtype.fields[-1]
+        columns = []
+        for j in range(self.ncols):
+            column = self._columns[j]
+            columns.append(numpy.concatenate([column[:i], rows[names[j]].astype(column.dtype), column[i:]]))
+        self.set_columns(zip(self._colnames, columns))
+        undolist.append(UndoInfo(self.remove_n_rows, i, len(rows), only_zeros=True))
+
+    def remove_n_rows(self, row, n=1, only_zeros=False, undolist=[]):
+        n = min(self.nrows-row, n)
+        if only_zeros is True:
+            undo_data = numpy.zeros((n,), dtype=self.get_dtype())
+            ui = UndoInfo(self.insert_n_rows, row, n)
+        else:
+            undo_data = self.get_region(row, 0, n, self.ncols)
+            ui = CompressedUndoInfo(self.insert_rows, row, undo_data)
+
+        columns = [numpy.concatenate([column[:row], column[row+n:]])
+                   for column in self._columns]
+        self.set_columns(zip(self._colnames, columns))
+        undolist.append(ui)
+        return undo_data
+
+    def append_rows(self, rows):
+        buffers = self._rowbuffers
+        if buffers is None:
+            buffers = [RowBuffer(column) for column in self._columns]
+            self._rowbuffers = buffers
+        names = rows.dtype.fields[-1]
+        for j in range(len(buffers)):
+            buffers[j].append(rows[names[j]])
+        self.__dict__['_columns'] = [buffer.view for buffer in buffers]
+        self.__dict__['_nrows'] += len(rows)
+        self.change_counter += 1
+
+    def trim(self):
+        if self._rowbuffers is not None:
+            self.__dict__['_columns'] = [buffer.trim() for buffer in self._rowbuffers]
+        self._rowbuffers = None
+        
+    # Column Manipulation ---------------------------------------------------------
+
+    def _rearrange(self, order):
+        names, columns = [], []
+        for index in order:
+            index = self.get_index(index)
+            names.append(self._colnames[index])
+            columns.append(self._columns[index])
+        self.set_columns(zip(names, columns))
+        self.sig_emit('update-fields')
+
+    def insert_(self, col, table, undolist=[]):
+        """
+        Insert the columns of `table` at the column `col`.  The
+        columns of a ColumnTable are taken over without copying.
+        """
+        col = self.get_index(col)
+
+        new_names = self.names[:]
+        columns = self._columns[:]
+        infos = {}
+        i = 0
+        for name in table.names:
+            new_name = utils.unique_names([name], new_names)[0]
+            new_names.insert(col+i, new_name)
+            column = table.get_column(name)
+            if not isinstance(table, ColumnTable):
+                column = numpy.array(column)
+            columns.insert(col+i, column)
+            
+            if table._infos.has_key(name):
+                infos[new_name] = table._infos[name].copy()
+            i += 1
+
+        # undo information
+        ul = UndoList()
+        self.update_infos(infos, undolist=ul)        
+        ul.append(UndoInfo(self.remove_n_columns, col, table.ncols))
+        undolist.append(ul)
+
+        self.set_columns(zip(new_names, columns))
+        self.sig_emit('update-fields')        
+
+    def remove_n_columns(self, col, n=1, undolist=[]):
+        index = self.get_index(col)
+        
+        # the removed columns are passed on to the undo table
+        removed = zip(self._colnames[index:index+n], self._columns[index:index+n])
+        undo_infos = {}
+        for name, column in removed:
+            if self._infos.has_key(name):
+                undo_infos[name] = self._infos[name].copy()
+        undo_table = self.__class__(infos=undo_infos, columns=removed)
+
+        self.set_columns(zip(self._colnames[:index] + self._colnames[index+n:],
+                             self._columns[:index] + self._columns[index+n:]))
+        undolist.append(UndoInfo(self.insert_columns, index, undo_table))
+
+        self.sig_emit("update-fields")
+        return undo_table
+
+    # Column Access ---------------------------------------------------------
+
+    def get_column_by_index(self, index):
+        " Return the column array with the given `index` (not a copy). "
+        return self._columns[index]
+
+    def get_column_by_name(self, name):
+        " Return the column array with the given `name` (not a copy). "
+        return self._columns[self._colnames.index(name)]
+
+    def set_column(self, col, array, undolist=[]):
+        self.load()
+        index = self.get_index(col)
+        old_data = self._columns[index]
+        new_data = numpy.empty(old_data.shape, dtype=old_data.dtype)
+        new_data[:] = array
+        ui = self.create_column_undo(col, old_data, new_data)
+        self._columns[index] = new_data
+        self.change_counter += 1
+        undolist.append(ui)
+        self.sig_emit('update')
+
+    def rename_column(self, col, new_name, undolist=[]):
+        index = self.get_index(col)
+        old_name = self._colnames[index]
+        self._colnames[index] = str(new_name)
+
+        # keep field infos in sync
+        if self._infos.has_key(old_name):
+            self._infos[new_name] = self._infos.pop(old_name)
+
+        undolist.append(UndoInfo(self.rename_column, index, old_name))
+        self.sig_emit('update-fields')
+        
+    
 
 ###############################################################################
 
+def map_column(filename, dtype, mode='c'):
+    """
+    Return a numpy.memmap of the file `filename`, which contains the
+    raw data of a column with the given `dtype`.  With the default
+    `mode` 'c' the file is mapped copy-on-write, i.e. the column may
+    be modified, but the changes are never written to the file.
+    """
+    dtype = numpy.dtype(dtype)
+    if os.path.getsize(filename) < dtype.itemsize:
+        # empty files cannot be mapped
+        return numpy.zeros((0,), dtype=dtype)
+    return numpy.memmap(filename, dtype=dtype, mode=mode)
+
+
+
+class MappedTable(ColumnTable):
+
+    """
+    A ColumnTable whose columns are memory mapped column files, see
+    `map_files`.
+
+    Only the parts of the columns that are actually accessed are
+    read from the files, so the Table may be larger than the
+    available memory.  The columns are mapped copy-on-write: edited
+    values are kept in memory and the files are never modified.
+    Edits that change the number of rows, as well as set_column,
+    replace the affected columns by arrays in memory.
+    """
+
+    def map_files(self, filenames, dtypes=None):
+        """
+        Replace the columns by memory maps of the given `filenames`,
+        one file per column.  The `dtypes` of the files default to
+        the current column dtypes.  All files must contain the same
+        number of rows.
+        """
+        if len(filenames) != self.ncols:
+            raise ValueError("Expected %d column files, got %d." % (self.ncols, len(filenames)))
+        if dtypes is None:
+            dtypes = [self.get_column_dtype(n) for n in range(self.ncols)]
+
+        columns = []
+        for name, filename, dtype in zip(self.names, filenames, dtypes):
+            columns.append((name, map_column(filename, dtype)))
+        self.set_columns(columns)
+
+    def is_mapped(self, cindex):
+        " Return True if the given column is still a memory mapped file. "
+        return isinstance(self.get_column(cindex), numpy.memmap)
+    
+    
+
+###############################################################################
+
+_operator_functions = {'+': numpy.add, '-': numpy.subtract,
+                       '*': numpy.multiply, '/': numpy.divide}
+
+def apply_operator(column, operator, value):
+    """
+    Return a new array with the result of `column` `operator` `value`,
+    with the same dtype as `column`.
+    """
+    return _operator_functions[operator](column, value).astype(column.dtype)
+
+
+
+###############################################################################
+
+class DatasetSummary:
+
+    """
+    Number of rows, column formats (e.g. 'f4') and value ranges of a
+    Dataset.  Each item of `ranges` is either a tuple (min, max) or
+    None if the column has no numeric values.
+
+    The `counter` is the change_counter of the Dataset at the time
+    the summary was created.
+    """
+
+    def __init__(self, nrows, formats, ranges):
+        self.nrows = nrows
+        self.formats = formats
+        self.ranges = ranges
+        self.counter = None
+
+
+def nan_less(a, b):
+    " Elementwise a < b, with nan being larger than any number. "
+    return (a < b) | (b != b)
+
+def nan_greater(a, b):
+    " Elementwise a > b, with nan being smaller than any number. "
+    return (a > b) | (b != b)
+
+
+class ColumnPyramid:
+
+    """
+    Multi-resolution min/max index of a numeric column.
+
+    Level k of the pyramid holds the row indices of the minimum and
+    of the maximum value for each block of 2**k consecutive rows.
+    Only the levels from `base` up to the top level, which consists
+    of a single block, are stored; lower levels are calculated from
+    the column on demand.  nan values are ignored, unless a block
+    contains nothing but nan values.
+
+    With the pyramid, the minimum and maximum of any row range can be
+    found in O(log(nrows)), see get_envelope.
+    """
+
+    base = 4
+    
+    def __init__(self, column):
+        self.column = column
+        self.counter = None
+
+        n = len(column)
+        self.nlevels = 0
+        while (1 << self.nlevels) < n:
+            self.nlevels += 1
+        self.nlevels += 1
+        
+        self.levels = []
+        if n == 0 or self.nlevels <= self.base:
+            return
+
+        nblocks = (n + (1 << self.base) - 1) >> self.base
+        lo, hi = self.get_blocks(self.base, numpy.arange(nblocks))
+        self.levels.append((lo, hi))
+        while len(lo) > 1:
+            lo = self.reduce(lo, nan_less)
+            hi = self.reduce(hi, nan_greater)
+            self.levels.append((lo, hi))
+
+    def reduce(self, indices, better):
+        " Combine pairs of blocks given by `indices` into one. "
+        a, b = indices[0:len(indices)-1:2], indices[1::2]
+        rv = numpy.where(better(self.column[b], self.column[a]), b, a)
+        if len(indices) % 2 == 1:
+            rv = numpy.concatenate((rv, indices[-1:]))
+        return rv
+        
+    def get_blocks(self, k, blocks):
+        """
+        Return two arrays with the row indices of the minimum and the
+        maximum value in each of the given `blocks` of level `k`.
+        """
+        if k >= self.base and len(self.levels) > 0:
+            lo, hi = self.levels[k - self.base]
+            return lo[blocks], hi[blocks]
+
+        size = 1 << k
+        column = self.column
+        rows = blocks[:,numpy.newaxis] * size + numpy.arange(size)
+        rows = numpy.minimum(rows, len(column) - 1)
+        values = column[rows]
+        nan = values != values
+        which = numpy.arange(len(blocks))
+        lo = rows[which, numpy.where(nan, numpy.inf, values).argmin(axis=1)]
+        hi = rows[which, numpy.where(nan, -numpy.inf, values).argmax(axis=1)]
+        return lo, hi
+
+    def get_envelope(self, starts, ends):
+        """
+        Return two arrays with the row indices of the minimum and the
+        maximum value in each of the row ranges [starts[i], ends[i]).
+        The ranges must not be empty.
+        """
+        column = self.column
+        i0 = numpy.array(starts, dtype=int)
+        i1 = numpy.array(ends, dtype=int)
+        lo = i0.copy()
+        hi = i0.copy()
+
+        # The ranges are split into blocks of increasing size, just
+        # like in a segment tree.  All ranges are processed at once.
+        for k in range(self.nlevels):
+            active = i0 < i1
+            if not active.any():
+                break
+            for take, blocks in ((active & (i0 % 2 == 1), i0),
+                                 (active & (i1 % 2 == 1), i1 - 1)):
+                which = numpy.flatnonzero(take)
+                if len(which) == 0:
+                    continue
+                blo, bhi = self.get_blocks(k, blocks[which])
+                lo[which] = numpy.where(nan_less(column[blo], column[lo[which]]), blo, lo[which])
+                hi[which] = numpy.where(nan_greater(column[bhi], column[hi[which]]), bhi, hi[which])
+            i0 = (i0 + 1) // 2
+            i1 = i1 // 2
+            
+        return lo, hi
+
+    def get_range(self, start=0, end=None):
+        """
+        Return tuple (min, max) of the values in the rows [start, end)
+        or None if there are no values other than nan.
+        """
+        if end is None:
+            end = len(self.column)
+        if end <= start:
+            return None
+        if start == 0 and end == len(self.column) and len(self.levels) > 0:
+            lo, hi = self.levels[-1]
+        else:
+            lo, hi = self.get_envelope([start], [end])
+        vmin, vmax = self.column[lo[0]], self.column[hi[0]]
+        if vmin != vmin:
+            return None
+        return (vmin.item(), vmax.item())
+    
+
+def column_range(column):
+    """
+    Return tuple (min, max) of the given column, ignoring any nan
+    values, or None if the column is not numeric or has no values.
+    """
+    if column.dtype.kind not in 'iuf' or len(column) == 0:
+        return None
+    if column.dtype.kind == 'f':
+        column = column[~numpy.isnan(column)]
+        if len(column) == 0:
+            return None
+    return (column.min().item(), column.max().item())
 
 
 
@@ -137,7 +137,7 @@ class Line(SPObject):
     def get_source(self):
         if self.source is None:
             raise RuntimeError("No data available")
-        self.source.get_array() # ensure that data is loaded               
+        self.source.load() # ensure that data is loaded               
         return self.source
 
     def get_x(self):
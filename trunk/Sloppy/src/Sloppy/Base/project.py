@@ -39,6 +39,13 @@ from Sloppy.Base.backend import Backend
 from Sloppy.Base import pdict, uwrap, utils, error, tree, globals
 
 
+# Limits for the undo Journal of a Project: the memory in bytes that
+# the entries may hold before they are written to disk or dropped,
+# and the maximum number of undo entries.
+JOURNAL_SIZE = 256 * 1024**2
+JOURNAL_ENTRIES = 200
+
+
 import logging
 cli_logger = logging.getLogger('cli')
 logger = logging.getLogger('Base.project')
@@ -83,8 +90,9 @@ class Project(BaseObject):
         BaseObject.__init__(self, **kwargs)
         self.sig_register('close')
         
-        self.journal = Journal()
+        self.journal = Journal(max_size=JOURNAL_SIZE, max_entries=JOURNAL_ENTRIES, spill=True)
         self._archive = None
+        self._datadir = None # see projectio.get_data_directory
 
     def close(self):
         " Close project properly. "
@@ -95,6 +103,10 @@ class Project(BaseObject):
             plot.close()
         if self._archive is not None:
             self._archive.close()
+        if self._datadir is not None:
+            rmtree(self._datadir, ignore_errors=True)
+            self._datadir = None
+        self.journal.close()
         
         # disconnect all opened backends
         for backend in self.backends:
@@ -146,6 +158,8 @@ class Project(BaseObject):
         ul.describe("Append Dataset to Project")
 
         for dataset in datasets:
+            # a Dataset that has been removed before is in use again
+            dataset.closed = False
             new_key = pdict.unique_key(self.datasets, dataset.key)
             if new_key != dataset.key:
                 uwrap.set(dataset, 'key', new_key, undolist=ul)
@@ -20,58 +20,405 @@
 
 
 
-from Sloppy.Base.dataset import Dataset, Table
+from Sloppy.Base.dataset import Dataset, Table, MappedTable, DatasetSummary
 from Sloppy.Base.project import Project
 from Sloppy.Base.objects import Legend, Axis, Plot, Layer, Line, TextLabel
 from Sloppy.Base import pdict, iohelper, error, globals, utils
 from Sloppy.Base.dataio import read_dataset_from_stream
 from Sloppy.Lib.Check import values_as_dict
+from Sloppy.Lib.Signals import HasSignals
 
 from Sloppy.Lib.ElementTree.ElementTree import ElementTree, Element, SubElement, parse
 
-import tarfile, tempfile, os, shutil
+# Use the C implementation of the parser if it is available, which
+# reads large project files considerably faster (see
+# dev/benchmarks/bench_projectio.py).  The resulting trees are the
+# same, so the rest of this module does not need to care.
+try:
+    from xml.etree.cElementTree import parse
+except ImportError:
+    try:
+        from cElementTree import parse
+    except ImportError:
+        pass
+
+import tarfile, zipfile, tempfile, os, shutil, threading
+from cStringIO import StringIO
 import numpy
 
 import logging
 logger = logging.getLogger('Base.projectio')
 
 #------------------------------------------------------------------------------
-FILEFORMAT = "0.5.2"
+FILEFORMAT = "0.5.3"
+
+# Format used for writing the Dataset files.  Tables can be written
+# either as 'CSV' (text) or as 'RAW' (binary, one file per column
+# containing the little-endian column data).
+DATASET_FORMAT = "RAW"
+
+# RAW Datasets with more than this number of bytes are loaded as
+# MappedTable, i.e. their columns are extracted from the archive
+# into the project's data directory and mapped into memory.
+MAPPED_TABLE_SIZE = 64 * 1024**2
+
+# Keyword arguments for creating new archives.  Archives larger than
+# 2 GB need the ZIP64 extensions, which are not available before
+# Python 2.5.
+ZIP_OPTIONS = {}
+if hasattr(zipfile, 'ZIP64_LIMIT'):
+    ZIP_OPTIONS['allowZip64'] = True
 
 class ParseError(Exception):
     pass
 
 
-class DatasetImporter:
+#------------------------------------------------------------------------------
+# Project Archives
+#
+# Projects are stored as zip files, so that the members can be read
+# in any order without unpacking the whole archive.  Older projects
+# are gzipped tar files, which are still supported for reading.
 
-    def __init__(self, projectname, key, destdir=None):
-        self.projectname = projectname
-        self.key = key
-        self.destdir = destdir
-           
-    def __call__(self, ds):
+class ZipArchive:
+
+    " Project archive stored as zip file. "
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self._zip = zipfile.ZipFile(filename, 'r')
+
+    def read(self, name):
+        " Return the contents of the member with the given `name`. "
+        return self._zip.read(name)
+
+    def extract(self, name, filename):
+        " Write the contents of the member `name` to the file `filename`. "
+        fd = open(filename, 'wb')
+        try:
+            if hasattr(self._zip, 'open'):
+                src = self._zip.open(name)
+                try:
+                    shutil.copyfileobj(src, fd)
+                finally:
+                    src.close()
+            else:
+                fd.write(self._zip.read(name))
+        finally:
+            fd.close()
+
+    def getsize(self, name):
+        " Return the uncompressed size of the member `name`. "
+        return self._zip.getinfo(name).file_size
+        
+    def namelist(self):
+        return self._zip.namelist()
+
+    def close(self):
+        self._zip.close()
+
+
+class TarArchive:
 
-        filename = os.path.join('datasets', utils.as_filename(self.key))
+    " Project archive stored as gzipped tar file (read-only). "
     
+    def __init__(self, filename):
+        self.filename = filename
+        self._tar = tarfile.open(filename, 'r:gz')
+
+    def read(self, name):
+        " Return the contents of the member with the given `name`. "
+        fd = self._tar.extractfile(name)
+        try:
+            return fd.read()
+        finally:
+            fd.close()
+
+    def extract(self, name, filename):
+        " Write the contents of the member `name` to the file `filename`. "
+        src = self._tar.extractfile(name)
         try:
-            archive = tarfile.open(self.projectname, 'r:gz')
-        except tarfile.ReadError:
-            logger.error('Error while opening archive "%s"' % self.projectname)
-            raise FileNotFoundError
+            fd = open(filename, 'wb')
+            try:
+                shutil.copyfileobj(src, fd)
+            finally:
+                fd.close()
+        finally:
+            src.close()
+
+    def getsize(self, name):
+        " Return the size of the member `name`. "
+        return self._tar.getmember(name).size
+
+    def namelist(self):
+        return self._tar.getnames()
+
+    def close(self):
+        self._tar.close()
+        
+
+def open_archive(filename):
+    " Return ZipArchive or TarArchive for the given project file. "
+    if zipfile.is_zipfile(filename):
+        return ZipArchive(filename)
+
+    try:
+        return TarArchive(filename)
+    except tarfile.ReadError:
+        logger.error('Error while opening archive "%s"' % filename)
+        raise IOError("Not a valid SloppyPlot archive: %s" % filename)
+    
+
+
+class DatasetImporter:
+
+    """
+    Callable that loads the data of a Table from the project's
+    archive on first access.  The archive handle in `spj._archive`
+    is opened only once and is reused for all Datasets.
 
-        if self.destdir is None:
-            tempdir = tempfile.mkdtemp(prefix="spj-temp-")
+    The location of the data is taken from the Dataset's
+    `_archive_info`, which is a tuple (path, fileformat,
+    change_counter), see `set_archive_info`.
+    """
+    
+    def __init__(self, spj):
+        self.spj = spj
+
+    def get_archive(self):
+        archive = self.spj._archive
+        if archive is None:
+            archive = open_archive(self.spj.get_filename())
+            self.spj._archive = archive
+        return archive
+           
+    def __call__(self, ds):
+        archive = self.get_archive()
+        path, fileformat, counter = ds._archive_info
+        if fileformat == 'RAW' and isinstance(ds, MappedTable):
+            map_raw_table(archive, ds, path, get_data_directory(self.spj))
+        elif fileformat == 'RAW':
+            read_raw_table(archive, ds, path)
         else:
-            tempdir = self.destdir
+            importer = globals.importer_registry['ASCII'](dataset=ds)
+            ds = importer.read_dataset_from_stream(StringIO(archive.read(path)))
+
+        # loading the data is not a modification
+        set_archive_info(ds, path, fileformat)
+        return ds
+
+    def read_summary(self, ds):
+        " Return the DatasetSummary stored in the archive or None. "
+        path, fileformat, counter = ds._archive_info
+        return read_summary(self.get_archive(), ds, path)
+
+
+
+def set_archive_info(ds, path, fileformat, counter=None):
+    """
+    Remember that the data of the Dataset `ds` is stored in the
+    project archive under `path` using the given `fileformat`.
+    The `counter` is the change_counter of the stored data and
+    defaults to the current one.
+    """
+    if counter is None:
+        counter = ds.change_counter
+    ds._archive_info = (path, fileformat, counter)
+
+def is_archived(ds, fileformat):
+    """
+    Return True if the data of the Dataset `ds` is stored unchanged
+    in the project archive using the given `fileformat`.  This is
+    always the case for Datasets that have not been loaded yet.
+    """
+    info = ds._archive_info
+    if info is None or info[1] != fileformat:
+        return False
+    return ds._import is not None or not ds.has_changes(info[2])
+
+def copy_members(source, archive, old_path, new_path, names, summary=True):
+    """
+    Copy the members of a single Dataset verbatim from the project
+    archive `source` to the zip `archive`.  The list `names` must
+    contain all member names of `source`.  The summary of the
+    Dataset is only copied if `summary` is True.
+    """
+    prefix = old_path + '/'
+    for name in names:
+        if name == old_path or name.startswith(prefix) \
+               or (summary is True and name == old_path + SUMMARY_SUFFIX):
+            write_member(archive, new_path + name[len(old_path):],
+                         lambda filename, name=name: source.extract(name, filename))
+
+def write_member(archive, name, write):
+    """
+    Add the member `name` to the zip `archive`.  The function `write`
+    must write the contents of the member to the file whose name it
+    is given.  The file is then compressed into the archive in small
+    chunks, so that large members are never kept in memory at once.
+    """
+    fd, tmpname = tempfile.mkstemp(prefix=".spj-")
+    os.close(fd)
+    try:
+        write(tmpname)
+        archive.write(tmpname, name)
+    finally:
+        os.remove(tmpname)
+
+
+
+#------------------------------------------------------------------------------
+# Dataset Summaries
+#
+# For each Dataset, the archive contains a small XML file `path`.summary
+# with the number of rows and the format and value range of each
+# column (see DatasetSummary).  This allows to answer these queries
+# without loading the data.
+#
+#  <Summary nrows="100">
+#    <Column format="f4" min="0.0" max="1.0"/>
+#    ...
+#  </Summary>
+
+SUMMARY_SUFFIX = '.summary'
+
+def write_summary(archive, summary, path):
+    """
+    Write the DatasetSummary `summary` for the Dataset stored under
+    `path` to the zip `archive`.
+    """
+    eSummary = Element('Summary')
+    eSummary.set('nrows', unicode(summary.nrows))
+    for format, limits in zip(summary.formats, summary.ranges):
+        eColumn = SubElement(eSummary, 'Column')
+        eColumn.set('format', format)
+        if limits is not None:
+            eColumn.set('min', repr(limits[0]))
+            eColumn.set('max', repr(limits[1]))
             
+    fd = StringIO()
+    ElementTree(eSummary).write(fd, encoding="utf-8")
+    archive.writestr(path + SUMMARY_SUFFIX, fd.getvalue())
+
+def read_summary(archive, tbl, path):
+    """
+    Return the DatasetSummary for the Table `tbl` stored under
+    `path` in the project `archive` or None if there is no valid
+    summary, e.g. for projects written by older versions.
+    """
+    try:
+        data = archive.read(path + SUMMARY_SUFFIX)
+    except KeyError:
+        return None
+
+    try:
+        eSummary = parse(StringIO(data)).getroot()
+        nrows = int(eSummary.attrib['nrows'])
+        formats = []
+        ranges = []
+        for eColumn in eSummary.findall('Column'):
+            formats.append(eColumn.attrib['format'])
+            if eColumn.attrib.has_key('min'):
+                ranges.append( (float(eColumn.attrib['min']), float(eColumn.attrib['max'])) )
+            else:
+                ranges.append(None)
+    except (SyntaxError, KeyError, ValueError), msg:
+        logger.warn("Invalid summary for Dataset '%s': %s" % (tbl.key, msg))
+        return None
+
+    # the summary must match the Table's columns
+    if formats != tbl.formats:
+        logger.warn("Summary for Dataset '%s' does not match the columns." % tbl.key)
+        return None
+
+    return DatasetSummary(nrows, formats, ranges)
+
+
+
+#------------------------------------------------------------------------------
+# Binary Table I/O (fileformat 'RAW')
+
+def raw_dtype(dtype):
+    " Return the byte order independent dtype used for RAW columns. "
+    return numpy.dtype(dtype).newbyteorder('<')
+
+def raw_columns(tbl):
+    """
+    Return a list with contiguous copies of all columns of the
+    Table `tbl`, converted to the dtypes used for RAW columns.
+    """
+    columns = []
+    for n in range(tbl.ncols):
+        column = tbl.get_column(n)
+        columns.append(numpy.array(column, dtype=raw_dtype(column.dtype)))
+    return columns
+    
+def write_raw_columns(archive, columns, path):
+    """
+    Write the given `columns` (see `raw_columns`) to the zip
+    `archive`.  Each column is stored in a separate member named
+    after its index, i.e. `path`/0, `path`/1, ...
+    """
+    for n in range(len(columns)):
+        write_member(archive, '%s/%d' % (path, n), columns[n].tofile)
+
+def read_raw_table(archive, tbl, path):
+    """
+    Read the columns of the Table `tbl` from the member directory
+    `path` of the project `archive`.  The Table must already have
+    the correct columns, but may be empty.
+    """
+    columns = []
+    for n in range(tbl.ncols):
+        data = archive.read('%s/%d' % (path, n))
+        dt = raw_dtype(tbl.get_column_dtype(n))
+        columns.append(numpy.fromstring(data, dtype=dt))
+
+    if len(columns) > 0:
+        nrows = len(columns[0])
+    else:
+        nrows = 0
+    a = numpy.zeros((nrows,), dtype=tbl.get_dtype())
+    for name, column in zip(tbl.names, columns):
+        a[name] = column
+    tbl._array = a
+
+def raw_table_size(archive, path, ncols):
+    " Return the number of bytes of the `ncols` RAW columns under `path`. "
+    size = 0
+    for n in range(ncols):
         try:
-            archive.extract(filename, tempdir)
-            importer = globals.importer_registry['ASCII'](dataset=ds)
-            return importer.read_dataset_from_file(os.path.join(tempdir, filename))
-        finally:
-            if self.destdir is None:
-                shutil.rmtree(tempdir)
-            archive.close()
+            size += archive.getsize('%s/%d' % (path, n))
+        except KeyError:
+            return None
+    return size
+
+def get_data_directory(spj):
+    """
+    Return the directory for the column files of the MappedTables of
+    the project `spj`.  It is created on first use and removed when
+    the project is closed.
+    """
+    if spj._datadir is None:
+        spj._datadir = tempfile.mkdtemp(prefix="spj-data-")
+    return spj._datadir
+
+def map_raw_table(archive, tbl, path, destdir):
+    """
+    Extract the columns of the MappedTable `tbl` from the member
+    directory `path` of the project `archive` into `destdir` and map
+    them into memory.  The columns are extracted only once, when the
+    Table is loaded.
+    """
+    dirname = tempfile.mkdtemp(prefix=utils.as_filename(tbl.key) + '-', dir=destdir)
+    filenames = []
+    dtypes = []
+    for n in range(tbl.ncols):
+        filename = os.path.join(dirname, str(n))
+        archive.extract('%s/%d' % (path, n), filename)
+        filenames.append(filename)
+        dtypes.append(raw_dtype(tbl.get_column_dtype(n)))
+    tbl.map_files(filenames, dtypes)
 
         
 #------------------------------------------------------------------------------
@@ -81,6 +428,7 @@ class DatasetImporter:
 def new_table(spj, element):
 
     # Create field infos
+    names = []
     formats = []
     info_dict = {}
     for eColumn in element.findall('Column'):        
@@ -90,6 +438,7 @@ def new_table(spj, element):
         except KeyError:
             logger.warn("Could not get column name; using default name instead.")
             name = utils.unique_names(['col'], info_dict.keys())
+        names.append(name)
         
         # format
         try:
@@ -109,9 +458,26 @@ def new_table(spj, element):
         info_dict[name] = info
         
         
+    # table key is essential
+    try:
+        key = element.attrib['key']
+    except KeyError:
+        logger.warn("Could not get table key. Using generic key instead.")
+        key = pdict.unique_key(spj.datasets, 'dataset')
+    path = 'datasets/%s' % utils.as_filename(key)
+    fileformat = element.attrib.get('fileformat', 'CSV')
+
+    # Large binary tables are mapped into memory instead of being read.
+    table_class = Table
+    if fileformat == 'RAW' and spj._archive is not None:
+        size = raw_table_size(spj._archive, path, len(names))
+        if size is not None and size > MAPPED_TABLE_SIZE:
+            table_class = MappedTable
+
     # create table with given format and infos, but w/o any rows
-    a = numpy.zeros((0,), {'names':info_dict.keys(), 'formats':formats})
-    tbl = Table(a, info_dict)
+    a = numpy.zeros((0,), {'names':names, 'formats':formats})
+    tbl = table_class(a, info_dict)
+    tbl.key = key
 
     # node info
     for eItem in element.findall('NodeInfo/Item'):
@@ -126,20 +492,11 @@ def new_table(spj, element):
         if value is not None:
             tbl.node_info.metadata[key] = value
 
-
-    # table key is essential
-    try:
-        key = element.attrib['key']
-    except KeyError:
-        logger.warn("Could not get table key. Using generic key instead.")
-        key = pdict.unique_key(spj.datasets, 'dataset')
-    tbl.key = key
-
-
     # Right now, the Table is still empty. By setting this callback
     # for the _import attribute, the dataset is loaded from the hard
     # disk on the next access.
-    tbl._import = DatasetImporter(spj.get_filename(), tbl.key)
+    set_archive_info(tbl, path, fileformat)
+    tbl._import = DatasetImporter(spj)
     return tbl
         
 
@@ -248,10 +605,14 @@ def fromTree(spj, tree):
     while (version is not None and version != FILEFORMAT):
         if version=='0.5':
             # Datasets.Table.Column.Info -> Datasets.Table.Column.Attribute
-            for element in eRoot.findall('Datasets/Table/Column/Info'):
+            for element in eProject.findall('Datasets/Table/Column/Info'):
                 element.tag = 'Attribute'            
             version = raise_version('0.5.2')
             continue
+        if version=='0.5.2':
+            # Datasets.Table may now use fileformat 'RAW'; nothing to convert
+            version = raise_version('0.5.3')
+            continue
         raise IOError("Invalid Sloppy File Format Version %s. Aborting Import." % version)
 
     # load datasets
@@ -270,7 +631,12 @@ def fromTree(spj, tree):
 # Writing objects to ElementTree Elements
 
 
-def toElement(project):
+def toElement(project, dataset_format=DATASET_FORMAT, pretty=False):
+    """
+    Return the XML description of the `project` as Element.  If
+    `pretty` is True, then newlines are inserted to make the XML
+    readable, which takes noticeably longer for large projects.
+    """
 
     def SIV(element, key, value):        
         " Set If Valid -- only set element attribute if value is not None. "
@@ -285,7 +651,7 @@ def toElement(project):
     eData = SubElement(eProject, "Datasets")
     for ds in project.datasets:
         
-        if ds._array is None:
+        if not ds.has_data():
             logger.error("Empty Dataset: %s. NOT SAVED." % ds.key)
             continue
 
@@ -312,7 +678,7 @@ def toElement(project):
             # general information (should be there for any other kind of
             # Dataset as well)
             SIV(eTable, 'key', ds.key)
-            SIV(eTable, 'fileformat', 'CSV' )
+            SIV(eTable, 'fileformat', dataset_format)
 
             # write node information
             node_items = tbl.node_info._checks.keys()
@@ -401,7 +767,8 @@ def toElement(project):
                     iohelper.set_attributes(eLabel, attrs)
                     eLabel.text = label.get('text')
 
-    iohelper.beautify_element(eProject)
+    if pretty is True:
+        iohelper.beautify_element(eProject)
         
     return eProject
 
@@ -413,78 +780,207 @@ def toElement(project):
 
 #------------------------------------------------------------------------------
 
-def save_project(spj, filename=None, path=None):
+class ProjectWriter(HasSignals):
+
     """
-    Write the whole project to a file.  Return True on success.
-    
-    The archive that is created is a gzipped tar file containing
-    the XML file with the project info and additionally the data
-    files containing the information from the current Dataset
-    objects.
+    Writes a project to a zip archive.
+
+    The constructor takes a snapshot of the project: The XML
+    description is created and the data of all modified Datasets is
+    copied.  Datasets that have not changed since they were last
+    saved (including Datasets that have never been loaded) are later
+    copied verbatim from the previous archive.
+
+    The actual writing is done by `write`, which only works on the
+    snapshot and may therefore run in a separate thread, see `start`.
+    The archive is written to a temporary file, which then replaces
+    the target file, so that the target is never left half-written.
+    Afterwards `finish` must be called from the main thread to update
+    the project.  The XML description is only indented if `pretty`
+    is True, see toElement.
+
+    Signals:
+      finished (writer) -- emitted by `run` after a successful write
+      error (writer, msg) -- emitted by `run` if writing failed
+
+    Both signals are emitted from the thread that runs the writer.
     """
-
-    #
-    # write project XML file
-    #
-
-    tempdir = tempfile.mkdtemp(prefix="spj-export-")
-    filename = filename or spj.filename
-    if filename is None:
-        raise RuntimeError("No valid filename specified.")                                              
-
-    try:
-        projectfile = os.path.join( tempdir,'project.xml' )
-        e = toElement(spj)
-
-        fd = open(projectfile, 'w')
-        fd.write('<?xml version="1.0" encoding="utf-8"?>\n')
-        ElementTree(e).write(fd, encoding="utf-8")
-        fd.close()
-
-        #
-        # now add all extra information to the tempdir
-        # (Datasets and other files)
-        #
-
-        # add Dataset files to tempdir
-        exporter_ascii = globals.exporter_registry['CSV']()
+    
+    def __init__(self, spj, filename=None, path=None, dataset_format=DATASET_FORMAT,
+                 pretty=False):
+        HasSignals.__init__(self)
+        self.sig_register('finished')
+        self.sig_register('error')
         
-        dsdir = os.path.join(tempdir, 'datasets')
-        os.mkdir(dsdir)
+        filename = filename or spj.filename
+        if filename is None:
+            raise RuntimeError("No valid filename specified.")                                              
+        if path is not None:
+            filename = os.path.join(path, os.path.basename(filename))
+
+        self.spj = spj
+        self.filename = os.path.abspath(filename)
+        self.dataset_format = dataset_format
+        self.thread = None
+
+        # the project is only unmodified after saving if the journal
+        # has not changed since the snapshot, see `is_current`
+        self.journal_counter = spj.journal.change_counter
+        
+        # project XML file
+        fd = StringIO()
+        fd.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        ElementTree(toElement(spj, dataset_format=dataset_format, pretty=pretty)).write(fd, encoding="utf-8")
+        self.xml = fd.getvalue()
+
+        # previous archive, from which unchanged Datasets are copied
+        if spj._archive is not None:
+            self.source = spj._archive.filename
+        elif spj.filename is not None and os.path.exists(spj.filename):
+            self.source = spj.filename
+        else:
+            self.source = None
+
+        # Snapshot of the Datasets.  Each item is a tuple
+        # (ds, path, change_counter, summary, action, data), where
+        # action is one of 'copy' (data = old path), 'RAW' (data =
+        # columns) or 'CSV' (data = copy of the Dataset).  The
+        # summary is None for Datasets that have not been loaded;
+        # their summary is copied from the previous archive.
+        self.items = []
         for ds in spj.datasets:
-            try:
-                ds.get_array()
-                dspath = os.path.join(dsdir, utils.as_filename(ds.key))
-                exporter_ascii.write_to_file(dspath, ds)                
-            except AttributeError:
-                logger.error("Error while writing Dataset '%s'" % ds.key)
-                raise
-            except error.NoData:
-                logger.error("Warning, empty Dataset -- no data file written.")
-
-        #
-        # create tar archive from tempdir
-        #
+            dspath = 'datasets/%s' % utils.as_filename(ds.key)
+            if self.source is not None and is_archived(ds, dataset_format):
+                item = ('copy', ds._archive_info[0])
+            else:
+                try:
+                    ds.load()
+                except error.NoData:
+                    logger.error("Warning, empty Dataset -- no data file written.")
+                    continue
+                if dataset_format == 'RAW':
+                    item = ('RAW', raw_columns(ds))
+                else:
+                    item = ('CSV', ds.copy())
+            if ds._import is None:
+                summary = ds.get_summary()
+            else:
+                summary = None
+            self.items.append( (ds, dspath, ds.change_counter, summary) + item )
+
+    def start(self):
+        " Run the writer in a new thread. "
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def run(self):
+        " Write archive and report the result via the Signals. "
+        try:
+            self.write()
+        except Exception, msg:
+            logger.error("Error while writing '%s': %s" % (self.filename, msg))
+            self.sig_emit('error', self, msg)
+        else:
+            self.sig_emit('finished', self)
+            
+    def write(self):
+        " Write the snapshot to the target file. "        
+        filename = self.filename
+        
+        source = None
+        if self.source is not None:
+            for (ds, dspath, counter, summary, action, data) in self.items:
+                if action == 'copy':
+                    # the writer might run in a separate thread, so
+                    # we may not share the project's archive handle
+                    source = open_archive(self.source)
+                    source_names = source.namelist()
+                    break
+
+        fd, tmpname = tempfile.mkstemp(prefix=".spj-", dir=os.path.dirname(filename))
+        os.close(fd)
         try:
-            archive = None
             try:
-                if path is not None:
-                    filename = os.path.join(path, os.path.basename(filename))
                 logger.info("Writing archive '%s'" % filename)
-                archive = tarfile.open(filename, mode="w:gz")
-                archive.add( tempdir, '' )
-            except IOError,(nr, msg):
+                archive = zipfile.ZipFile(tmpname, 'w', zipfile.ZIP_DEFLATED, **ZIP_OPTIONS)
+            except IOError, (nr, msg):
                 raise error.SloppyError('Error while creating archive "%s": %s' % (filename, msg))
-                return False
 
-        finally:
-            if archive is not None:
+            try:
+                archive.writestr('project.xml', self.xml)
+
+                exporter_ascii = globals.exporter_registry['CSV']()
+                for (ds, dspath, counter, summary, action, data) in self.items:
+                    if action == 'copy':
+                        logger.debug("Dataset '%s' unchanged, copying it." % ds.key)
+                        copy_members(source, archive, data, dspath, source_names,
+                                     summary=summary is None)
+                    elif action == 'RAW':
+                        write_raw_columns(archive, data, dspath)
+                    else:
+                        fd = StringIO()
+                        exporter_ascii.write_to_stream(fd, data)
+                        archive.writestr(dspath, fd.getvalue())
+                    if summary is not None:
+                        write_summary(archive, summary, dspath)
+            finally:
                 archive.close()
-    finally:
-        logger.debug("Removing directory %s" % tempdir)
-        shutil.rmtree(tempdir)
+                if source is not None:
+                    source.close()
+        except:
+            os.remove(tmpname)
+            raise
+                
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmpname)
+            if os.name != 'posix':
+                os.remove(filename) # rename does not replace files on Windows
+        os.rename(tmpname, filename)
+
+        logger.debug("Finished writing '%s'" % filename)
+
+    def is_current(self):
+        """
+        Return True if the project has not been modified since the
+        snapshot was taken.
+        """
+        return not self.spj.journal.has_changes(self.journal_counter)
+        
+    def finish(self):
+        """
+        Update the project after the archive has been written.
+        If the project's own archive has been replaced, then the
+        handle to the previous archive is replaced as well.
+        """
+        spj = self.spj
+        if spj.filename is None or os.path.abspath(spj.filename) != self.filename:
+            return
+
+        if spj._archive is not None:
+            spj._archive.close()
+        spj._archive = open_archive(self.filename)
+        for (ds, dspath, counter, summary, action, data) in self.items:
+            set_archive_info(ds, dspath, self.dataset_format, counter)
+
         
-    logger.debug("Finished writing '%s'" % filename)
+        
+def save_project(spj, filename=None, path=None, dataset_format=DATASET_FORMAT,
+                 pretty=False):
+    """
+    Write the whole project to a file.  Return True on success.
+    
+    The archive that is created is a zip file containing the XML
+    file with the project info and additionally the data files
+    containing the information from the current Dataset objects.
+    The `dataset_format` may be either 'RAW' or 'CSV'.  If `pretty`
+    is True, then the XML file is indented for human readers.
+
+    See ProjectWriter for details and for saving in the background.
+    """
+    writer = ProjectWriter(spj, filename=filename, path=path, dataset_format=dataset_format,
+                           pretty=pretty)
+    writer.write()
+    writer.finish()
     return True
 
 
@@ -498,27 +994,24 @@ def load_project(filename):
     >>> load_project("zno.spj")
     """
     
-    try:
-        archive = tarfile.open(filename,'r:gz')
-    except tarfile.ReadError:
-        logger.error('Error while opening archive "%s"' % filename)
-        raise FileNotFoundError
+    archive = open_archive(filename)
 
     logger.debug("Creating project from project.xml")
         
     # Create Project from file
     try:
-        projectfile = archive.extractfile("project.xml")
+        projectfile = StringIO(archive.read("project.xml"))
         # project filename must be set _before_ fromTree,
         # because any importer that is set up therein
         # must know the project filename!
         project = Project()
         project.filename = filename 
+        # the archive is also needed to decide which Datasets to map
+        # into memory, and it is kept so that it can be closed later on
+        project._archive = archive
         fromTree( project, parse(projectfile) )
     except:
+        archive.close()
         raise
 
-    # remember the archive so that it can be closed later on
-    project._archive = archive
-
     return project  
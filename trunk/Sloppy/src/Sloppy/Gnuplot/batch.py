@@ -0,0 +1,236 @@
+# This file is part of SloppyPlot, a scientific plotting tool.
+# Copyright (C) 2005 Niklas Volbers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# $HeadURL$
+# $Id$
+
+
+"""
+Headless batch rendering of plots to files with a pool of gnuplot
+processes.
+
+Each worker thread owns a gnuplot Backend, i.e. a long-lived gnuplot
+process, and renders one plot after the other.  Building the gnuplot
+commands (which may load the Datasets of a project) is serialized,
+while the actual rendering runs in parallel in the gnuplot processes.
+
+>>> results = render_files(['a.spj', 'b.spj'], destdir='/tmp/plots')
+"""
+
+
+import os, threading, Queue
+
+from Sloppy.Base import globals
+from Sloppy.Base.projectio import load_project
+from Sloppy.Gnuplot.terminal import PostscriptTerminal
+
+import logging
+logger = logging.getLogger('Gnuplot.batch')
+
+
+#------------------------------------------------------------------------------
+
+def cpu_count():
+    " Return the number of processors or 1 if it cannot be determined. "
+    try:
+        return max(1, int(os.sysconf('SC_NPROCESSORS_ONLN')))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
+
+
+class RenderJob:
+
+    """
+    A plot of a project that should be rendered into `filename`.
+    After rendering, `error` holds an error message or None and
+    `output` the output lines that gnuplot returned.
+    """
+
+    def __init__(self, project, plot, filename):
+        self.project = project
+        self.plot = plot
+        self.filename = filename
+        self.error = None
+        self.output = []
+
+
+
+class RenderPool:
+
+    """
+    Pool of `size` worker threads, each with its own gnuplot process.
+    All plots are rendered with the given `terminal`, by default a
+    PostscriptTerminal in eps mode.
+
+    Jobs are added via `render` and run as soon as a worker is
+    available.  A project that is passed to `close_when_done` is
+    closed as soon as its last job is done.  `join` waits until all
+    jobs are done and stops the workers.
+    """
+
+    def __init__(self, size=None, terminal=None):
+        self.size = size or cpu_count()
+        self.terminal = terminal or PostscriptTerminal(mode='eps')
+
+        self.jobs = Queue.Queue()
+        self.done = []
+        self.lock = threading.Lock()
+
+        # key: project, value: number of jobs that are not done yet
+        self.pending = {}
+        self.closing = []
+
+        self.threads = []
+        for i in range(self.size):
+            thread = threading.Thread(target=self.work)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def render(self, project, plot, filename):
+        " Add a job to render `plot` of `project` into `filename`. "
+        job = RenderJob(project, plot, filename)
+        self.lock.acquire()
+        try:
+            self.pending[project] = self.pending.get(project, 0) + 1
+        finally:
+            self.lock.release()
+        self.jobs.put(job)
+        return job
+
+    def close_when_done(self, project):
+        """ Close the `project` as soon as all of its jobs are done,
+        i.e. right away if there are none. """
+        self.lock.acquire()
+        try:
+            if self.pending.has_key(project):
+                self.closing.append(project)
+            else:
+                project.close()
+        finally:
+            self.lock.release()
+
+    def join(self):
+        " Wait for all jobs, stop the workers and return the list of jobs. "
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return self.done
+
+    def work(self):
+        " Worker thread. "
+        backend = None
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                try:
+                    if backend is None:
+                        backend = globals.BackendRegistry['gnuplot'](
+                            project=job.project, plot=job.plot,
+                            terminal=self.terminal)
+                    self.run_job(backend, job)
+                except Exception, msg:
+                    logger.error("Could not render plot '%s': %s" % (job.plot.key, msg))
+                    job.error = str(msg)
+                self.lock.acquire()
+                try:
+                    self.done.append(job)
+                    self.finish_job(job)
+                finally:
+                    self.lock.release()
+        finally:
+            if backend is not None:
+                backend.disconnect()
+
+    def finish_job(self, job):
+        # must be called with the lock held
+        project = job.project
+        self.pending[project] -= 1
+        if self.pending[project] == 0:
+            del self.pending[project]
+            if project in self.closing:
+                self.closing.remove(project)
+                project.close()
+
+    def run_job(self, backend, job):
+        # Only one thread at a time builds commands, because this
+        # accesses the (possibly not yet loaded) Datasets.
+        self.lock.acquire()
+        try:
+            try:
+                backend.set(job.project, job.plot)
+                backend.options['filename'] = job.filename
+                backend.send(['reset'])
+                backend.draw()
+                backend.disconnect_updates()
+            finally:
+                # Once the commands are sent, the project is no longer
+                # needed and may be closed while gnuplot renders.
+                backend.set(None, None)
+        finally:
+            self.lock.release()
+
+        # Switching the output closes the file; this also waits
+        # until gnuplot has rendered the plot.
+        output = backend('set output')
+        if output is None:
+            raise RuntimeError("gnuplot terminated unexpectedly.")
+
+        for cmd, result in backend.history:
+            if result:
+                job.output.extend(result)
+        backend.history = []
+
+
+
+#------------------------------------------------------------------------------
+
+def render_files(filenames, destdir=None, size=None, terminal=None):
+    """
+    Render all plots of the given project files into `destdir` (by
+    default the directory of each project) using a RenderPool with
+    `size` workers.  If more than one file is given, the names of the
+    output files are prefixed with the name of the project file.
+    Each project is closed as soon as all of its plots are rendered.
+    Returns the list of RenderJobs.
+    """
+    pool = RenderPool(size=size, terminal=terminal)
+    try:
+        for filename in filenames:
+            logger.info("Loading %s" % filename)
+            project = load_project(filename)
+            try:
+                if len(filenames) > 1:
+                    prefix = os.path.splitext(os.path.basename(filename))[0] + '-'
+                else:
+                    prefix = ''
+
+                for plot in project.plots:
+                    outfile = pool.terminal.build_filename(pool.terminal.mode, project, plot,
+                                                           destdir=destdir, prefix=prefix)
+                    pool.render(project, plot, os.path.abspath(outfile))
+            finally:
+                pool.close_when_done(project)
+    finally:
+        jobs = pool.join()
+
+    return jobs
@@ -0,0 +1,188 @@
+# This file is part of SloppyPlot, a scientific plotting tool.
+# Copyright (C) 2005 Niklas Volbers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# $HeadURL$
+# $Id$
+
+
+"""
+Asynchronous command channel to a gnuplot process.
+
+Commands are sent in batches: all commands of a batch, each followed
+by a command that prints a numbered end marker, are written to the
+pipe at once.  A reader thread splits the output of gnuplot at the
+end markers and hands the results over to the caller.
+"""
+
+
+import threading, Queue, re
+from collections import deque
+
+import logging
+logger = logging.getLogger('Gnuplot.channel')
+
+
+#------------------------------------------------------------------------------
+
+END_MARKER = "<--END-%d-->"
+end_marker_regexp = re.compile(r"^<--END-(\d+)-->$")
+
+
+
+class Request:
+
+    """
+    A command sent to gnuplot.  Once gnuplot has processed the
+    command, `result` holds the list of output lines and `done` is
+    set.  If gnuplot terminates before, the result is None.
+    """
+
+    def __init__(self, id, cmd):
+        self.id = id
+        self.cmd = cmd
+        self.result = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.done.isSet()
+
+
+
+class CommandChannel:
+
+    """
+    Connection to the gnuplot `process`, whose stdout and stderr
+    should both be connected to a pipe.
+
+    `send` returns immediately.  The finished requests are put into
+    the queue `results` in the order in which they were sent, and the
+    optional function `notify` is called from the reader thread after
+    each finished request.
+    """
+
+    def __init__(self, process, encoding, notify=None):
+        self.process = process
+        self.encoding = encoding
+        self.notify = notify
+
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.pending = deque()
+        self.results = Queue.Queue()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.read)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def send(self, commands):
+        """
+        Send all `commands` with a single write.  Each item is a
+        tuple (cmd, data), where `data` is None or a list of strings
+        with inline data that is written right after the command.
+        Returns the list of Request objects.
+        """
+        requests = []
+        buffer = []
+        self.lock.acquire()
+        try:
+            for cmd, data in commands:
+                self.counter += 1
+                request = Request(self.counter, cmd)
+                requests.append(request)
+
+                buffer.append(cmd.encode(self.encoding) + "\n")
+                if data is not None:
+                    buffer.extend(data)
+                buffer.append("print '%s'\n" % (END_MARKER % request.id))
+
+            if self.closed is True:
+                for request in requests:
+                    request.done.set()
+                return requests
+
+            self.pending.extend(requests)
+        finally:
+            self.lock.release()
+
+        # If gnuplot has died, the reader thread finishes the requests.
+        try:
+            self.process.stdin.write("".join(buffer))
+            self.process.stdin.flush()
+        except IOError, msg:
+            logger.error("Could not write to gnuplot: %s" % msg)
+
+        return requests
+
+    def read(self):
+        " Reader thread. "
+        stdout = self.process.stdout
+        lines = []
+        while True:
+            line = stdout.readline()
+            if len(line) == 0:
+                break
+
+            match = end_marker_regexp.match(line.rstrip("\r\n"))
+            if match is None:
+                lines.append(line)
+                continue
+
+            self.lock.acquire()
+            try:
+                request = self.pending.popleft()
+            finally:
+                self.lock.release()
+
+            if request.id != int(match.group(1)):
+                logger.error("gnuplot output is out of sync: expected marker %d, got %s."
+                             % (request.id, match.group(1)))
+            request.result = lines
+            lines = []
+            self.finish(request)
+
+        # gnuplot has terminated
+        self.lock.acquire()
+        try:
+            self.closed = True
+            requests = list(self.pending)
+            self.pending.clear()
+        finally:
+            self.lock.release()
+
+        for request in requests:
+            self.finish(request)
+
+    def finish(self, request):
+        self.results.put(request)
+        request.done.set()
+        if self.notify is not None:
+            self.notify()
+
+    def wait(self, timeout=None):
+        " Wait until all requests sent so far are finished. "
+        self.lock.acquire()
+        try:
+            requests = list(self.pending)
+        finally:
+            self.lock.release()
+
+        for request in requests:
+            if request.wait(timeout) is False:
+                return False
+        return True
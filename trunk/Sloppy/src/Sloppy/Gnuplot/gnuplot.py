@@ -26,7 +26,7 @@ Gnuplot Backend
 
 
 from subprocess import Popen, PIPE, STDOUT
-import string, tempfile, os, shutil
+import string, tempfile, os, shutil, Queue
 
 import logging
 logger = logging.getLogger('Gnuplot.gnuplot')
@@ -37,6 +37,9 @@ from Sloppy.Base import utils, backend
 from Sloppy.Lib.Check import Undefined
 
 from Sloppy.Gnuplot.terminal import XTerminal, DumbTerminal, PostscriptTerminal
+from Sloppy.Gnuplot.channel import CommandChannel
+
+import numpy
 
 
 """
@@ -52,20 +55,67 @@ queue.append( adict, key, cmd, unset_cmd )
 """
 
 
+class InlineCommand:
+
+    """
+    gnuplot command that is followed by inline data.  `blocks` is a
+    list of strings with the binary data for each '-' source in the
+    command, in the same order.
+    """
+    
+    def __init__(self, cmd, blocks):
+        self.cmd = cmd
+        self.blocks = blocks
+
+    def __str__(self):
+        return self.cmd
+    
+
+
 class Backend(backend.Backend):
 
+    """
+    The option 'data_transfer' determines how the data of the lines
+    is passed to gnuplot:
+
+      'binary' -- the x and y columns of each line are written as
+                  binary file into the temporary directory (default).
+                  The files are only rewritten if the Dataset has
+                  changed, see write_binary_data.
+      'inline' -- the x and y columns of each line are sent as inline
+                  binary data through the gnuplot pipe.  Since
+                  'replot' cannot repeat inline data, every update
+                  sends the data of all lines again.
+      'ascii'  -- each Dataset is exported as CSV file into the
+                  temporary directory and gnuplot reads the files.
+
+    After the first draw, only changed commands are sent, see
+    update_dirty.  `command_count` holds the number of commands sent
+    so far.
+
+    Commands are sent through a CommandChannel.  Calling the Backend
+    with a command blocks until gnuplot has answered, while `send`
+    and `execute` return immediately.  In both cases the signal
+    'gnuplot-finish-cmd' is emitted for each finished command, either
+    from the event loop or, if there is none, on the next call of
+    `wait`.
+    """
+    
     tmpdir = None  
     tmpfiles = []  # list of files that have been created by this class
 
     def init(self):
         self.encoding = self.options.get('encoding', 'iso_8859_15')
         self.window_title = "gnuplot-%s" % id(self)
+        self.data_transfer = self.options.get('data_transfer', 'binary')
         self.current_dir = None
 
         self.tmpdir = tempfile.mkdtemp(prefix="spl-gp-")
         self.tmpfiles = []
         # key: ds, value = (filename, change_counter_on_last_save)
         self.exports = {}
+        # key: filename, value = (ds, change_counter_on_last_save)
+        self.binary_files = {}
 
         # X-perimental
         self.layer_to_axes = {}
@@ -82,6 +132,14 @@ class Backend(backend.Backend):
 
         self.sig_register('gnuplot-send-cmd')
         self.sig_register('gnuplot-finish-cmd')
+
+        # incremental updates
+        self.dirty = {}
+        self.owners = {}
+        self.update_cblist = []
+
+        # number of commands sent to gnuplot
+        self.command_count = 0
         
     
     def connect(self):
@@ -100,21 +158,19 @@ class Backend(backend.Backend):
             cmd_list[0] += ' -persist'
                    
 	p = Popen(cmd_list,shell=True,stdin=PIPE,stdout=PIPE,stderr=STDOUT,close_fds=False )
-	(self.gpwrite,self.gpout) = (p.stdin, p.stdout)
         self.process = p
         self.history = list()
+        self.channel = CommandChannel(p, self.encoding, notify=self.schedule_dispatch)
 
         logger.debug("gnuplot.py: creating tempfile: %s" % self.tmpdir)
         backend.Backend.connect(self)
 
     def disconnect(self):
         logger.debug("Closing gnuplot session.")
-        try:
-            # closing gnuplot will cause an IOError, since gpwrite won't
-            # be able to write any more.
-            self("exit")
-        except IOError:
-            pass
+        self.disconnect_updates()
+        
+        # closing gnuplot finishes all pending requests
+        self("exit")
 
         try:
             shutil.rmtree(self.tmpdir)
@@ -149,30 +205,56 @@ class Backend(backend.Backend):
 
 
         
-    def __call__(self, cmd):
-        """Send string to gnuplot"""
-
-        encoded_cmd = cmd.encode( self.encoding )
-        self.gpout.flush()
-        self.sig_emit('gnuplot-send-cmd', cmd=cmd)
-        self.gpwrite.write(encoded_cmd + "\n")
-        self.gpwrite.write("print '<--END-->'\n")
-        self.gpwrite.flush()
-
-        result = []
-        while result[-1:] != ["<--END-->\n"]:
-            if self.process.poll() is not None:                
-                break
-            result.append( self.gpout.readline() )
+    def __call__(self, cmd, data=None):
+        """
+        Send string to gnuplot and wait for the result.  The optional
+        list `data` contains the inline data for each '-' source in
+        the command.  Returns the list of output lines or None, if
+        gnuplot has terminated.
+        """
+        request = self.send([(cmd, data)])[0]
+        request.wait()
+        self.dispatch_results()
+        return request.result
 
-        if len(result) == 0:
-            result = None
-        elif result[-1:] == ["<--END-->\n"]:
-            result = result[:-1]
-            
-        self.history.append( (encoded_cmd, result) )
-        self.sig_emit('gnuplot-finish-cmd', cmd=cmd, result=result)
-        return result
+    def send(self, commands):
+        """
+        Send the list of `commands` to gnuplot in one batch and
+        return immediately.  Each item is either a string or a tuple
+        (cmd, data), see __call__.  Returns the list of Requests.
+        """
+        items = []
+        for item in commands:
+            if isinstance(item, basestring):
+                item = (item, None)
+            self.sig_emit('gnuplot-send-cmd', cmd=item[0])
+            items.append(item)
+        self.command_count += len(items)
+        return self.channel.send(items)
+
+    def wait(self, timeout=None):
+        """
+        Wait until gnuplot has processed all commands sent so far and
+        emit 'gnuplot-finish-cmd' for them.  Returns False if the
+        `timeout` (in seconds) expired.
+        """
+        rv = self.channel.wait(timeout)
+        self.dispatch_results()
+        return rv
+
+    def schedule_dispatch(self):
+        # called from the reader thread of the channel
+        backend.run_when_idle(self.dispatch_results)
+        
+    def dispatch_results(self):
+        " Emit 'gnuplot-finish-cmd' for all finished commands. "
+        while True:
+            try:
+                request = self.channel.results.get_nowait()
+            except Queue.Empty:
+                break
+            self.history.append( (request.cmd, request.result) )
+            self.sig_emit('gnuplot-finish-cmd', cmd=request.cmd, result=request.result)
             
 
     def getvar(self,var,convert_method=string.atof):
@@ -191,9 +273,11 @@ class Backend(backend.Backend):
 	>>> go.getvar("a", None) # no conversion -> returns String
         """
         self(" set print \"-\"\n")      # print output to stdout
-        self(" if (defined(%s)) print %s ; else print \"None\" \n" % (var,var))
-        result=self.gpout.readline()
+        result = self(" if (defined(%s)) print %s ; else print \"None\" \n" % (var,var))
         self(" set print\n")            # print output to default stderr
+        if not result:
+            return None
+        result = result[0]
         if result[0:4]=="None":
             return None
 	elif convert_method is not None:
@@ -249,6 +333,46 @@ class Backend(backend.Backend):
                 self.exports[source][1] = ds.change_counter
             else:
                 logger.info("Dataset has not changed and is not exported!")                           
+
+
+    def get_binary_data(self, ds, cx, cy):
+        """
+        Return the columns `cx` and `cy` of the Dataset `ds` as
+        string of interleaved doubles in native byte order, which is
+        what gnuplot expects for binary data with the format
+        '%double%double'.
+        """
+        xdata, ydata = self.get_dataset_data(ds, cx, cy)
+        if len(xdata) == 0:
+            raise backend.BackendError("No data for Line!")
+        
+        try:
+            data = numpy.empty((len(xdata), 2), dtype=float)
+            data[:,0] = xdata
+            data[:,1] = ydata
+        except (ValueError, TypeError):
+            raise backend.BackendError("Columns (%s, %s) are not numeric. Line skipped." % (cx, cy))
+        return data.tostring()
+
+    def write_binary_data(self, ds, cx, cy):
+        """
+        Write the columns `cx` and `cy` of the Dataset `ds` into a
+        file in the temporary directory (see get_binary_data) and
+        return the filename.  The file is only rewritten if the
+        Dataset has changed since it has been written.
+        """
+        filename = utils.as_filename("%s-%s-%s" % (ds.key, cx, cy))
+        written = self.binary_files.get(filename, None)
+        if written is None or written[0] is not ds or ds.has_changes(written[1]):
+            data = self.get_binary_data(ds, cx, cy)
+            fd = open(os.path.join(self.tmpdir, filename), 'wb')
+            try:
+                fd.write(data)
+            finally:
+                fd.close()
+            self.binary_files[filename] = (ds, ds.change_counter)
+        return filename
+        
         
     #----------------------------------------------------------------------
     def clear(self):
@@ -303,7 +427,8 @@ class Backend(backend.Backend):
         queue = self.queue
         
         # lines
-        line_cache = []        
+        line_cache = []
+        blocks = [] # inline data
         for line in layer.lines:
             index = len(line_cache)
             print "TRYING TO PLOT LINE #", index
@@ -313,18 +438,30 @@ class Backend(backend.Backend):
                 ds = self.get_line_source(line)
                 cx, cy = self.get_column_indices(line)
                 
-                # mark source for export            
-                filename = self.mark_for_export(ds)
-                if filename is None:
-                    continue
-                source = '"%s"' % filename
+                if self.data_transfer == 'binary':
+                    # gnuplot reads only the two columns from a file
+                    filename = self.write_binary_data(ds, cx, cy)
+                    source = "\"%s\" binary format='%%double%%double'" % filename
+                    using = 'using 1:2'
+                    data = None
+                elif self.data_transfer == 'inline':
+                    # send only the two columns as inline binary data
+                    data = self.get_binary_data(ds, cx, cy)
+                    source = "'-' binary record=%d format='%%double%%double'" % (len(data) / 16)
+                    using = 'using 1:2'
+                else:
+                    # mark source for export            
+                    filename = self.mark_for_export(ds)
+                    if filename is None:
+                        continue
+                    source = '"%s"' % filename
+                    using = 'using %s:%s' % (cx+1,cy+1)
+                    data = None
 
                 label = self.get_line_label(line, dataset=ds, cy=cy)
                 if label is not None: title = 'title "%s"' % label
                 else: title = 'notitle'
 
-                using = 'using %s:%s' % (cx+1,cy+1)
-
                 #
                 # Group Properties
                 #
@@ -414,10 +551,14 @@ class Backend(backend.Backend):
             else:
                 # merge all of the above into a nice gnuplot command
                 line_cache.append( " ".join([source,using,with,point_type,width,title]) )
+                if data is not None:
+                    blocks.append(data)
 
         # construct plot command from line_cache
         if len(line_cache) > 0:
-            cmd = "plot " + ",\\\n".join(line_cache)            
+            cmd = "plot " + ",\\\n".join(line_cache)
+            if len(blocks) > 0:
+                cmd = InlineCommand(cmd, blocks)
             queue.append((cd, 'lines', cmd, None))
         else:            
             logger.warn("Emtpy layer!")
@@ -501,30 +642,37 @@ class Backend(backend.Backend):
         queue.append((cd, 'labels', cmd, 'unset labels'))
 
         
-    def update_layer(self, layer, updateinfo={}):
+    def update_title(self, layer, updateinfo={}):
         # updateinfo is ignored
         cd = self.cdict[layer]        
-        queue = self.queue
-        
-        # visible
-        if layer.visible is False:
-            queue.append((self.cdict, layer, {}, None))
-            return
-        
-        # title
         title = layer.title
         if title is not None:
-            queue.append((cd, 'title', 'set title "%s"' % title, None))
+            self.queue.append((cd, 'title', 'set title "%s"' % title, None))
         else:
-            queue.append((cd, 'title', None, 'unset title'))
+            self.queue.append((cd, 'title', None, 'unset title'))
 
-        # grid
+    def update_grid(self, layer, updateinfo={}):
+        # updateinfo is ignored
+        cd = self.cdict[layer]        
         grid = layer.grid
         if grid is True:
-            queue.append((cd, 'grid', 'set grid', None))
+            self.queue.append((cd, 'grid', 'set grid', None))
         else:
-            queue.append((cd, 'grid', None, 'unset grid'))
+            self.queue.append((cd, 'grid', None, 'unset grid'))
+
+        
+    def update_layer(self, layer, updateinfo={}):
+        # updateinfo is ignored
+        cd = self.cdict[layer]        
+        queue = self.queue
         
+        # visible
+        if layer.visible is False:
+            queue.append((self.cdict, layer, {}, None))
+            return
+        
+        self.update_title(layer)
+        self.update_grid(layer)
         self.update_legend(layer)
         self.update_axes(layer)
         self.update_labels(layer)
@@ -606,22 +754,7 @@ class Backend(backend.Backend):
             self.cdict[layer] = {}
             self.update_layer(layer)
 
-
-        def apply_queue(queue):
-            logger.debug("Applying Queue...")
-            while len(queue) > 0:
-                adict, key, set, unset = queue.pop()
-
-                if unset is not None:
-                    print "Performing unset ", unset
-                    self(unset)
-
-                if set is not None:
-                    adict[key] = set
-                elif adict.has_key(key):
-                    adict.pop(key)
-
-        apply_queue(queue)
+        unset_cmds = self.apply_queue()
 
 
         #
@@ -632,55 +765,236 @@ class Backend(backend.Backend):
         for layer in self.plot.layers:
             order.append(layer)
 
-        order += ['title',
-                  'grid',
-                  'axes',
-                  'labels',
-                  'layer',
-                  'lines',
-                 'multiplot-end']
+        order += self.LAYER_ORDER + ['multiplot-end']
                 
-        print "QUEUE:"
-        print cd
-
         logger.debug("Executing command dict...")
         self.export_datasets()
-        self.execute(cd)
-
-#         # The following snippet shows how to update a single attribute:        
-#         print "---"
-#         layer = self.plot.layers[0]
-#         layer.title = None
-#         self.update_layer(layer)
-#         apply_queue(queue)
-#         self("replot")
-                
+        requests = self.send(unset_cmds + self.collect_commands(cd))
+        logger.debug("Full draw: %d commands." % len(requests))
+
+        # from now on, only changes need to be sent
+        self.connect_updates()
+        self.drawn_layers = list(self.plot.layers)
+        self.dirty = {}
+        self.redraw_scheduler.cancel()
+
+    def redraw(self, force=False):
+        """
+        Send only the commands of the entries of the command dict
+        that are affected by the changes since the last draw, see
+        update_dirty.  A complete draw is done instead, if `force` is
+        True or if this is not possible.
+        """
+        if force is True or self.drawn_layers is None \
+               or self.plot is None or self.plot.layers != self.drawn_layers \
+               or len(self.plot.layers) != 1:
+            self.draw()
+        else:
+            self.update_dirty()
+        
+    def apply_queue(self):
+        """
+        Apply the changes in the command `queue` to the command dict
+        (see draw) and return the list of unset commands.
+        """
+        logger.debug("Applying Queue...")
+        unset_cmds = []
+        queue = self.queue
+        while len(queue) > 0:
+            adict, key, set, unset = queue.pop()
 
+            if unset is not None:
+                unset_cmds.append(unset)
 
-#self.execute_queue()
+            if set is not None:
+                adict[key] = set
+            elif adict.has_key(key):
+                adict.pop(key)
 
-    redraw = draw
+        return unset_cmds
 
+    def collect_commands(self, item):
+        """
+        Return the list of (cmd, data) tuples for `item`, which may
+        be a command dict, a list or a single command.
+        """
+        commands = []
+        
+        def collect(item):
+            if isinstance(item, dict):
+                for key in self.execution_order:
+                    if item.has_key(key):
+                        collect(item[key])
+            elif isinstance(item, list):
+                for subitem in item:
+                    collect(subitem)
+            elif isinstance(item, InlineCommand):
+                commands.append((item.cmd, item.blocks))
+            else: # => should be a string
+                commands.append((item, None))
+
+        collect(item)
+        return commands
+        
     def execute(self, item):
-        def execute_list(alist):
-            for item in alist:
-                self.execute(item)
-                
-        def execute_dict(adict):
-            for key in self.execution_order:
-                if adict.has_key(key):
-                    self.execute(adict[key])
-
-        if isinstance(item, dict):
-            execute_dict(item)
-        elif isinstance(item, list):
-            execute_list(item)
-        else: # => should be a string
-            print "Calling ", item
-            self(item)
+        """
+        Send all commands of `item`, which may be a command dict, a
+        list or a single command, to gnuplot in a single batch.
+        Returns the list of Requests without waiting for them.
+        """
+        return self.send(self.collect_commands(item))
       
+
+    #----------------------------------------------------------------------
+    # Incremental Updates
+    #
+    # After a complete draw, the Backend listens to the update Signals
+    # of the layer and of its lines, axes, legend and line sources.
+    # The changes are collected as the names of the affected entries
+    # of the layer's command dict (e.g. 'title' or 'lines').  On the
+    # next redraw, only these entries are rebuilt and sent, followed
+    # by a 'replot' if the plot command itself has not been sent.
+    # Changes that cannot be handled this way result in a complete
+    # draw.  Multiplots are always drawn completely, since 'replot'
+    # only repeats the last plot command.
+
+    # order of the entries of a layer's command dict
+    LAYER_ORDER = ['title', 'grid', 'legend', 'axes', 'labels', 'layer', 'lines']
+
+    # entry of the layer's command dict for each changed Layer key
+    LAYER_ENTRIES = {'title': 'title',
+                     'grid': 'grid',
+                     'legend': 'legend',
+                     'axes': 'axes',
+                     'labels': 'labels',
+                     'lines': 'lines',
+                     'group_style': 'lines',
+                     'group_marker': 'lines',
+                     'group_width': 'lines',
+                     'group_color': 'lines',
+                     'group_marker_color': 'lines'}
+    
+    drawn_layers = None
+
+    def connect_updates(self):
+        " (Re)connect to the update Signals of all objects of the plot. "
+        for cb in self.update_cblist:
+            cb.disconnect()
+        self.update_cblist = cblist = []
+        self.owners = {}
+        
+        for layer in self.plot.layers:
+            cblist.extend(
+                [layer.sig_connect('update', self.on_update_layer),
+                 layer.sig_connect('update::lines', self.on_update_list),
+                 layer.sig_connect('update::labels', self.on_update_list),
+                 layer.sig_connect('update::axes', self.on_update_list)])
+
+            children = list(layer.lines) + layer.axes.values()
+            if layer.legend is not None:
+                children.append(layer.legend)
+            for obj in children:
+                self.owners[obj] = layer
+                cblist.append(obj.sig_connect('update', self.on_update_child))
+
+            sources = []
+            for line in layer.lines:
+                if line.source is not None and line.source not in sources:
+                    sources.append(line.source)
+                    cblist.append(line.source.sig_connect('update', self.on_update_dataset))
+
+    def disconnect_updates(self):
+        for cb in self.update_cblist:
+            cb.disconnect()
+        self.update_cblist = []
+        self.owners = {}
+        self.drawn_layers = None
+        
+    def mark_dirty(self, layer, entry):
+        """ Mark the `entry` of the command dict of `layer` as
+        changed.  If `entry` is None, the plot is drawn completely. """
+        entries = self.dirty.setdefault(layer, [])
+        if entry not in entries:
+            entries.append(entry)
+        self.queue_redraw()
         
+    def on_update_layer(self, sender, keys):
+        for key in keys:
+            self.mark_dirty(sender, self.LAYER_ENTRIES.get(key, None))
+
+    def on_update_list(self, sender, key, updateinfo):
+        self.mark_dirty(sender, self.LAYER_ENTRIES.get(key, None))
+        if key in ('lines', 'axes'):
+            self.mark_dirty(sender, 'reconnect')
+
+    def on_update_child(self, sender, keys):
+        layer = self.owners.get(sender, None)
+        if layer is None:
+            return
+        if isinstance(sender, objects.Line):
+            self.mark_dirty(layer, 'lines')
+            if 'source' in keys:
+                self.mark_dirty(layer, 'reconnect')
+        elif isinstance(sender, objects.Axis):
+            self.mark_dirty(layer, 'axes')
+        elif isinstance(sender, objects.Legend):
+            self.mark_dirty(layer, 'legend')
+        else:
+            self.mark_dirty(layer, None)
+
+    def on_update_dataset(self, sender):
+        for layer in self.plot.layers:
+            for line in layer.lines:
+                if line.source is sender:
+                    self.mark_dirty(layer, 'lines')
+            
+    def update_dirty(self):
+        " Send the commands for the changed entries, see mark_dirty. "
+        if len(self.dirty) == 0:
+            return
+        dirty, self.dirty = self.dirty, {}
+
+        layer = self.plot.layers[0]
+        entries = dirty.get(layer, [])
+        if None in entries or layer.visible is False:
+            self.draw()
+            return
+
+        update_methods = {'title': self.update_title,
+                          'grid': self.update_grid,
+                          'legend': self.update_legend,
+                          'axes': self.update_axes,
+                          'labels': self.update_labels,
+                          'lines': self.update_lines}
+        self.queue = []
+        for entry in self.LAYER_ORDER:
+            if entry in entries:
+                update_methods[entry](layer)
+        commands = self.apply_queue()
+
+        cd = self.cdict[layer]
+        for entry in self.LAYER_ORDER:
+            if entry in entries and cd.has_key(entry):
+                commands.extend(self.collect_commands(cd[entry]))
+
+        # repeat the plot command, unless it has just been sent.
+        # With inline data, the plot command itself must be sent
+        # again, since 'replot' would expect the data again.
+        if 'lines' not in entries and cd.has_key('lines'):
+            if self.data_transfer == 'inline':
+                commands.extend(self.collect_commands(cd['lines']))
+            else:
+                commands.append(('replot', None))
+
+        if 'lines' in entries and self.data_transfer == 'ascii':
+            self.export_datasets()
+        if 'reconnect' in entries:
+            self.connect_updates()
 
+        requests = self.send(commands)
+        logger.debug("Incremental update: %d commands instead of %d."
+                     % (len(requests), len(self.collect_commands(self.cdict))))
+        
 
 
 
@@ -90,14 +90,20 @@ class PostscriptTerminal(Terminal):
                     'duplexing', 'fontname', 'fontsize',
                     'solid', 'color', 'rounded', 'timestamp']
 
-    def build_filename(mode, project, plot):
+    def build_filename(mode, project, plot, destdir=None, prefix=''):
+        """
+        Return the name of the output file for `plot`, which is put
+        into `destdir` (by default the directory of the `project`)
+        and may be prefixed with `prefix`.
+        """
         if mode == 'eps':
             ext = '.eps'
         else:
             ext = '.ps'
 
-            
-        return os.path.join(project.get_directory(), plot.key + ext)
+        if destdir is None:
+            destdir = project.get_directory()
+        return os.path.join(destdir, prefix + plot.key + ext)
     build_filename = staticmethod(build_filename)
 
 
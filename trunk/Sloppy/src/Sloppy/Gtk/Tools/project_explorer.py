@@ -226,6 +226,11 @@ class ProjectTreeView( gtk.TreeView ):
         cell.set_property('editable', False)
         cell.connect('edited', self.on_key_edited)        
         self.text_renderer = cell # for reference
+
+        cell = gtk.CellRendererText()
+        cell.set_property('foreground', 'gray')
+        column.pack_start(cell,expand=False)
+        column.set_cell_data_func(cell, self.render_shape)
         
         self.append_column(column)
                 
@@ -302,6 +307,20 @@ class ProjectTreeView( gtk.TreeView ):
             
         cell.set_property('text', label)
 
+    def render_shape(self,column,cell,model,iter):
+        """
+        Show the number of rows and columns of a Dataset.  For
+        datasets that have not been loaded yet, the number of rows
+        is taken from the summary in the project archive, so that
+        the data is not loaded just to be listed.
+        """
+        object = model.get_value(iter, self.MODEL_OBJECT)
+        if isinstance(object, Table) and object.has_data():
+            text = "%d x %d" % (object.nrows, object.ncols)
+        else:
+            text = ""
+        cell.set_property('text', text)
+        
     def render_type(self,column,cell,model,iter):
         object = model.get_value(iter, self.MODEL_OBJECT)
         classname = object.__class__.__name__
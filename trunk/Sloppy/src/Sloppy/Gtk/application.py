@@ -28,6 +28,9 @@ logger = logging.getLogger('gtk.application')
 import glob, os, sys
 import gtk, gobject, pango
 
+# projects are saved in a separate thread
+gobject.threads_init()
+
 from Sloppy.Gtk import uihelper, gtkexcepthook, import_dialog, preferences, \
      mpl,datawin
 from Sloppy.Gtk.gnuplot_window import GnuplotWindow
@@ -42,7 +45,7 @@ from Sloppy.Base import \
 from Sloppy.Base.objects import Plot, Axis, Line, Layer
 from Sloppy.Base.dataset import Dataset
 from Sloppy.Base.project import Project
-from Sloppy.Base.projectio import load_project, save_project, ParseError
+from Sloppy.Base.projectio import load_project, save_project, ParseError, ProjectWriter
 
 from Sloppy.Gnuplot.terminal import PostscriptTerminal
 
@@ -50,6 +53,9 @@ from Sloppy.Lib.ElementTree.ElementTree import Element, SubElement
 from Sloppy.Lib.Check import Instance, List, values_as_dict, AnyValue
 from Sloppy.Lib.Undo import *
 
+# redraws of the backends are performed when gtk is idle
+backend.set_event_loop(gobject.idle_add, gobject.timeout_add)
+
 
 #------------------------------------------------------------------------------
 # GtkApplication, the main object
@@ -79,6 +85,7 @@ class GtkApplication(application.Application):
         self.path.icon_dir = os.path.join(self.path.base_dir, 'Gtk','Icons')
         self.register_stock()
         self.popup_info = None
+        self._writer = None # see save_project_in_background
         
         # === Plugins ===
         self.init_plugins()
@@ -198,6 +205,9 @@ class GtkApplication(application.Application):
 # TODO: how can we access the old value in the check? DARN!
 # But maybe we can simply put this question into an action?
 #
+        # never close a project that is currently being saved
+        self.wait_for_save()
+        
         if self._project is not None:
             if self._project.journal.can_undo() and confirm is True:        
                 msg = \
@@ -217,7 +227,7 @@ class GtkApplication(application.Application):
 
                 if response == gtk.RESPONSE_YES:
                     # yes = yes, save the file before closing
-                    self.save_project()                    
+                    self.save_project(background=False)
                 elif response == gtk.RESPONSE_NO:
                     # no = no, proceed with closing
                     pass
@@ -349,13 +359,78 @@ class GtkApplication(application.Application):
 
         self._project.filename = filename
         self.window.set_title(os.path.basename(self._project.filename))
-        save_project(self._project)
-        self._project.journal.clear()
+        self.save_project_in_background(self._project)
 
         self.recent_files.insert(0, os.path.abspath(filename))
         self.sig_emit('update-recent-files')
 
 
+    def save_project(self, background=True):
+        """
+        Save current project either under the current filename,
+        or if no such name is set, call save_project_as.
+        Unless `background` is False, the project is written in
+        a separate thread.
+        """
+        pj = self.project
+        if pj is None:
+            return None
+
+        if pj.filename is None:
+            self.save_project_as()
+        elif background is False:
+            self.wait_for_save()
+            application.Application.save_project(self)
+        else:
+            self.save_project_in_background(pj)
+        
+
+    def save_project_in_background(self, project):
+        """
+        Write the given project in a separate thread, so that the
+        user interface stays responsive.  The result is reported
+        in the main thread, see _cb_save_finished/_cb_save_failed.
+        """
+        if self._writer is not None:
+            self.error_msg("The project is still being saved.")
+            return
+
+        writer = ProjectWriter(project)
+        def on_finished(sender, writer):
+            gobject.idle_add(self._cb_save_finished, writer)
+        def on_error(sender, writer, msg):
+            gobject.idle_add(self._cb_save_failed, writer, msg)
+        writer.sig_connect('finished', on_finished)
+        writer.sig_connect('error', on_error)
+        
+        self._writer = writer
+        self.status_msg("Saving %s..." % os.path.basename(writer.filename))
+        writer.start()
+
+    def wait_for_save(self):
+        " Block until the project is no longer saved in the background. "
+        while self._writer is not None:
+            gtk.main_iteration()
+            
+    def _cb_save_finished(self, writer):
+        try:
+            writer.finish()
+            # changes made while saving are not part of the file
+            if writer.is_current():
+                writer.spj.journal.clear()
+            self.status_msg("Saved %s" % os.path.basename(writer.filename))
+        finally:
+            self._writer = None
+        return False
+
+    def _cb_save_failed(self, writer, msg):
+        try:
+            self.error_msg("Error while saving %s:\n\n%s" % (writer.filename, msg))
+        finally:
+            self._writer = None
+        return False
+
+
     def quit(self):
         """ Quit Application and gtk main loop. """
         try:
@@ -772,7 +847,8 @@ class GtkApplication(application.Application):
         else:
             template = template_key
 
-        self.core.import_datasets(project, filenames, template)             
+        self.core.import_datasets(project, filenames, template,
+                                  workers=self.import_workers)
 
 
     def _cb_new_dataset(self,widget):
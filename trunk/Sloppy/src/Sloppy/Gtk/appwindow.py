@@ -27,6 +27,7 @@ from Sloppy.Base import utils, error, version, config, globals
 from Sloppy.Base.objects import Plot
 from Sloppy.Base.dataset import Dataset
 from Sloppy.Lib.Signals import HasSignals
+from Sloppy.Lib.Undo import format_size
 
 
 import logging
@@ -108,10 +109,15 @@ class AppWindow( gtk.Window, HasSignals ):
         self.progressbar = progressbar = gtk.ProgressBar()        
         progressbar.hide()
 
+        # memory held by the undo history, see _refresh_undo_redo
+        self.undo_label = gtk.Label()
+        self.undo_label.show()
+
         # -- Notification Area --
         notification_area = gtk.HBox()
         notification_area.pack_start(self.btn_cancel,False,True)
         notification_area.pack_start(self.statusbar,True,True)
+        notification_area.pack_start(self.undo_label,False,True,4)
         notification_area.pack_start(self.progressbar,False,True)
         notification_area.show()
 
@@ -261,9 +267,15 @@ class AppWindow( gtk.Window, HasSignals ):
             undo_text = "Undo: %s" % project.journal.undo_text()
             redo_state = project.journal.can_redo()
             redo_text = "Redo: %s" % project.journal.redo_text()
+            usage = project.journal.get_usage()
+            memory_text = "Undo: %s" % format_size(usage['size'])
+            if usage['spilled'] > 0:
+                memory_text += " (+%s on disk)" % format_size(usage['spilled'])
         else:
             undo_state = redo_state = False
             undo_text = "Undo" ; redo_text = "Redo"
+            memory_text = ""
+        self.undo_label.set_text(memory_text)
 
         uim = self.uimanager
         
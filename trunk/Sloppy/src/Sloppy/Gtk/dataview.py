@@ -112,7 +112,7 @@ class DatasetModel(gtk.GenericTreeModel):
     def on_iter_n_children(self, iter):
         if iter is not None: 
             return 0
-        return self.dataset.rows
+        return self.dataset.nrows
 
     def on_iter_nth_child(self, iter, n):
         if iter is not None:
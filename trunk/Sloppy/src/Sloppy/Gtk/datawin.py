@@ -19,7 +19,7 @@
 # $Id: tablewin.py 457 2006-01-19 20:45:02Z niklasv $
 
 
-import gtk, numpy
+import gtk, numpy, re
 
 from Sloppy.Base.dataset import Dataset, Table
 from Sloppy.Base import uwrap, globals, utils, error
@@ -164,7 +164,7 @@ class DatasetWidget(basewidget.BaseWidget):
 
         if dataset is not None:
             # TODO: this is not the correct place for this
-            dataset.get_array()
+            dataset.load()
 
         self.dataview.set_dataset(dataset)
 
@@ -739,6 +739,10 @@ class ColumnCalculator(gtk.Window):
     """ An experimental tool window to calculate columns according to
     some expression.  """
 
+    # expressions like 'col(cc) * 2', which are applied via
+    # Table.transform_column to keep the undo information small.
+    transform_regexp = re.compile(r"^\s*col\(\s*(cc|\d+)\s*\)\s*([-+*/])\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*$")
+
     def __init__(self, project, dataset, colnr):
         gtk.Window.__init__(self)
         self.set_title("Cool Column Calculator")
@@ -779,6 +783,14 @@ class ColumnCalculator(gtk.Window):
         start, end = buffer.get_bounds()
         expression = buffer.get_text(start, end)
 
+        match = self.transform_regexp.match(expression)
+        if match is not None and hasattr(ds, 'transform_column'):
+            col, operator, value = match.groups()
+            if col == 'cc' or int(col) == self.colnr:
+                ds.transform_column(self.colnr, operator, float(value),
+                                    undolist=self.project.journal)
+                return
+                
         local_vars = {'cc': self.colnr}
         result = self.evaluate(ds, expression, local_vars)
 
@@ -133,7 +133,7 @@ class GnuplotWindow( gtk.Window ):
 
             # connect signal for plot
             plot.sig_connect('closed', (lambda sender: self.destroy())),
-            plot.sig_connect('changed', (lambda sender: self.backend.draw()))
+            plot.sig_connect('changed', (lambda sender: self.backend.queue_redraw()))
             ]
 
         self.backend.draw()
@@ -171,6 +171,7 @@ class GnuplotWindow( gtk.Window ):
         self.treeview = tv
         self.model = model
         self.last_iter = None
+        self.pending_iters = []
         
         return sw
 
@@ -215,6 +216,7 @@ class GnuplotWindow( gtk.Window ):
         history will be cleared.
         """
         self.model.clear()
+        self.pending_iters = []
     
     def on_send_cmd(self, sender, cmd):
         """
@@ -224,23 +226,30 @@ class GnuplotWindow( gtk.Window ):
         `self.last_iter`. It also scrolls down to this position.
         """
         self.last_iter = self.model.append( None, (cmd,) )
+        self.pending_iters.append(self.last_iter)
         self.treeview.scroll_to_cell(self.model.get_path(self.last_iter))
         
     def on_finish_cmd(self, sender, cmd, result):
         """
         When a gnuplot backend receives the result from a command,
         it emits a signal 'gnuplot-finish-cmd'.  This callback
-        appends the result to the corresponding treeview item (using
-        `self.last_iter` from 'on_send_cmd') _if_ there is a result.
+        appends the result to the corresponding treeview item _if_
+        there is a result.  Since commands are sent in batches, the
+        iters of the commands that have been sent but are not yet
+        finished are kept in `self.pending_iters`.
         """
+        if len(self.pending_iters) > 0:
+            iter = self.pending_iters.pop(0)
+        else:
+            iter = self.last_iter
         if result is not None and len(result) > 0:
-            self.model.append(self.last_iter, ("%s" % ("\n".join(result)),) )
+            self.model.append(iter, ("%s" % ("\n".join(result)),) )
 
 
     # --- action callbacks -------------------------------------------------
 
     def _cb_replot(self, action):
-        self.backend.redraw()
+        self.backend.redraw(force=True)
 
     def _cb_edit_plot(self, action):
         self.app.edit_layer(self.plot)
@@ -389,7 +389,8 @@ class MatplotlibWidget(basewidget.BaseWidget):
     def on_action_DataCursor(self, action):
         layer = self.request_active_layer()
         axes = self.backend.get_painter(layer).axes
-        s = mpl_selector.DataCursor(self.backend.figure, axes)
+        s = mpl_selector.DataCursor(self.backend.figure, axes,
+                                    picker=self.backend.picker)
 
         def abort_selector(sender):
             sb = self.get_statusbar()
@@ -533,11 +534,8 @@ class MatplotlibWidget(basewidget.BaseWidget):
         def over_line(line):
             # can't use the line bbox because it covers the entire extent
             # of the line
-            trans = line.get_transform()
-            xdata, ydata = trans.numerix_x_y(line.get_xdata(valid_only = True),
-                                             line.get_ydata(valid_only = True))
-            distances = numpy.sqrt((x-xdata)**2 + (y-ydata)**2)
-            return numpy.lib.mlab.min(distances)<epsilon
+            index, delta = self.backend.picker.nearest(line, x, y, maxdist=epsilon)
+            return index is not None
 
         hits = []
         
@@ -31,7 +31,10 @@ import gobject
 
 import math
 
+from matplotlib.colors import colorConverter
+
 from Sloppy.Lib.Signals import HasSignals
+from Sloppy.Matplot.picking import Picker, get_line_data, transform_points, nearest_point
 
 
 #------------------------------------------------------------------------------
@@ -70,32 +73,33 @@ def nearest_match(trans, x, y, xdata, ydata):
     each data point (xdata[n], ydata[n]).
     This tuple is calculated using the given transformation 'trans',
     which can be retrieved via self.axes.transData
+
+    For repeated searches, use a Picker, which keeps an index of the
+    transformed points.
     """
 
     if len(xdata) == 0:
         return None, None
 
-    # calculate difference to other point
-    def dist(x1, y1, x2, y2):
-        return (x1-x2)**2 + (y1-y2)**2
-
-    # delta is the smallest yet encountered difference
-    delta = dist(x, y, *trans.xy_tup((xdata[0], ydata[0])))
-    index = 0
+    px, py = transform_points(trans, xdata, ydata)
+    return nearest_point(px, py, x, y)
 
-    n=0
-    for xv in xdata:
-        d = dist(x, y, *trans.xy_tup((xv, ydata[n])))
-        if d < delta:
-            index = n
-            delta = d
-        n += 1
 
-    return (index, delta)    
 
+    
+def view_position(vmin, vmax, nmin, nmax, size, scale='linear'):
+    """
+    Return the pixel positions (p0, p1) of the limits `vmin` and `vmax`
+    of the original view within a new view with the limits `nmin` and
+    `nmax` that is `size` pixels wide.  The positions are ordered.
+    """
+    if scale == 'log':
+        vmin, vmax, nmin, nmax = [math.log10(v) for v in (vmin, vmax, nmin, nmax)]
+    factor = size / float(nmax - nmin)
+    p0, p1 = (vmin - nmin) * factor, (vmax - nmin) * factor
+    return min(p0, p1), max(p0, p1)
 
 
-    
 def draw_crosshair(self, gc, x, y, size=5):
     " Draw a crosshair at the given position. "
     self.draw_line(gc, x-size, y, x+size, y)
@@ -151,49 +155,150 @@ class Selector(HasSignals):
 
 
 
+class AxesBackground:
+
+    """
+    Copy of the static plot within the area of an axes.
+
+    The copy is kept in a server-side pixmap and is only taken again
+    if the view changes, i.e. if the axes are moved or resized or if
+    their limits change.  Restoring the background is a plain copy of
+    pixels and does not depend on the number of plotted points.
+    """
+    
+    def __init__(self, canvas, axes):
+        self.canvas = canvas
+        self.axes = axes
+        self.key = None
+        self.pixmap = None
+        self._pixbuf = None
+
+    def get_rect(self):
+        """ Return (x, y, width, height) of the axes in window
+        coordinates, i.e. with y counted from the top. """
+        fig_height = self.canvas.figure.bbox.height()
+        l,b,w,h = [int(val) for val in self.axes.bbox.get_bounds()]
+        return int_tuple(l, fig_height-(b+h), w, h)
+    rect = property(get_rect)
+
+    def get_key(self):
+        return (self.get_rect(), self.axes.get_xlim(), self.axes.get_ylim())
+    
+    def update(self, force=False):
+        """ Take a new copy of the background if the view has changed.
+        Returns False if there is no window to copy from. """
+        drawable = self.canvas.window
+        if drawable is None:
+            return False
+
+        key = self.get_key()
+        if force is False and self.pixmap is not None and key == self.key:
+            return True
+
+        # Copy from the canvas' own backing pixmap if possible,
+        # because it never contains any overlays and it is never
+        # obscured by other windows.
+        source = getattr(self.canvas, '_pixmap', None) or drawable
+        x, y, w, h = key[0]
+        self.pixmap = gtk.gdk.Pixmap(drawable, max(w,1), max(h,1))
+        self.pixmap.draw_drawable(drawable.new_gc(), source, x, y, 0, 0, w, h)
+        self._pixbuf = None
+        self.key = key
+        return True
+
+    def invalidate(self):
+        self.pixmap = None
+        self._pixbuf = None
+        self.key = None
+    
+    def get_pixbuf(self):
+        " Return the background as client-side pixbuf, e.g. for scaling. "
+        if self._pixbuf is None and self.pixmap is not None:
+            w, h = self.pixmap.get_size()
+            pixbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, w, h)
+            colormap = self.canvas.window.get_colormap()
+            self._pixbuf = pixbuf.get_from_drawable(self.pixmap, colormap,
+                                                    0, 0, 0, 0, w, h)
+        return self._pixbuf
+            
+    def restore(self, drawable, gc):
+        x, y, w, h = self.key[0]
+        drawable.draw_drawable(gc, self.pixmap, 0, 0, x, y, w, h)
+        
+
+
 class BufferedRedraw:
 
+    """
+    Mix-in for Selectors that draw overlays, e.g. rubber bands or
+    crosshairs, on top of self.axes.
+
+    Each call of `buffered_redraw` schedules an idle redraw that
+    restores the cached AxesBackground and then calls the overlay
+    function `func(drawable, gc)`.  Both steps are painted into an
+    offscreen buffer (begin_paint_rect), so that there is no
+    flicker.  The plot itself is never drawn again.
+    """
+    
     def __init__(self):
-        self._imageBack = None
+        self._background = None
+        self._overlay = None
         self._idleId = 0
         
+    def get_background(self):
+        if self._background is None or self._background.axes is not self.axes:
+            self._background = AxesBackground(self.canvas, self.axes)
+        return self._background
+    
     def buffered_redraw(self, func=None, *args):
 
         if self.axes is None:
             return
         
-        drawable = self.canvas.window
-        if drawable == None: return
-        gc = drawable.new_gc()
+        if self.canvas.window is None:
+            return
 
-        # There is no guarantee that the canvas size stays constant
-        # during the selection.  E.g. the user might resize the window.
-        # We check for this by comparing the size of the saved image
-        # to the new canvas size.  If it doesn't match, then we
-        # need to refresh the image.
-        fig_height = self.canvas.figure.bbox.height()
-        l,b,w,h = [int(val) for val in self.axes.bbox.get_bounds()]
-        axrect = int_tuple(l,fig_height-(b+h),l+w,fig_height-b)
-        if self._imageBack is not None:
-            lastrect, imageBack = self._imageBack
-
-        if self._imageBack is None or axrect != lastrect:
-            # 'axrect' is a rectangle in screen coordinates that delimits
-            # the axes that we are drawing in.  The y coordinates are flipped
-            # due to different origins of the coordinate systems.
-            self._imageBack = axrect, drawable.get_image(*axrect)
-            self._idleId = 0
+        self._overlay = func
+        if self._idleId == 0:
+            self._idleId = gobject.idle_add(self.blit)
 
-        lastrect, imageBack = self._imageBack
-        def idle_draw(*args):
-            drawable.draw_image(gc, imageBack, 0, 0, *lastrect)
-            if func is not None:
-                func(drawable, gc)
-            self._idleId = 0
+    def blit(self, *args):
+        """ Restore the background and draw the current overlay on
+        top of it.  Returns False to be usable as idle function. """
+        self._idleId = 0
+        if self.axes is None:
+            return False
+        
+        background = self.get_background()
+        if background.update() is False:
             return False
-        if self._idleId==0:
-            self._idleId = gobject.idle_add(idle_draw)
 
+        drawable = self.canvas.window
+        x, y, w, h = background.key[0]
+        drawable.begin_paint_rect(gtk.gdk.Rectangle(x, y, w, h))
+        gc = drawable.new_gc()
+        self.draw_background(drawable, gc)
+        if self._overlay is not None:
+            self._overlay(drawable, gc)
+        drawable.end_paint()
+        return False
+
+    def draw_background(self, drawable, gc):
+        self._background.restore(drawable, gc)
+        
+    def remove_overlay(self):
+        """ Remove any overlay right away by restoring the background
+        and drop the cached background. """
+        if self._idleId != 0:
+            gobject.source_remove(self._idleId)
+            self._idleId = 0
+        self._overlay = None
+        if self._background is not None and self._background.pixmap is not None:
+            drawable = self.canvas.window
+            if drawable is not None:
+                self._background.restore(drawable, drawable.new_gc())
+            self._background.invalidate()
+        
 
 
 #------------------------------------------------------------------------------
@@ -325,8 +430,7 @@ class SelectRegion( Selector, BufferedRedraw ):
 
     def finish(self, abort=False):
         self.canvas.window.set_cursor(None)
-        self._imageBack = None
-        self.canvas.draw()
+        self.remove_overlay()
 
         self.region = (self.xdata0, self.ydata0, self.xdata1, self.ydata1)
         Selector.finish(self, abort=abort)
@@ -445,8 +549,7 @@ class SelectLine(Selector, BufferedRedraw):
             
 
     def finish(self, abort=False):
-        self._imageBack = None
-        self.canvas.draw()            
+        self.remove_overlay()
         Selector.finish(self, abort=abort)
 
         
@@ -460,11 +563,6 @@ class SelectLine(Selector, BufferedRedraw):
                 self.axes = event.inaxes
         ax = self.axes
         
-        drawable = self.canvas.window
-        if drawable == None: return
-        gc = drawable.new_gc()
-        gc.line_style = gtk.gdk.LINE_ON_OFF_DASH
-
         x, y = confine_to_bbox(event.x, event.y, self.axes.bbox)
         l, b, w, h = [int(val) for val in ax.bbox.get_bounds()]
 
@@ -478,6 +576,7 @@ class SelectLine(Selector, BufferedRedraw):
             self._lines.append( int_tuple(l, fig_height-y, l+w, fig_height-y) )
 
         def draw_lines(drawable, gc):
+            gc.line_style = gtk.gdk.LINE_ON_OFF_DASH
             for line in self._lines:
                 drawable.draw_line(gc, *line)
             
@@ -488,9 +587,16 @@ class SelectLine(Selector, BufferedRedraw):
 
 
 
-class ChangeViewRegion(Selector):
+class ChangeViewRegion(Selector, BufferedRedraw):
 
-    " Base class for any Selector that changes the viewed region. "
+    """
+    Base class for any Selector that changes the viewed region.
+
+    While the mouse is dragged, the axes limits are left untouched
+    and the cached background is shifted and scaled to preview the
+    new region instead.  The plot is only drawn again, when the
+    caller applies the final `region`.
+    """
     
     def __init__(self, figure, axes=None):
         """        
@@ -501,17 +607,15 @@ class ChangeViewRegion(Selector):
         """
         
         Selector.__init__(self, figure, axes)
+        BufferedRedraw.__init__(self)
 
         self.cursor = gtk.gdk.Cursor(gtk.gdk.FLEUR)
-        self._imageBack = None
         
         self.x, self.y = 0,0
         
         # self.xmin is set to None to indicate that it has not yet been set
         self.xmin, self.xmax, self.ymin, self.ymax = None,0,0,0
 
-        self._idleId = 0
-
         self.region = None  # return value
         
     def init(self):
@@ -524,11 +628,9 @@ class ChangeViewRegion(Selector):
         
     def finish(self, abort=False):
         self.canvas.window.set_cursor(None)
-        if abort is True and self.axes is not None and self.xmin is not None:
-            # restore original position
-            self.axes.set_xlim((self.xmin, self.xmax))
-            self.axes.set_ylim((self.ymin, self.ymax))
-            self.canvas.draw()
+        if abort is True:
+            # restore original view
+            self.remove_overlay()
             
         Selector.finish(self, abort=abort)
 
@@ -567,6 +669,9 @@ class ChangeViewRegion(Selector):
         if self.axes.get_xscale() == 'log':            
             self.dppx = math.log(self.xmax/self.xmin, 10)/self.width
 
+        # the background must show the original view
+        self.get_background().update(force=True)
+
 
     def on_button_release(self, event):
         self.finish()
@@ -574,20 +679,49 @@ class ChangeViewRegion(Selector):
 
     def on_motion_notify_event(self, event):
 
-        self.region = (xmin, ymin, xmax, ymax) = self.calculate_region(event)
-                   
-        # set new position
-        self.axes.set_xlim((xmin, xmax))
-        self.axes.set_ylim((ymin, ymax))       
+        self.region = self.calculate_region(event)
+        self.buffered_redraw()
 
-        # add redraw if idle        
-        def idle_draw(*args):
-            self.canvas.draw()
-            self._idleId = 0
-            return False        
 
-        if self._idleId==0:
-            self._idleId = gobject.idle_add(idle_draw)
+    def draw_background(self, drawable, gc):
+        " Draw the original view as it appears within the new region. "
+        background = self._background
+        if self.region is None:
+            background.restore(drawable, gc)
+            return
+
+        x, y, w, h = background.key[0]
+        xmin, ymin, xmax, ymax = self.region
+        x0, x1 = view_position(self.xmin, self.xmax, xmin, xmax, w,
+                               self.axes.get_xscale())
+        y0, y1 = view_position(self.ymin, self.ymax, ymin, ymax, h,
+                               self.axes.get_yscale())
+        # screen coordinates of the original view (y is flipped)
+        left, top = int(round(x0)), int(round(h - y1))
+        width, height = int(round(x1 - x0)), int(round(y1 - y0))
+
+        # fill the area that is not covered by the original view
+        r, g, b = colorConverter.to_rgb(self.axes.get_axis_bgcolor())
+        gc.set_rgb_fg_color(gtk.gdk.Color(int(r*65535), int(g*65535), int(b*65535)))
+        drawable.draw_rectangle(gc, True, x, y, w, h)
+        
+        if (width, height) == (w, h):
+            # pure shift: copy the pixmap on the server
+            drawable.draw_drawable(gc, background.pixmap, 0, 0,
+                                   x + left, y + top, w, h)
+        else:
+            # visible part of the scaled view
+            dx0, dy0 = max(left, 0), max(top, 0)
+            dx1, dy1 = min(left + width, w), min(top + height, h)
+            if dx1 <= dx0 or dy1 <= dy0:
+                return
+            pixbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, w, h)
+            background.get_pixbuf().scale(pixbuf, dx0, dy0, dx1-dx0, dy1-dy0,
+                                          left, top, width / float(w),
+                                          height / float(h),
+                                          gtk.gdk.INTERP_NEAREST)
+            drawable.draw_pixbuf(gc, pixbuf, dx0, dy0, x + dx0, y + dy0,
+                                 dx1-dx0, dy1-dy0)
 
 
 
@@ -713,16 +847,22 @@ class DataCursor( Cursor, BufferedRedraw ):
     Pressing 'shift' will accelerate the movement.
     """
     
-    def __init__(self, figure, axes=None):
+    def __init__(self, figure, axes=None, picker=None):
         """        
         @param figure: Figure object.
         
         @param axes: Axes object.  If None, the axes are automatically
           determined from the mouse position on the first mouse click.
+
+        @param picker: Picker object to find the nearest data point.
+          Passing the Picker of the backend allows to reuse its
+          indices of the lines.
         """
         
         Cursor.__init__(self, figure, axes)
         BufferedRedraw.__init__(self)
+
+        self.picker = picker or Picker()
         
         self.index = -1
         self.factor = 1 # speed of movement
@@ -730,8 +870,6 @@ class DataCursor( Cursor, BufferedRedraw ):
         self.bounds = None
         self.coords = None
         
-        self._imageBack = None
-        
         self.point = None  # return value
 
         self.sig_register("update-position")
@@ -744,7 +882,7 @@ class DataCursor( Cursor, BufferedRedraw ):
 
     def finish(self, abort=False):
         self.canvas.window.set_cursor(None)
-        self.buffered_redraw()
+        self.remove_overlay()
         Cursor.finish(self, abort=abort)
 
 
@@ -773,8 +911,8 @@ class DataCursor( Cursor, BufferedRedraw ):
         if index >= self.bounds[0] and index <= self.bounds[1]:
             self.index = index
 
-            xdata = self.line.get_xdata()[index]
-            ydata = self.line.get_ydata()[index]
+            xdata, ydata = get_line_data(self.line)
+            xdata, ydata = xdata[index], ydata[index]
             self.point = (xdata, ydata)
             
             self.coords = self.axes.transData.xy_tup((xdata,ydata))
@@ -813,24 +951,15 @@ class DataCursor( Cursor, BufferedRedraw ):
         # Now find the corresponding x,y pair in the dataset
         # that matches best!
 
-        last_match = None
-        
-        lines = self.axes.lines
-        for line in lines:
-            xdata = line.get_xdata()
-            ydata = line.get_ydata()
-
-            index, delta = nearest_match(self.axes.transData, x, y, xdata, ydata)
-            if index is not None and \
-                   (last_match is None or last_match[2] > delta):
-                last_match = line, index, delta            
+        line, index, delta = self.picker.pick(self.axes.lines, x, y)
+        if line is None:
+            return
 
-        # TODO: self.bounds is determined by the length of the data.
-        # TODO: This is ok, but we might need to refine this, once we use
-        # TODO: matplotlib's facility to clip the lines.
-        self.line = last_match[0]
-        self.bounds = (0, max(0, len(self.line.get_xdata())-1))
-        self.set_new_index(last_match[1])
+        # self.bounds is determined by the length of the complete
+        # data, even if the line only draws a part of it.
+        self.line = line
+        self.bounds = (0, max(0, len(get_line_data(line)[0])-1))
+        self.set_new_index(index)
     
         
     def draw(self):
@@ -100,7 +100,8 @@ class Importer(dataio.Importer):
         blurb="Designations", doc=MSG['import_ascii:designations']
         )
 
-    growth_offset = Integer(min=10, max=None, init=100)
+    blocksize = Integer(min=1, max=None, init=1048576,
+        blurb="Block size", doc="Approximate number of bytes that are parsed at once")
     
     #----
     public_props = ['delimiter', 'ncols', 'header_size',
@@ -219,16 +220,19 @@ class Importer(dataio.Importer):
         The attribute self.dataset must be a valid Dataset.
         However, if it does not contain an array, then an array
         is constructed.
+
+        The body is read in blocks of roughly `blocksize` bytes.
+        Each block is split and converted as a whole (see
+        `parse_block`), which is a lot faster than the former
+        line-by-line conversion.
         """
 
         ds = self.dataset
         
         # Used compiled regular expressions (cr_):
         #  cr_trim used to remove comments, linebreaks, whitespace, ...
-        #  cr_split used to split the remaining row into its fields
         #  cr_comment used to identify a comment-only line
         cr_trim = re.compile('^\s*(.*?)(#.*)?$')
-        #cr_split is set below, after the delimiter has been determined
         cr_comment = re.compile('^\s*(#.*)?$')
 
         # skip comments
@@ -251,8 +255,9 @@ class Importer(dataio.Importer):
             fd.seek(rewind)
 
         logger.debug("determined delimiter: '%s'" % delimiter)
+        split = new_splitter(delimiter)
         
-        if ds._array == None:
+        if not ds.has_data():
             # determine optional arguments
             ncols = self.ncols
             
@@ -268,8 +273,7 @@ class Importer(dataio.Importer):
                 except AttributeError:
                     ncols = 2
 
-                cregexp = re.compile(delimiter)
-                matches = [match for match in cregexp.split(line) if len(match) > 0]
+                matches = split(line)
                 logger.debug("MATCHES = %s" % str(matches))
                 ncols = len(matches)
                
@@ -302,21 +306,11 @@ class Importer(dataio.Importer):
             # ds.new_array(shape=(self.growth_offset,),
             #              names=names, formats=formats)
             dtype = numpy.dtype({'names': names, 'formats':formats})
-            a = numpy.zeros( (self.growth_offset,), dtype=dtype)
+            a = numpy.zeros( (0,), dtype=dtype)
             ds._array = a
        
         logger.debug("# of columns to be expected: %d" % ds.ncols)
 
-        # make sure existing Dataset has at least one entry.
-        if ds.nrows == 0:
-            ds.resize(1)
-
-        #
-        # set up type converters that convert the given values
-        # to the required field type
-        #                
-        types = [ds.get_column_pytype(name) for name in ds.names]
-
         # Assign field designations.
         # If there are more fields than designations, then
         # the designation is extended to the desired length, e.g.
@@ -339,73 +333,178 @@ class Importer(dataio.Importer):
             ds.get_info(n).designation = designations[n]
         
         #
-        # read in file line by line
+        # read in file block by block
         #
+        # Any existing rows are discarded and the blocks are
+        # appended to the Dataset without any undo information.
         logger.debug("Start reading ASCII file.")
-        cr_split = re.compile(delimiter)
+        ds._array = numpy.zeros((0,), dtype=ds.get_dtype())
         skipcount = 0
-        rownr = 0
-        row = fd.readline()        
-        while len(row) > 0:
+        for block, skipped in self.iter_blocks(fd, split):
+            ds.append_rows(block)
+            skipcount += skipped
 
-            # Split off comments using a regular expression.
-            # This is a more robust solution than the former
-            #  row = row.split('#')[0]
+        # release spare capacity
+        ds.trim()
+        nrows = ds.nrows
 
-            # TODO: Be careful when we have string fields, then a #
-            # TODO: might not be what it looks like -- it might be
-            # TODO: contained in quotes!
-            
-            try:
-                row = cr_trim.match(row).groups()[0]
-            except AttributeError:
-                logger.error("Skipped row: %s" % row)
-                row = fd.readline()
-                continue
-
-            matches = [match for match in cr_split.split(row) if len(match) > 0]
-
-            #logger.debug("MATCHES = %s" % str(matches))
-            if len(matches) == 0:
-                skipcount += 1
-                if skipcount > 100:
-                    # TODO: implement question!
-                    #Signals.emit("ask-for-confirmation", "Warning: More than 100 lines skipped recently. Should we continue with this file?")
-                    skipcount = 0
+        if skipcount > 0:
+            logger.warn("Skipped %d invalid rows." % skipcount)
+        ds.node_info.metadata['_import_skipped'] = skipcount
+        logger.debug("Read %d rows." % nrows)
+
+
+    def iter_blocks(self, fd, split):
+        """
+        Generator that reads the remaining stream `fd` in blocks of
+        roughly `blocksize` bytes.  The function `split` must split
+        a single line into its fields.
+
+        Yields tuples (array, number of skipped rows), see
+        `parse_block`.  After each block the progress is reported,
+        which raises error.UserCancel if the import is cancelled.
+        """
+        lines = fd.readlines(self.blocksize)
+        while len(lines) > 0:
+            yield self.parse_block(lines, split)
+            self.report_progress(fd)
+            lines = fd.readlines(self.blocksize)
+
+        
+    def parse_block(self, lines, split):
+        """
+        Convert the given list of `lines` into an array with the
+        dtype of the Dataset's array.  The function `split` must
+        split a single line into its fields.
+
+        Comments are removed, empty lines are ignored and rows that
+        cannot be converted are skipped.  A field '-' is interpreted
+        as numpy.nan.
+
+        Returns a tuple (array, number of skipped rows).
+        """
+        dtype = self.dataset.get_dtype()
+        names = self.dataset.names
+        ncols = len(names)
+
+        # strip comments and linebreaks; split rows into fields
+        if ''.join(lines).find('#') != -1:
+            lines = [line.split('#',1)[0] for line in lines]
+        rows = [split(line.strip()) for line in lines]
+
+        # Rows with the wrong number of fields are skipped,
+        # empty rows are not counted as skipped.
+        nempty = 0
+        skipped = 0
+        valid_rows = []
+        for row in rows:
+            if len(row) == ncols:
+                valid_rows.append(row)
+            elif len(row) == 0:
+                nempty += 1
             else:
-                try:
-                    # before the string is converted to a number, we
-                    # convert all '-' occurences to numpy.nan
-                    matches = [(m,numpy.nan)[m=='-'] for m in matches]
-                    values = tuple(map(lambda x, t: t(x), matches, types))
-                except ValueError, msg:                    
-                    #logger.warn("Skipped: %s (%s)" % (row,msg))
-                    row = fd.readline()
-                    continue
-                except TypeError, msg:
-                    #logger.warn("Skipped: %s (%s)" % (row,msg))
-                    row = fd.readline()
-                    continue
-                else:
-                    #logger.info("Read %s" % values)
-                    pass
+                skipped += 1
+        rows = valid_rows
+        if len(rows) == 0:
+            return numpy.zeros((0,), dtype=dtype), skipped
+
+        # If all columns are floats, then all fields of the block
+        # are converted with a single call to numpy.fromstring.
+        if not self.only_floats(dtype):
+            return self.parse_rows(rows, skipped)
+
+        fields = []
+        for row in rows:
+            fields.extend(row)
+
+        nanpos = None
+        if '-' in fields:
+            nanpos = [i for i in range(len(fields)) if fields[i] == '-']
+            for i in nanpos:
+                fields[i] = '0'
+
+        # numpy.fromstring stops at the first field that is not a
+        # number, but it accepts trailing garbage in the very last
+        # field (e.g. '4abc').  The sentinel field '0' makes sure
+        # that the last real field is checked as well.
+        try:
+            values = numpy.fromstring(' '.join(fields) + ' 0', dtype=numpy.float64, sep=' ')
+        except ValueError:
+            values = ()
+        if len(values) != len(fields) + 1:
+            # At least one field could not be converted.  Only now
+            # we need to take a closer look at the individual rows.
+            return self.parse_rows(rows, skipped)
+
+        values = values[:-1]
+        if nanpos is not None:
+            values[nanpos] = numpy.nan
+        values.shape = (len(rows), ncols)
+
+        block = numpy.zeros((len(rows),), dtype=dtype)
+        for i in range(ncols):
+            block[names[i]] = values[:,i]
+
+        return block, skipped
+
+
+    def parse_rows(self, rows, skipped=0):
+        """
+        Convert the given `rows` (lists of fields) row by row,
+        using the python types of the Dataset columns.  This is
+        the fallback of `parse_block` for blocks that contain
+        invalid rows or non-float columns.
+        """
+        ds = self.dataset
+        types = [ds.get_column_pytype(name) for name in ds.names]
+
+        values = []
+        for row in rows:
+            try:
+                # before the string is converted to a number, we
+                # convert all '-' occurences to numpy.nan
+                row = [(m,numpy.nan)[m=='-'] for m in row]
+                values.append( tuple(map(lambda x, t: t(x), row, types)) )
+            except (ValueError, TypeError):
+                skipped += 1
+
+        dtype = ds.get_dtype()
+        if len(values) == 0:
+            return numpy.zeros((0,), dtype=dtype), skipped
+        return numpy.array(values, dtype=dtype), skipped
+            
 
-                #logger.debug("Setting row %d to %s" % (rownr, str(values)))
-                ds._array[rownr] = values
-                
-                # Move to next row.
-                # If this is the last row, then the Dataset is extended.
-                if rownr+1 >= ds.nrows:
-                    ds.extend(ds.nrows+self.growth_offset)
+    def only_floats(self, dtype):
+        " Return True if all fields of the given `dtype` are floats. "
+        fields = dtype.fields
+        for name in self.dataset.names:
+            if fields[name][0].kind != 'f':
+                return False
+        return True
 
-                rownr += 1
 
-            row = fd.readline()
 
-        # Resize dataset to real size, i.e. the number
-        # of rows that have actually been read.
-        ds.resize(nrows=rownr)
+#------------------------------------------------------------------------------
+
+def new_splitter(delimiter):
+    """
+    Return a function that splits a single line into a list of
+    fields.  The `delimiter` is a regular expression.  Empty fields
+    are discarded.
+
+    For the most common delimiters (whitespace and single
+    characters) the faster string methods are used instead of
+    the regular expression.
+    """
+    if delimiter in ('[\s\t]*', '[\s\t]+', '\s*', '\s+'):
+        return lambda line: line.split()
+    elif len(delimiter) == 1 and delimiter not in '.^$*+?{}[]\\|()':
+        return lambda line: [m for m in line.split(delimiter) if len(m) > 0]
+    else:
+        cr_split = re.compile(delimiter)
+        return lambda line: [m for m in cr_split.split(line) if len(m) > 0]
 
+    
 
 #------------------------------------------------------------------------------
 globals.importer_registry['ASCII'] = Importer
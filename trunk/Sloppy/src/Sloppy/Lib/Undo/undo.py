@@ -24,17 +24,18 @@
 ##
 ## TODO:
 ##
-## - undo limit
 ## - better exceptions (whatever that might mean)
 ## - UndoInfo.check_info
 
 
-__all__ = ["NullUndo", "UndoInfo", "Journal", "UndoRedo", "UndoList", "UndoError", "FakeUndoInfo"]
+__all__ = ["NullUndo", "UndoInfo", "Journal", "UndoRedo", "UndoList", "UndoError", "FakeUndoInfo",
+           "estimate_size", "format_size"]
 
 import logging
 logger = logging.getLogger('Base.undo')
 
-import UserList
+import UserList, os, tempfile, shutil, cPickle
+import numpy
 
 
 class UndoError(Exception):
@@ -42,7 +43,102 @@ class UndoError(Exception):
 
 
 
+#------------------------------------------------------------------------------
+# Memory accounting
+
+def estimate_size(obj, depth=4):
+    """
+    Return an estimate of the memory in bytes held by `obj`.
+
+    Only data that is owned by the undo information is counted:
+    numpy arrays, strings and objects that declare themselves as
+    `spillable` (e.g. dataset.CompressedArray).  Objects that are
+    shared with the rest of the application, e.g. Datasets in a
+    project, do not count, unless they provide a method
+    `get_undo_size` that says otherwise.  Lists, tuples and dicts
+    are searched up to the given `depth`.
+    """
+    get_undo_size = getattr(obj, 'get_undo_size', None)
+    if get_undo_size is not None:
+        return get_undo_size()
+    if isinstance(obj, numpy.ndarray) or getattr(obj, 'spillable', False) is True:
+        return obj.nbytes
+    if isinstance(obj, basestring):
+        return len(obj)
+    if depth > 0:
+        if isinstance(obj, dict):
+            obj = obj.keys() + obj.values()
+        if isinstance(obj, (list, tuple)):
+            size = 0
+            for item in obj:
+                size += estimate_size(item, depth-1)
+            return size
+    return 0
+
+def format_size(nbytes):
+    " Return the number of bytes in human readable form, e.g. '1.5 MB'. "
+    for unit in ['bytes', 'kB', 'MB']:
+        if nbytes < 1024:
+            if unit == 'bytes':
+                return "%d %s" % (nbytes, unit)
+            return "%.1f %s" % (nbytes, unit)
+        nbytes /= 1024.0
+    return "%.1f GB" % nbytes
+
+
+def can_spill(obj):
+    """
+    Return True if `obj` is plain data that UndoInfo.spill may write
+    to disk: a numpy array, a string or an object with the attribute
+    `spillable` set to True.  Other objects, e.g. Datasets, are
+    shared with the rest of the application and are never spilled.
+    """
+    return isinstance(obj, (numpy.ndarray, basestring)) \
+           or getattr(obj, 'spillable', False) is True
+
+
+class SpilledArgument:
+
+    """
+    Argument of an UndoInfo that has been written to the file
+    `filename` to free memory, see UndoInfo.spill.  `size` is the
+    estimated memory of the argument.  The file is removed together
+    with this object.
+    """
+
+    nbytes = 0
+    
+    def __init__(self, obj, filename):
+        self.filename = filename
+        fd = open(filename, 'wb')
+        try:
+            cPickle.dump(obj, fd, 2)
+        finally:
+            fd.close()
+        self.size = estimate_size(obj)
+
+    def load(self):
+        fd = open(self.filename, 'rb')
+        try:
+            return cPickle.load(fd)
+        finally:
+            fd.close()
+
+    def __del__(self):
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+
+
+#------------------------------------------------------------------------------
+
+
 class UndoInfo:
+
+    # indices of the arguments that could not be spilled
+    unspillable = ()
    
     def __init__(self, func, *args, **kwargs):
         self.func = func
@@ -85,7 +181,7 @@ class UndoInfo:
 
             old_len = len(undolist)
             self.kwargs.update( {'undolist' : undolist} )
-            return_value = self.func(*self.args, **self.kwargs)
+            return_value = self.func(*self.get_args(), **self.kwargs)
             undolist.describe(self.doc)
             if len(undolist) == old_len:
                 raise UndoError("Undo list unchanged: No redo information returned by function %s" % str(self.func))                            
@@ -98,6 +194,61 @@ class UndoInfo:
             return NullUndo()
         else:
             return self
+
+    def get_args(self):
+        " Return the arguments for `func`, loading any spilled arguments. "
+        args = []
+        for arg in self.args:
+            if isinstance(arg, SpilledArgument):
+                arg = arg.load()
+            args.append(arg)
+        return tuple(args)
+
+    def get_size(self):
+        """
+        Return an estimate of the memory in bytes that is held by
+        the arguments, see `estimate_size`.
+        """
+        return estimate_size(self.args) + estimate_size(self.kwargs)
+
+    def get_spilled_size(self):
+        " Return the estimated memory of the arguments written to disk. "
+        size = 0
+        for arg in self.args:
+            if isinstance(arg, SpilledArgument):
+                size += arg.size
+        return size
+
+    def spill(self, directory, min_size=64*1024):
+        """
+        Write all arguments with an estimated size of at least
+        `min_size` bytes to files in the given `directory`, so that
+        they no longer occupy memory.  Only arguments accepted by
+        `can_spill` are written; arguments that fail to be pickled
+        are remembered and not tried again.  Returns the number of
+        bytes freed.
+        """
+        freed = 0
+        args = list(self.args)
+        for i in range(len(args)):
+            if i in self.unspillable or isinstance(args[i], SpilledArgument) \
+                   or not can_spill(args[i]):
+                continue
+            size = estimate_size(args[i])
+            if size < min_size:
+                continue
+            fd, filename = tempfile.mkstemp(prefix='undo-', dir=directory)
+            os.close(fd)
+            try:
+                args[i] = SpilledArgument(args[i], filename)
+            except Exception, msg:
+                logger.debug("Could not spill undo argument: %s" % msg)
+                os.remove(filename)
+                self.unspillable = self.unspillable + (i,)
+                continue
+            freed += size
+        self.args = tuple(args)
+        return freed
         
 
     def dump(self, detailed=False, indent=0):
@@ -204,6 +355,24 @@ class UndoList( UserList.UserList, UndoInfo ):
                 return infos[0]
 
         return UndoList(infos).describe(self.doc)
+
+    def get_size(self):
+        size = 0
+        for info in self.data:
+            size += info.get_size()
+        return size
+
+    def get_spilled_size(self):
+        size = 0
+        for info in self.data:
+            size += info.get_spilled_size()
+        return size
+
+    def spill(self, directory, min_size=64*1024):
+        freed = 0
+        for info in self.data:
+            freed += info.spill(directory, min_size=min_size)
+        return freed
         
 
     def dump(self, detailed=False, indent=0):
@@ -222,10 +391,80 @@ class UndoList( UserList.UserList, UndoInfo ):
 
 class Journal:
 
-    def __init__(self):        
+    """
+    Undo and redo history.
+
+    The history may be limited to `max_entries` undo entries and to
+    `max_size` bytes of memory for all entries together (see
+    UndoInfo.get_size).  If the entries hold more memory and `spill`
+    is True, then the large arguments of the oldest undo entries (and
+    then of the redo entries) are written to temporary files.  If this is not possible or not
+    enough, then the oldest undo entries are dropped.  The latest
+    undo entry is always kept.
+
+    The change_counter is increased whenever an entry is added, undone
+    or redone, so it can be compared with a counter that was stored
+    at an earlier time (see has_changes).
+    """
+    
+    def __init__(self, max_size=None, max_entries=None, spill=False):
         self.__undolist = UndoList()
         self.__redolist = UndoList()
         self.on_change = None
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.spill = spill
+        self.spill_dir = None
+        self.change_counter = 0
+
+    def get_size(self):
+        " Return the estimated memory in bytes held by all entries. "
+        return self.__undolist.get_size() + self.__redolist.get_size()
+
+    def get_usage(self):
+        """
+        Return a dictionary with the number of 'undo' and 'redo'
+        entries, their estimated memory 'size' and the estimated
+        memory of the arguments that have been written to disk
+        ('spilled').
+        """
+        return {'undo': len(self.__undolist),
+                'redo': len(self.__redolist),
+                'size': self.get_size(),
+                'spilled': self.__undolist.get_spilled_size() + self.__redolist.get_spilled_size()}
+    
+    def set_limits(self, max_size=None, max_entries=None):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.limit_size()
+        self.has_changed()
+        
+    def limit_size(self):
+        " Make sure that the Journal stays within `max_entries` and `max_size`. "
+        undolist = self.__undolist
+        if self.max_entries is not None:
+            while len(undolist) > max(self.max_entries, 1):
+                info = undolist.pop(0)
+                logger.debug("Journal: dropped undo entry '%s'" % info.doc)
+            
+        if self.max_size is None:
+            return
+        size = self.get_size()
+        if size <= self.max_size:
+            return
+        
+        if self.spill is True:
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix="sloppy-undo-")
+            for info in undolist.data + self.__redolist.data:
+                size -= info.spill(self.spill_dir)
+                if size <= self.max_size:
+                    return
+                
+        while size > self.max_size and len(undolist) > 1:
+            info = undolist.pop(0)
+            size -= info.get_size()
+            logger.debug("Journal: dropped undo entry '%s'" % info.doc)
 
     def undo(self):       
         if len(self.__undolist) > 0:
@@ -233,6 +472,8 @@ class Journal:
             redolist = UndoList()
             return_value = info.execute(redolist)
             self.__redolist.append(redolist.simplify())
+            self.change_counter += 1
+            self.limit_size()
             self.has_changed()
             return return_value
         
@@ -242,6 +483,8 @@ class Journal:
             undolist = UndoList()
             return_value = info.execute(undolist)
             self.__undolist.append(undolist.simplify())
+            self.change_counter += 1
+            self.limit_size()
             self.has_changed()
             return return_value
 
@@ -249,6 +492,8 @@ class Journal:
         if not isinstance(undoinfo, NullUndo):
             self.__undolist.append(undoinfo.simplify())
             self.__redolist = UndoList()
+            self.change_counter += 1
+            self.limit_size()
             self.has_changed()
 
     def append(self, item):
@@ -268,6 +513,9 @@ class Journal:
         else:
             return "Nothing"
 
+    def has_changes(self, counter):
+        return self.change_counter != counter
+
     def has_changed(self):
         if self.on_change is not None:
             self.on_change(self)
@@ -277,12 +525,24 @@ class Journal:
         self.__redolist = UndoList()
         logger.debug("Undo/Redo cleared")
         self.has_changed()
+
+    def close(self):
+        " Clear the Journal and remove the files of spilled entries. "
+        self.clear()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
         
     def dump(self, detailed=False, indent=0):
         rv = []
         rv.append( "" )
         rv.append( "Dumping Journal object:" )
         rv.append( "" )
+        usage = self.get_usage()
+        rv.append( "%d undo, %d redo entries, %s in memory, %s on disk"
+                   % (usage['undo'], usage['redo'], format_size(usage['size']),
+                      format_size(usage['spilled'])) )
+        rv.append( "" )
         rv.append( "UndoList `undolist`" )
         rv.append( self.__undolist.dump(detailed=detailed, indent=indent+2) )
         rv.append( "UndoList `redolist`" )
@@ -305,7 +565,7 @@ class FakeUndoInfo(UndoInfo):
             #self.kwargs.update( {'undolist' : UndoInfo} )
             self.kwargs.pop('undolist', None)
             logger.debug("FakeUndoInfo: executing %s, %s, %s" % (self.func, self.args, self.kwargs))
-            return_value = self.func(*self.args, **self.kwargs)            
+            return_value = self.func(*self.get_args(), **self.kwargs)            
             undolist.append(NullUndo())
             return return_value
         except:
@@ -0,0 +1,217 @@
+# This file is part of SloppyPlot, a scientific plotting tool.
+# Copyright (C) 2005 Niklas Volbers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# $HeadURL$
+# $Id$
+
+
+"""
+Level-of-detail decimation for lines with many points.
+
+A line with sorted x values is drawn on the screen column by column.
+For each pixel column it is sufficient to draw the first and the
+last point as well as the points with the minimum and the maximum
+y value (M4 aggregation); the rasterized line looks exactly the same.
+The DecimatedLine keeps the full data and draws only these points
+for the current view.  The decimation is repeated whenever the view
+limits or the size of the axes change and only considers the rows
+within the visible range.
+
+If a ColumnPyramid (see Base.dataset) is available for the y values,
+the minimum and maximum of each pixel column are taken from the
+pyramid, so that the decimation takes O(width * log(nrows)) instead
+of O(visible rows).
+"""
+
+
+from matplotlib.lines import Line2D
+
+import numpy
+
+import logging
+logger = logging.getLogger('Backends.decimation')
+
+
+#------------------------------------------------------------------------------
+
+# Lines with fewer points are never decimated.
+MIN_POINTS = 10000
+
+
+
+def m4_indices(x, y, xmin, xmax, width, transform=None, pyramid=None):
+    """
+    Return a sorted array with the indices of the points needed to
+    draw the line (`x`, `y`) in the x-range [`xmin`, `xmax`] on
+    `width` pixel columns.  The values of `x` must be sorted in
+    ascending order and must not contain nan values.
+
+    The point right before and the point right after the visible
+    range are included as well, so that the line continues to the
+    border of the axes.  If given, `transform` is applied to the
+    visible x values, e.g. numpy.log10 for a logarithmic axis.
+    The ColumnPyramid `pyramid` of `y` is only used if there is no
+    `transform`.
+    """
+    n = len(x)
+    width = max(int(width), 1)
+
+    i0 = max(x.searchsorted(xmin) - 1, 0)
+    i1 = min(x.searchsorted(xmax, side='right') + 1, n)
+    if i1 - i0 <= 4 * width:
+        return numpy.arange(i0, i1)
+
+    if pyramid is not None and transform is None:
+        # first row of each pixel column
+        edges = xmin + (xmax - xmin) * numpy.arange(width + 1) / float(width)
+        rows = x.searchsorted(edges)
+        starts = numpy.concatenate(([i0], rows))
+        ends = numpy.concatenate((rows, [i1]))
+        nonempty = starts < ends
+        starts, ends = starts[nonempty], ends[nonempty]
+        lo, hi = pyramid.get_envelope(starts, ends)
+        return numpy.unique(numpy.concatenate((starts, ends - 1, lo, hi)))
+        
+    xs, ys = x[i0:i1], y[i0:i1]
+    if transform is not None:
+        xs, xmin, xmax = transform(xs), transform(xmin), transform(xmax)
+
+    # pixel column of each point; the points outside of the visible
+    # range get columns of their own (-1 and width).
+    scale = width / float(xmax - xmin)
+    columns = numpy.floor((xs - xmin) * scale).astype(int)
+    columns = numpy.clip(columns, -1, width)
+
+    # columns are sorted, because x is sorted
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(columns)) + 1))
+    ends = numpy.concatenate((starts[1:], [len(xs)])) - 1
+    counts = ends - starts + 1
+
+    def first_match(values):
+        # index of the first point in each column whose y value
+        # equals the value given for that column
+        matches = numpy.flatnonzero(ys == numpy.repeat(values, counts))
+        mcolumns = columns[matches]
+        first = numpy.concatenate(([True], mcolumns[1:] != mcolumns[:-1]))
+        return matches[first]
+
+    ymin = numpy.minimum.reduceat(ys, starts)
+    ymax = numpy.maximum.reduceat(ys, starts)
+    indices = numpy.concatenate((starts, ends, first_match(ymin), first_match(ymax)))
+    return numpy.unique(indices) + i0
+
+
+def can_decimate(xdata, ydata, **kwargs):
+    """
+    Return True if decimating the line does not change its
+    appearance, i.e. if it is a solid line without markers and with
+    sorted, finite x values and finite y values.
+    """
+    if len(xdata) < MIN_POINTS:
+        return False
+    if not can_decimate_style(**kwargs):
+        return False
+    if xdata.dtype.kind not in 'iuf' or ydata.dtype.kind not in 'iuf':
+        return False
+    if not (numpy.isfinite(xdata).all() and numpy.isfinite(ydata).all()):
+        return False
+    return bool((xdata[1:] >= xdata[:-1]).all())
+
+
+def can_decimate_style(linestyle=None, marker=None, **kwargs):
+    " Return True if a line with the given style may be decimated. "
+    return linestyle == '-' and marker in (None, 'None', '', ' ')
+
+
+def plot_line(axes, xdata, ydata, get_pyramid=None, **kwargs):
+    """
+    Plot line into `axes` just like axes.plot(xdata, ydata,
+    **kwargs), but return a DecimatedLine if possible.  The optional
+    function `get_pyramid` should return the ColumnPyramid of `ydata`
+    or None; it is only called if the line is decimated.
+    """
+    if can_decimate(xdata, ydata, **kwargs):
+        if get_pyramid is not None:
+            pyramid = get_pyramid()
+        else:
+            pyramid = None
+        line = DecimatedLine(axes, xdata, ydata, pyramid=pyramid, **kwargs)
+        axes.add_line(line)
+        axes.autoscale_view()
+        return line
+
+    l, = axes.plot(xdata, ydata, **kwargs)
+    return l
+
+
+
+class DecimatedLine(Line2D):
+
+    """
+    Line2D that only draws the points needed for the current view of
+    the given `axes`, see m4_indices.  The full data is available
+    as `xfull` and `yfull`, the optional ColumnPyramid of `yfull`
+    as `pyramid`.
+    """
+
+    # number of pixel columns used before the first draw; the data
+    # limits of the line are the same for any number of columns.
+    initial_width = 1024
+
+    def __init__(self, axes, xdata, ydata, pyramid=None, **kwargs):
+        self.xfull, self.yfull = xdata, ydata
+        self.pyramid = pyramid
+        self.decimation_axes = axes
+        self.decimation_key = None
+        indices = m4_indices(xdata, ydata, xdata[0], xdata[-1], self.initial_width,
+                             pyramid=pyramid)
+        Line2D.__init__(self, xdata[indices], ydata[indices], **kwargs)
+
+    def get_view(self):
+        " Return (xmin, xmax, width, scale) for the current view. "
+        axes = self.decimation_axes
+        xmin, xmax = axes.get_xlim()
+        width = axes.bbox.width
+        if callable(width):
+            width = width()
+        return (min(xmin, xmax), max(xmin, xmax), int(width), axes.get_xscale())
+
+    def update_decimation(self):
+        " Decimate the full data again if the view has changed. "
+        key = self.get_view()
+        if key == self.decimation_key:
+            return
+
+        xmin, xmax, width, scale = key
+        x, y = self.xfull, self.yfull
+        if scale == 'log':
+            if xmin <= 0:
+                indices = numpy.arange(len(x))
+            else:
+                indices = m4_indices(x, y, xmin, xmax, width, transform=numpy.log10)
+        elif xmax > xmin:
+            indices = m4_indices(x, y, xmin, xmax, width, pyramid=self.pyramid)
+        else:
+            indices = numpy.arange(len(x))
+
+        self.set_data(x[indices], y[indices])
+        self.decimation_key = key
+
+    def draw(self, renderer):
+        self.update_decimation()
+        Line2D.draw(self, renderer)
+
@@ -41,6 +41,8 @@ from matplotlib.text import Text
 
 from Sloppy.Base import backend, objects, utils, globals
 from Sloppy.Base.dataset import Dataset
+from Sloppy.Base.objects import Layer, Line, Axis, Legend
+from Sloppy.Matplot.decimation import plot_line, DecimatedLine, can_decimate_style, MIN_POINTS
 #------------------------------------------------------------------------------
 
 # Horizontal/vertical lines in mpl:
@@ -99,6 +101,20 @@ linemarker_mappings = \
  }
 
 
+def autoscale_limits(locator, vrange, scale=None):
+    """
+    Return the view limits (vmin, vmax) that the tick `locator`
+    chooses for the data range `vrange`, just like autoscaling
+    would.  Returns (None, None) if the range is a single value or
+    if it cannot be shown on a logarithmic scale; these are left to
+    matplotlib.
+    """
+    vmin, vmax = vrange
+    if vmin == vmax or (scale == 'log' and vmin <= 0):
+        return (None, None)
+    return locator.view_limits(vmin, vmax)
+
+
 
 class Backend( backend.Backend ):
 
@@ -108,15 +124,20 @@ class Backend( backend.Backend ):
         self.axes_to_layer = {}
         self.layers_cache = [] # copy of self.plot.layers
         self.layer_cblists = {}
+        self.child_cblists = {}
 
         self.line_caches = {}
         self.omaps = {}
-        
-        
+
+        # dirty tracking, see redraw_dirty
+        self.dirty = {}
+        self.owners = {}
+
+
     def connect(self):
         logger.debug("Opening matplotlib session.")        
 
-        self.figure = Figure(dpi=100), facecolor="white")  # figsize=(5,4), dpi=100)        
+        self.figure = Figure(dpi=100, facecolor="white")  # figsize=(5,4), dpi=100)        
         self.canvas = FigureCanvas(self.figure)
         self.canvas.show()
 
@@ -166,10 +187,13 @@ class Backend( backend.Backend ):
         self.axes_to_layer.clear()
         self.layers_cache = []
 
-        for cblist in self.layer_cblists.itervalues():
+        for cblist in self.layer_cblists.values() + self.child_cblists.values():
             for cb in cblist:
                 cb.disconnect()
         self.layer_cblists = {}
+        self.child_cblists = {}
+        self.owners = {}
+        self.dirty = {}
         
         j = 1
         for layer in layers:
@@ -181,12 +205,40 @@ class Backend( backend.Backend ):
 
             print "Connecting to update of ", layer
             self.layer_cblists[layer] = \
-              [layer.sig_connect('update', self.on_update_layer),
-               layer.sig_connect('update::labels', self.on_update_labels)
+              [layer.sig_connect('update', self.on_update_object),
+               layer.sig_connect('update::lines', self.on_update_list),
+               layer.sig_connect('update::labels', self.on_update_list),
+               layer.sig_connect('update::axes', self.on_update_list)
                ]
+            self.connect_children(layer)
 
             j += 1
 
+    def connect_children(self, layer):
+        """
+        (Re)connect to the update Signals of the Lines, Axes and the
+        Legend of the `layer` and to those of the line sources.
+        """
+        for cb in self.child_cblists.get(layer, []):
+            cb.disconnect()
+
+        children = list(layer.lines) + layer.axes.values()
+        if layer.legend is not None:
+            children.append(layer.legend)
+
+        cblist = []
+        for obj in children:
+            self.owners[obj] = layer
+            cblist.append(obj.sig_connect('update', self.on_update_object))
+
+        sources = []
+        for line in layer.lines:
+            if line.source is not None and line.source not in sources:
+                sources.append(line.source)
+                cblist.append(line.source.sig_connect('update', self.on_update_dataset))
+
+        self.child_cblists[layer] = cblist
+
 
     def draw(self):
         self.check_connection()
@@ -196,6 +248,8 @@ class Backend( backend.Backend ):
             self.arrange()
 
         self.omaps = {}
+        self.dirty = {}
+        self.redraw_scheduler.cancel()
         for layer in self.plot.layers:            
             self.update_layer(layer)
         self.draw_canvas()
@@ -203,31 +257,226 @@ class Backend( backend.Backend ):
     def draw_canvas(self):
         self.canvas.draw()        
 
+    def redraw(self, force=False):
+        " Redraw all changes since the last redraw, see redraw_dirty. "
+        if force is True:
+            self.draw()
+        else:
+            self.redraw_dirty()
+
 
     #----------------------------------------------------------------------
-    # Layer
+    # Dirty Tracking
     #
+    # Instead of updating the whole layer on every change, changed
+    # objects are marked as dirty together with the changed keys
+    # passed by their update Signals.  redraw_dirty then updates
+    # only the matplotlib objects affected by these changes and
+    # draws the canvas once.
+
+    # Line keys that require to plot the line again.
+    LINE_DATA_KEYS = ['source', 'cx', 'cy', 'cxerr', 'cyerr',
+                      'row_first', 'row_last', 'visible']
+
+    # Line keys that only change the style of the line.
+    LINE_STYLE_KEYS = ['style', 'marker', 'width', 'color',
+                       'marker_color', 'marker_size']
+
+    # Layer keys that change the style of all lines.
+    LAYER_GROUP_KEYS = ['group_style', 'group_marker', 'group_width',
+                        'group_color', 'group_marker_color']
+
+    # Layer keys that can be updated without updating the whole layer.
+    LAYER_KEYS = ['title', 'grid', 'legend', 'labels', 'axes', 'lines'] \
+                 + LAYER_GROUP_KEYS
     
-    def on_update_layer(self, sender, updateinfo={}):
-        # updateinfo is ignored
-        self.update_layer(sender)
-        self.canvas.draw()
+    def on_update_object(self, sender, keys):
+        self.mark_dirty(sender, keys)
+        self.queue_redraw()
+
+    def on_update_list(self, sender, key, updateinfo):
+        self.mark_dirty(sender, [key])
+        self.queue_redraw()
+
+    def on_update_dataset(self, sender):
+        for layer in self.plot.layers:
+            for line in layer.lines:
+                if line.source is sender:
+                    self.mark_dirty(line, ['source'])
+        self.queue_redraw()
+
+    def mark_dirty(self, obj, keys):
+        dirty_keys = self.dirty.setdefault(obj, [])
+        for key in keys:
+            if key not in dirty_keys:
+                dirty_keys.append(key)
+
+    def redraw_dirty(self):
+        """
+        Update the matplotlib objects of all dirty objects and draw
+        the canvas once.
+        """
+        if len(self.dirty) == 0:
+            return
+        dirty, self.dirty = self.dirty, {}
+
+        # collect the changes for each layer
+        changes = {}
+        for obj, keys in dirty.iteritems():
+            if isinstance(obj, Layer):
+                layer = obj
+            else:
+                layer = self.owners.get(obj, None)
+            if layer not in self.layer_to_axes:
+                continue
+
+            ch = changes.setdefault(layer, LayerChanges())
+            if isinstance(obj, Layer):
+                ch.keys.extend(keys)
+            elif isinstance(obj, Line):
+                for key in keys:
+                    if key in self.LINE_DATA_KEYS:
+                        ch.data.append(obj)
+                    elif key in self.LINE_STYLE_KEYS:
+                        ch.style.append(obj)
+                    elif key == 'label':
+                        ch.labels.append(obj)
+                if 'source' in keys:
+                    ch.reconnect = True
+                ch.legend = True
+            elif isinstance(obj, Axis):
+                ch.axes = True
+            elif isinstance(obj, Legend):
+                ch.legend = True
+
+        for layer, ch in changes.iteritems():
+            self.update_layer_changes(layer, ch)
+
+        self.draw_canvas()
+
+    def update_layer_changes(self, layer, ch):
+        " Apply the LayerChanges `ch` collected by redraw_dirty. "
+        axes = self.layer_to_axes[layer]
+        omap = self.omaps.setdefault(layer, {})
+        keys = ch.keys
+
+        if 'lines' in keys or 'axes' in keys or 'legend' in keys:
+            ch.reconnect = True
+        if ch.reconnect is True:
+            self.connect_children(layer)
+
+        # any other key requires a complete update
+        for key in keys:
+            if key not in self.LAYER_KEYS:
+                self.update_layer(layer)
+                return
+
+        if 'lines' in keys:
+            # remove lines that have been removed from the layer
+            for obj in omap.keys():
+                if isinstance(obj, Line) and obj not in layer.lines:
+                    artist = omap.pop(obj)
+                    if artist in axes.lines:
+                        axes.lines.remove(artist)
+            # plot new lines; the style of the other lines might
+            # change, because it depends on the position of the line
+            for line in layer.lines:
+                if omap.has_key(line):
+                    ch.style.append(line)
+                else:
+                    ch.data.append(line)
+            ch.legend = True
+
+        for key in self.LAYER_GROUP_KEYS:
+            if key in keys:
+                ch.style.extend(layer.lines)
+                ch.legend = True
+                break
+
+        done = []
+        for line in ch.data:
+            if line in layer.lines and line not in done:
+                self.update_line(line, layer, axes=axes)
+                done.append(line)
+        for line in ch.style:
+            if line in layer.lines and line not in done:
+                self.restyle_line(line, layer, axes=axes)
+                done.append(line)
+        for line in ch.labels:
+            artist = omap.get(line, None)
+            if artist is not None and line not in done:
+                artist.set_label(self.get_line_label(line, dataset=line.source, cy=line.cy))
+        self.update_line_cache(layer)
+
+        # Plotting a line autoscales the axes, so the limits need to
+        # be set again whenever lines have been plotted.
+        if 'axes' in keys or 'lines' in keys or ch.axes is True or len(ch.data) > 0:
+            self.update_axes(layer, axes=axes)
+
+        if layer.visible is False:
+            return
+
+        if 'title' in keys:
+            axes.set_title(layer.title or '')
+        if 'grid' in keys:
+            axes.grid(layer.grid)
+        if 'labels' in keys:
+            self.update_labels(layer)
+        if 'legend' in keys or ch.legend is True:
+            self.update_legend(layer)
+
+            
+    #----------------------------------------------------------------------
+    # Layer
+    #
     
     def update_layer(self, layer, updateinfo={}):
         # updateinfo is ignored
 
         self.omaps[layer] = {}
-        self.line_caches[layer] = {}
 
         axes = self.layer_to_axes[layer]        
         axes.lines = []
-        line_cache = self.line_caches[layer] = []        
 
         #:layer.lines:OK
         for line in layer.lines:
             self.update_line(line, layer, axes=axes)
+        self.update_line_cache(layer)
 
         #:layer.axes
+        self.update_axes(layer, axes=axes)
+            
+        #:layer.visible
+        if layer.visible is False:
+            return
+
+        # TODO
+        #:layer.title
+        title = layer.title
+        if title is not None:
+            axes.set_title(title)
+
+        #:layer.grid
+        axes.grid(layer.grid)
+                    
+        #:layer.legend:OK
+        self.update_legend(layer)
+
+        #:layer.labels:OK
+        axes.texts = []
+        for label in layer.labels:
+            self.update_textlabel(label, layer)
+
+    def update_axes(self, layer, axes=None):
+        axes = axes or self.layer_to_axes[layer]
+
+        # Limits that are not set are determined by autoscaling.
+        # The data limits are taken from the dataset summaries,
+        # which is cheaper than the data of the plotted lines and
+        # which is not affected by the line decimation.
+        axes.autoscale_view()
+        limits = self.get_data_limits(layer)
+        
         for (key, axis) in layer.axes.iteritems():
             #:axis.label
             #:axis.scale
@@ -241,11 +490,13 @@ class Backend( backend.Backend ):
             #logger.debug("start = %s; end = %s" % (start, end))
             
             if key == 'x':
+                axis_obj = axes.xaxis
                 set_label = axes.set_xlabel
                 set_scale = axes.set_xscale
                 set_start = (lambda l: axes.set_xlim(xmin=l))
                 set_end = (lambda l: axes.set_xlim(xmax=l))
             elif key == 'y':
+                axis_obj = axes.yaxis
                 set_label = axes.set_ylabel
                 set_scale = axes.set_yscale
                 set_start = (lambda l: axes.set_ylim(ymin=l))
@@ -255,29 +506,15 @@ class Backend( backend.Backend ):
 
             if label is not None: set_label(label)
             if scale is not None: set_scale(scale)
+
+            if (start is None or end is None) and limits.get(key) is not None:
+                vmin, vmax = autoscale_limits(axis_obj.get_major_locator(),
+                                              limits[key], scale)
+                if start is None: start = vmin
+                if end is None: end = vmax
+                
             if start is not None: set_start(start)
             if end is not None: set_end(end)
-            
-        #:layer.visible
-        if layer.visible is False:
-            return
-
-        # TODO
-        #:layer.title
-        title = layer.title
-        if title is not None:
-            axes.set_title(title)
-
-        #:layer.grid
-        axes.grid(layer.grid)
-                    
-        #:layer.legend:OK
-        self.update_legend(layer)
-
-        #:layer.labels:OK
-        axes.texts = []
-        for label in layer.labels:
-            self.update_textlabel(label, layer)
 
         
     #----------------------------------------------------------------------
@@ -289,16 +526,19 @@ class Backend( backend.Backend ):
         
         axes = axes or self.layer_to_axes[layer]
         omap = self.omaps[layer]
-        line_cache = self.line_caches[layer]
-
-        data_to_plot = []
 
+        # If the line has been plotted before, the new matplotlib
+        # line replaces the old one at the same position.
+        old = omap.get(line, None)
+        if old is not None and old in axes.lines:
+            position = axes.lines.index(old)
+            axes.lines.remove(old)
+        else:
+            position = None
+        omap[line] = None
+        
         #:line.visible
         if line.visible is False:
-            if line in axes.lines:
-                axes.lines.remove(line)
-                line_cache.remove(line)
-            omap[line] = None                    
             return
 
         ds = self.get_line_source(line)
@@ -307,9 +547,9 @@ class Backend( backend.Backend ):
             xdata, ydata = self.get_dataset_data(ds, cx, cy)
         except backend.BackendError, msg:            
             logger.error(msg)
-            omap[line] = None
             return
             
+        line_index = layer.lines.index(line)
 
         #:line.row_first
         #:line.row_last
@@ -317,11 +557,53 @@ class Backend( backend.Backend ):
         try:
             xdata = self.limit_data(xdata, start, end)
             ydata = self.limit_data(ydata, start, end)
-        except BackendError, msg:
+        except backend.BackendError, msg:
             logger.error("Error when plotting line #%d: %s" % (line_index, msg))
-            omap[line] = None
             return
 
+        #--- PLOT LINE ---
+        try:
+            # Long lines are decimated to the points that are
+            # visible on the screen, see Matplot.decimation.
+            l = plot_line( axes, xdata, ydata,
+                           get_pyramid=lambda: self.get_column_pyramid(ds, cy, start, end),
+                           **self.line_kwargs(line, layer))
+        except Exception, msg:
+            logger.error("Error when plotting line %d: %s" % (line_index, msg))
+            return
+
+        if position is not None:
+            axes.lines.remove(l)
+            axes.lines.insert(position, l)
+        omap[line] = l        
+
+        label = self.get_line_label(line, dataset=ds, cy=cy)
+        if label is not None:
+            l.set_label(label)
+
+    def restyle_line(self, line, layer, axes=None):
+        " Update the style of the line without touching its data. "
+        axes = axes or self.layer_to_axes[layer]
+        l = self.omaps[layer].get(line, None)
+        if l is None:
+            self.update_line(line, layer, axes=axes)
+            return
+
+        # The line needs to be plotted again if the new style
+        # decides whether the line may be decimated or not.
+        kwargs = self.line_kwargs(line, layer)
+        decimated = isinstance(l, DecimatedLine)
+        if decimated is True:
+            replot = not can_decimate_style(**kwargs)
+        else:
+            replot = can_decimate_style(**kwargs) and len(l.get_xdata()) >= MIN_POINTS
+        if replot is True:
+            self.update_line(line, layer, axes=axes)
+        else:
+            l.update(kwargs)
+
+    def line_kwargs(self, line, layer):
+        " Return keyword arguments for the style of the matplotlib line. "
         line_index = layer.lines.index(line)
 
         #:line.style
@@ -353,36 +635,27 @@ class Backend( backend.Backend ):
 
         #:line.marker_siize
         marker_size = line.marker_size or 1
-        
-        #--- PLOT LINE ---
-        try:
-            l, = axes.plot( xdata, ydata,
-                            linewidth=width,
-                            linestyle=style,
-                            marker=marker,
-                            color=color,
-                            markerfacecolor=marker_color,
-                            markeredgecolor=marker_color,
-                            markersize=marker_size)
-        except Exception, msg:
-            logger.error("Error when plotting line %d: %s" % (line_index, msg))
-            omap[line] = None
-            return
 
-        line_cache.append(l)
-        omap[line] = l        
+        return {'linewidth': width,
+                'linestyle': style,
+                'marker': marker,
+                'color': color,
+                'markerfacecolor': marker_color,
+                'markeredgecolor': marker_color,
+                'markersize': marker_size}
 
-        label = self.get_line_label(line, dataset=ds, cy=cy)
-        if label is not None:
-            l.set_label(label)
+    def update_line_cache(self, layer):
+        " Update the list of matplotlib lines in the order of layer.lines. "
+        omap = self.omaps[layer]
+        self.line_caches[layer] = [omap[line] for line in layer.lines
+                                   if omap.get(line, None) is not None]
 
     
     #----------------------------------------------------------------------
     # TextLabel
     #
 
-    def on_update_labels(self, layer, updateinfo={}):
-        # updateinfo is ignored
+    def update_labels(self, layer):
 
         # clear existing labels and their corresponding mappings
         axes = self.layer_to_axes[layer]        
@@ -396,8 +669,6 @@ class Backend( backend.Backend ):
         # create new labels
         for label in layer.labels:            
             self.update_textlabel(label, layer)
-
-        self.canvas.draw()        
     
     def update_textlabel(self, label, layer, axes=None, updateinfo={}):
         # updateinfo is ignored
@@ -499,6 +770,28 @@ class Backend( backend.Backend ):
 
 
 
+#------------------------------------------------------------------------------
+
+class LayerChanges:
+
+    """
+    Changes of a single Layer, as collected by Backend.redraw_dirty:
+    the changed layer `keys`, the lines whose `data`, `style` or
+    `labels` changed and whether the `axes` or the `legend` need to
+    be updated or the Signals need to be reconnected.
+    """
+    
+    def __init__(self):
+        self.keys = []
+        self.data = []
+        self.style = []
+        self.labels = []
+        self.axes = False
+        self.legend = False
+        self.reconnect = False
+
+        
+
 #------------------------------------------------------------------------------
 
 
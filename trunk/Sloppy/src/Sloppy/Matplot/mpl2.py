@@ -20,6 +20,8 @@ from Sloppy.Base.backend import BackendError
 from Sloppy.Base.objects import SPObject, Line
 from Sloppy.Base.dataset import Dataset
 from Sloppy.Lib.Check import Instance, Undefined, Dict, AnyValue
+from Sloppy.Matplot.decimation import plot_line
+from Sloppy.Matplot.picking import Picker
 
 import logging
 logger = logging.getLogger('Backends.mpl2')
@@ -243,14 +245,17 @@ class LinePainter(Painter):
             
         # plot line!
         try:
-            l, = axes.plot( xdata, ydata,
-                            linewidth=width,
-                            linestyle=style,
-                            marker=marker,
-                            color=color,
-                            markerfacecolor=marker_color,
-                            markeredgecolor=marker_color,
-                            markersize=marker_size)
+            # Long lines are decimated to the points that are
+            # visible on the screen, see Matplot.decimation.
+            l = plot_line( axes, xdata, ydata,
+                           get_pyramid=lambda: backend.get_column_pyramid(ds, cy, start, end),
+                           linewidth=width,
+                           linestyle=style,
+                           marker=marker,
+                           color=color,
+                           markerfacecolor=marker_color,
+                           markeredgecolor=marker_color,
+                           markersize=marker_size)
             layer_painter.line_cache[line] = l
         except Exception, msg:
             raise
@@ -445,8 +450,8 @@ class Backend(backend.Backend):
     def init(self):
         self.painters = {} # == layers
 
-        self._redraw = False
-        self._block_redraw = 0
+        # nearest-point search, shared by all selectors
+        self.picker = Picker()
         
         self.sig_register('redraw')
         self.sig_connect('redraw', lambda sender: self.redraw())
@@ -481,7 +486,7 @@ class Backend(backend.Backend):
             painter = self.get_painter(layer, LayerPainter)
             painter.paint()
         self.canvas.draw()
-        self._redraw = False        
+        self.redraw_scheduler.cancel()
 
 
     def on_update_layers(self, sender, key, updateinfo):
@@ -500,29 +505,17 @@ class Backend(backend.Backend):
 
 
 
-    def block_redraw(self, count=1):
-        self._block_redraw += count
-
-    def unblock_redraw(self, count=1):
-        self._block_redraw = max(0, self._block_redraw-count)
-        self.redraw()
-        
-    def queue_redraw(self):
-        self._redraw = True
-        self.redraw()
-
+    # Redraw requests (queue_redraw) are collected by the
+    # redraw_scheduler, see Base.backend.RedrawScheduler.
+    
     def redraw(self, force=False):
         """ redraw, unlike draw, only redisplays the existing canvas. """
         if force is True:
             logger.debug("Complete Redraw.")
             self.draw()
-            self._redraw = False
-            self._block_redraw = 0            
-        elif (self._redraw is True and self._block_redraw==0):
+        elif self.canvas is not None:
             logger.debug("Redraw.")
             self.canvas.draw()
-            self._redraw = False
-            self._block_redraw = 0
         
         
 #------------------------------------------------------------------------------    
@@ -0,0 +1,241 @@
+# This file is part of SloppyPlot, a scientific plotting tool.
+# Copyright (C) 2005 Niklas Volbers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# $HeadURL$
+# $Id$
+
+
+"""
+Finding the data point of a line that is nearest to a given position
+on the screen.
+
+The data of a line is transformed to display coordinates as a whole
+and the points are sorted into a grid of square cells (PointIndex).
+A query only looks at the cells around the given position.  The
+Picker keeps one PointIndex per line and builds it again whenever
+the view of the axes or the data of the line changes.
+"""
+
+
+import weakref
+
+import numpy
+
+import logging
+logger = logging.getLogger('Backends.picking')
+
+
+#------------------------------------------------------------------------------
+
+def get_line_data(line):
+    """
+    Return the complete data (xdata, ydata) of the matplotlib `line`
+    as arrays.  For a DecimatedLine this is the full data and not
+    only the points that are currently drawn.
+    """
+    if hasattr(line, 'xfull'):
+        return line.xfull, line.yfull
+    return numpy.asarray(line.get_xdata()), numpy.asarray(line.get_ydata())
+
+
+def transform_points(trans, xdata, ydata):
+    " Transform the data arrays to display coordinates at once. "
+    px, py = trans.numerix_x_y(xdata, ydata)
+    return numpy.asarray(px, dtype=float), numpy.asarray(py, dtype=float)
+
+
+def nearest_point(px, py, x, y):
+    """
+    Return (index, squared distance) of the point (px[i], py[i]) that
+    is nearest to (x, y) or (None, None) if there are no finite points.
+    """
+    d2 = (px - x)**2 + (py - y)**2
+    d2 = numpy.where(numpy.isnan(d2), numpy.inf, d2)
+    if len(d2) == 0:
+        return None, None
+    index = int(d2.argmin())
+    if not numpy.isfinite(d2[index]):
+        return None, None
+    return index, float(d2[index])
+
+
+
+class PointIndex:
+
+    """
+    Grid of square cells in display coordinates.  The indices of the
+    points are sorted by the number of their cell, so that the points
+    of a range of cells can be looked up with searchsorted.
+    """
+
+    # maximum number of rings of cells that are searched before
+    # all points are compared (e.g. if the position is far away
+    # from all points).
+    max_rings = 32
+
+    def __init__(self, px, py, cellsize=16):
+        self.px, self.py = px, py
+
+        valid = numpy.flatnonzero(numpy.isfinite(px) & numpy.isfinite(py))
+        self.nvalid = len(valid)
+        if self.nvalid == 0:
+            return
+
+        vx, vy = px[valid], py[valid]
+        self.x0, self.y0 = vx.min(), vy.min()
+
+        # avoid an excessive number of cells for points that are
+        # spread far beyond the visible area
+        span = max(vx.max() - self.x0, vy.max() - self.y0)
+        self.cellsize = max(float(cellsize), span / 2.0**20)
+
+        cx = ((vx - self.x0) / self.cellsize).astype(numpy.int64)
+        cy = ((vy - self.y0) / self.cellsize).astype(numpy.int64)
+        self.ncx, self.ncy = int(cx.max()) + 1, int(cy.max()) + 1
+
+        keys = cy * self.ncx + cx
+        order = keys.argsort(kind='mergesort')
+        self.keys = keys[order]
+        self.order = valid[order]
+
+    def get_cell(self, x, y):
+        return (int(numpy.floor((x - self.x0) / self.cellsize)),
+                int(numpy.floor((y - self.y0) / self.cellsize)))
+
+    def get_ring(self, cx, cy, r):
+        """ Return the indices of the points in all cells that have
+        the (chessboard) distance `r` from the cell (cx, cy). """
+        if r == 0:
+            xs, ys = numpy.array([cx]), numpy.array([cy])
+        else:
+            side = numpy.arange(-r, r+1)
+            inner = numpy.arange(-r+1, r)
+            xs = numpy.concatenate((side, side, [-r]*len(inner), [r]*len(inner))) + cx
+            ys = numpy.concatenate(([-r]*len(side), [r]*len(side), inner, inner)) + cy
+
+        inside = (xs >= 0) & (xs < self.ncx) & (ys >= 0) & (ys < self.ncy)
+        keys = ys[inside] * self.ncx + xs[inside]
+        starts = self.keys.searchsorted(keys)
+        ends = self.keys.searchsorted(keys, side='right')
+
+        counts = ends - starts
+        nonempty = counts > 0
+        starts, counts = starts[nonempty], counts[nonempty]
+        if len(starts) == 0:
+            return numpy.zeros((0,), dtype=int)
+
+        # concatenate the ranges [start, start+count)
+        offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts)
+        return self.order[numpy.arange(counts.sum()) + offsets]
+
+    def nearest(self, x, y, maxdist=None):
+        """
+        Return (index, squared distance) of the point nearest to the
+        display position (x, y) or (None, None) if there is no point
+        (within the distance `maxdist`).
+        """
+        if self.nvalid == 0:
+            return None, None
+
+        cx, cy = self.get_cell(x, y)
+
+        # first ring that overlaps the grid
+        r = max(0, -cx, cx - self.ncx + 1, -cy, cy - self.ncy + 1)
+        rmax = max(cx, self.ncx - 1 - cx, cy, self.ncy - 1 - cy)
+
+        best, best_d2 = None, None
+        for ring in range(r, min(r + self.max_rings, rmax + 1)):
+            if maxdist is not None and (ring - 1) * self.cellsize > maxdist:
+                break
+
+            candidates = self.get_ring(cx, cy, ring)
+            if len(candidates) > 0:
+                i, d2 = nearest_point(self.px[candidates], self.py[candidates], x, y)
+                if best_d2 is None or d2 < best_d2:
+                    best, best_d2 = int(candidates[i]), d2
+
+            # all points in the following rings are at least
+            # ring * cellsize away from (x, y)
+            if best_d2 is not None and best_d2 <= (ring * self.cellsize)**2:
+                break
+        else:
+            if rmax + 1 > r + self.max_rings:
+                best, best_d2 = nearest_point(self.px, self.py, x, y)
+
+        if best is not None and maxdist is not None and best_d2 > maxdist**2:
+            return None, None
+        return best, best_d2
+
+
+
+class Picker:
+
+    """
+    Nearest-point search for matplotlib lines.  The PointIndex of
+    each line is kept until the view of its axes or its data changes.
+    """
+
+    def __init__(self, cellsize=16):
+        self.cellsize = cellsize
+        self.indices = weakref.WeakKeyDictionary()
+
+    def get_view_key(self, line):
+        axes = line.get_axes()
+        xdata, ydata = get_line_data(line)
+        if axes is not None:
+            view = (axes.get_xlim(), axes.get_ylim(), tuple(axes.bbox.get_bounds()),
+                    axes.get_xscale(), axes.get_yscale())
+        else:
+            view = None
+        return (view, id(xdata), id(ydata), len(xdata))
+
+    def get_index(self, line):
+        " Return the PointIndex of `line`, building it if necessary. "
+        key = self.get_view_key(line)
+        if self.indices.has_key(line):
+            index_key, index = self.indices[line]
+            if index_key == key:
+                return index
+
+        xdata, ydata = get_line_data(line)
+        px, py = transform_points(line.get_transform(), xdata, ydata)
+        index = PointIndex(px, py, cellsize=self.cellsize)
+        self.indices[line] = (key, index)
+        return index
+
+    def nearest(self, line, x, y, maxdist=None):
+        """
+        Return (index, squared distance) of the data point of `line`
+        nearest to the display position (x, y), see PointIndex.nearest.
+        """
+        return self.get_index(line).nearest(x, y, maxdist=maxdist)
+
+    def pick(self, lines, x, y, maxdist=None):
+        """
+        Return (line, index, squared distance) of the data point that
+        is nearest to the display position (x, y) among all `lines` or
+        (None, None, None).
+        """
+        match = (None, None, None)
+        for line in lines:
+            index, d2 = self.nearest(line, x, y, maxdist=maxdist)
+            if index is not None and (match[0] is None or d2 < match[2]):
+                match = (line, index, d2)
+        return match
+
+    def clear(self):
+        self.indices.clear()
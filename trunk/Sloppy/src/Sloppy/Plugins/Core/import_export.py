@@ -1,15 +1,29 @@
 
 from Sloppy.Lib.Undo import UndoList, ulist, NullUndo
+from Sloppy.Lib.Check import values_as_dict
+from Sloppy.Base.dataset import Table
 from Sloppy.Base import globals, dataio, utils, error
 import os.path
 
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
 
+import logging
+logger = logging.getLogger('Plugin.Core')
 
-def import_datasets(project, filenames, template, undolist=None):
+
+
+def import_datasets(project, filenames, template, undolist=None, workers=1):
     """
     Import datasets from a list of given `filenames` into the
     given `project`. The given importer `template` can either
     be a template name (a string) or an ImporterTemplate object.    
+
+    If `workers` is larger than 1, then the files are parsed by
+    that many worker processes in parallel.  A value of 0 means
+    one worker process per CPU.
     """
     
     app = globals.app
@@ -20,33 +34,19 @@ def import_datasets(project, filenames, template, undolist=None):
     if isinstance(template, basestring): # template key
         template = globals.import_templates[template]
 
+    if workers == 0 and multiprocessing is not None:
+        workers = multiprocessing.cpu_count()
+        
     # To ensure a proper undo, the Datasets are imported one by one
     # to a temporary dict.  When finished, they are added as a whole.
-    new_datasets = []
-
-    n = 0.0
-    N = len(filenames)
-    app.progress(0.0)        
-    for filename in filenames:
-        app.status_msg("Importing %s" % filename)                       
-        try:
-            importer = template.new_instance()                
-            ds = importer.read_dataset_from_file(filename)
-        except dataio.ImportError, msg:
-            app.error_msg(msg)
-            continue
-        except error.UserCancel:
-            app.error_msg("Import aborted by user")
-            continue
-
-        root, ext = os.path.splitext(os.path.basename(filename))
-        ds.key = utils.encode_as_key(root)
-
-        new_datasets.append(ds)
-        n+=1
-        app.progress(n/N)
-
-    app.progress(1.0)
+    if workers > 1 and len(filenames) > 1:
+        if multiprocessing is None:
+            logger.warn("Parallel import requires the multiprocessing module.")
+            new_datasets = _import_serial(app, filenames, template)
+        else:
+            new_datasets = _import_parallel(app, filenames, template, workers)
+    else:
+        new_datasets = _import_serial(app, filenames, template)
 
     if len(new_datasets) > 0:
         ul = UndoList()
@@ -64,3 +64,178 @@ def import_datasets(project, filenames, template, undolist=None):
 
     app.progress(-1)
     #app.status_message(msg)
+
+
+
+def _import_serial(app, filenames, template):
+    " Import the given files one after another. "
+    new_datasets = []
+
+    # The 'cancel-user-action' of the application (e.g. the cancel
+    # button of the main window) cancels the running importer.
+    current = {'importer': None, 'cancelled': False}
+    def on_cancel(sender):
+        current['cancelled'] = True
+        if current['importer'] is not None:
+            current['importer'].cancel()
+
+    n = 0.0
+    N = len(filenames)
+    begin_cancellable(app, on_cancel)
+    try:
+        app.progress(0.0)        
+        for filename in filenames:
+            if current['cancelled'] is True:
+                app.error_msg("Import aborted by user")
+                break
+
+            app.status_msg("Importing %s" % filename)                       
+            try:
+                try:
+                    importer = template.new_instance()
+                    current['importer'] = importer
+                    # the progress of the current file is reported as
+                    # a fraction of the progress of the whole import
+                    importer.progress_indicator = \
+                        lambda fraction, n=n: app.progress((n+fraction)/N)
+                    ds = importer.read_dataset_from_file(filename)
+                except dataio.ImportError, msg:
+                    app.error_msg(msg)
+                    continue
+                except error.UserCancel:
+                    app.error_msg("Import aborted by user")
+                    break
+            finally:
+                current['importer'] = None
+
+            ds.key = dataset_key(filename)
+
+            new_datasets.append(ds)
+            n+=1
+            app.progress(n/N)
+    finally:
+        end_cancellable(app, on_cancel)
+
+    app.progress(1.0)
+    return new_datasets
+
+
+
+def _import_parallel(app, filenames, template, workers):
+    """
+    Import the given files using a pool of worker processes.  The
+    workers only return the arrays and the meta data, the Datasets
+    are then created in this process in the original order.  Files
+    that cannot be imported are reported but do not abort the import.
+
+    The progress is reported whenever a file is finished.  If the
+    import is cancelled, the pool is terminated and only the files
+    that have been finished so far are imported.
+    """
+    errors = []
+
+    jobs = [(template.importer_key, template.defaults.data, filename)
+            for filename in filenames]
+
+    current = {'cancelled': False}
+    def on_cancel(sender):
+        current['cancelled'] = True
+
+    n = 0.0
+    N = len(filenames)
+    results = [None] * N
+    begin_cancellable(app, on_cancel)
+    app.progress(0.0)
+    app.status_msg("Importing %d files using %d processes" % (N, workers))
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for (index, result) in pool.imap_unordered(_import_indexed_file, enumerate(jobs)):
+            results[index] = result
+            n+=1
+            app.progress(n/N)
+            if current['cancelled'] is True:
+                pool.terminate()
+                app.error_msg("Import aborted by user")
+                break
+    finally:
+        pool.close()
+        pool.join()
+        end_cancellable(app, on_cancel)
+
+    new_datasets = []
+    for result in results:
+        if result is None:
+            continue
+        filename, data, msg = result
+        if data is None:
+            errors.append("%s: %s" % (filename, msg))
+            continue
+        array, infos, metadata = data
+        for name, values in infos.iteritems():
+            infos[name] = Table.Info(**values)
+        ds = Table(array, infos)
+        ds.node_info.metadata.update(metadata)
+        ds.key = dataset_key(filename)
+        new_datasets.append(ds)
+
+    if len(errors) > 0:
+        app.error_msg("%d of %d files could not be imported:\n\n%s"
+                      % (len(errors), N, "\n".join(errors)))
+
+    app.progress(1.0)
+    return new_datasets
+
+
+def _import_indexed_file(item):
+    " Worker function that returns the `_import_file` result with its index. "
+    index, job = item
+    return (index, _import_file(job))
+
+
+def _import_file(job):
+    """
+    Worker function for the parallel import.  The importer is
+    created from the given importer key and defaults in the same
+    way as IOTemplate.new_instance does it.
+
+    Returns a tuple (filename, result, error message), where
+    result is either None or a tuple (array, infos, metadata)
+    that contains only plain python objects and numpy arrays.
+    """
+    importer_key, defaults, filename = job
+    try:
+        importer = globals.importer_registry[importer_key](**defaults)
+        ds = importer.read_dataset_from_file(filename)
+    except Exception, msg:
+        return (filename, None, str(msg))
+
+    infos = {}
+    for name, info in ds._infos.iteritems():
+        infos[name] = values_as_dict(info, info._checks.keys())
+    metadata = dict(ds.node_info.metadata.iteritems())
+    
+    return (filename, (ds._array, infos, metadata), None)
+
+
+def begin_cancellable(app, on_cancel):
+    """
+    Connect `on_cancel` to the 'cancel-user-action' of the given
+    `app`, if the application provides such a signal, and announce
+    the beginning of a user action that can be cancelled.
+    """
+    if app.signals.has_key('cancel-user-action'):
+        app.sig_connect('cancel-user-action', on_cancel)
+        app.sig_emit('begin-user-action')
+
+def end_cancellable(app, on_cancel):
+    " Counterpart of `begin_cancellable`. "
+    if app.signals.has_key('cancel-user-action'):
+        app.sig_disconnect('cancel-user-action', on_cancel)
+        app.sig_emit('end-user-action')
+
+
+def dataset_key(filename):
+    " Return Dataset key derived from the given `filename`. "
+    root, ext = os.path.splitext(os.path.basename(filename))
+    return utils.encode_as_key(root)